@@ -31,9 +31,15 @@ important differences:
       reachable from the object.
     - They cache the method used to access a certain attribute and reuse
       it the next time the value is retrieved.
+
+When the same attribute is fetched from many objects, eg to display
+a column of a list, compile_getter returns a function specialized for
+an attribute path which is faster than calling kgetattr.
+kgetattr_many and kgetattr_rows fetch a whole column at once.
 """
 
-import string
+import array
+from operator import attrgetter
 import types
 
 from kiwi.log import Logger
@@ -70,34 +76,38 @@ def get_default_setter(model, attr_name, cache):
     else:
         return (model, attr_name)
 
-# The _*_cache dictionaries cache the objects, attributes and callables
-# (called `accessor tuples' here) we retrieve values from. If possible,
-# we use weakrefs to avoid holding hard references to objects, allowing
-# them to be garbage collected.  Certain objects (ZODB.Persistent for
-# one) cannot be weakref()ed and *will* leak - be sure to call
-# clear_attr_cache() if you need them released.
+# The _*_cache dictionaries cache how an attribute is accessed on the
+# instances of a class (called `accessor tuples' here), since choosing
+# between a plain attribute and a get_foo/set_foo method only depends
+# on the class. No references to the objects themselves are kept, the
+# size of the caches is bounded by the number of classes and attributes
+# and they are emptied if they grow over _MAX_CACHE_SIZE entries.
 #
 # Key structure:
-#   (objref_or_weakref, attrname)
+#   (class, attrname)
 #
 # Value structure (accessor tuples):
-#
-#   kgetattr: (access_code, data1, data2)
-#   ksetattr: (access_code, data1, data2, value_mode)
+#   (access_code, data)
 #
 # Access codes:
 #
-# 0: data1()                 unbound methods and functions (data2 is None)
-# 1: data2(data1())          bound methods and weakref
-# 2: getattr(data1(), data2) using straight getattr and weakref
-# 3: data2(data1)            bound methods (no weakref)
-# 4: getattr(data1, data2)   using straight getattr (no weakref)
+# 0: data()                  callables returned by get_getter
+# 2: getattr(data[0], data[1]) tuples returned by get_getter
+# 5: data(obj)               unbound methods of the class
+# 6: getattr(obj, data)      using straight getattr
+#
+# Only the default lookup is cached, a class overriding get_getter or
+# get_setter may decide differently for each instance, so they are
+# called every time.
+
+LAMBDA_ACCESS = 0
+TUPLE_ACCESS = 2
+FAST_METHOD_ACCESS = 5
+FAST_TUPLE_ACCESS = 6
 
-import weakref
+_MAX_CACHE_SIZE = 4096
 _kgetattr_cache = {}
-_kgetattr_wref = {}
 _ksetattr_cache = {}
-_ksetattr_wref = {}
 
 class CacheControl(object):
     __slots__ = ['key', 'cacheable']
@@ -125,27 +135,33 @@ class DefaultValue(Exception):
     value should be used
     """
 
-def kgetattr_guard(wref):
-    try:
-        key = _kgetattr_wref[id(wref)][0]
-        del _kgetattr_wref[id(wref)]
-        del _kgetattr_cache[key]
-    except KeyError:
-        # This path is used only when the program terminates.
-        pass
-
-def ksetattr_guard(wref):
-    try:
-        key = _ksetattr_wref[id(wref)][0]
-        del _ksetattr_wref[id(wref)]
-        del _ksetattr_cache[key]
-    except KeyError:
-        # This path is used only when the program terminates.
-        pass
+def _get_accessor(obj, name, get_accessor, prefix):
+    # Returns an (access_code, data, cacheable) tuple for attribute name
+    # of obj. get_accessor is the name of the class method which
+    # overrides the default lookup, prefix the one of the accessor methods
+    cls = obj.__class__
+    get_func = getattr(cls, get_accessor, None)
+    if get_func is None:
+        func = getattr(cls, "%s_%s" % (prefix, name), None)
+        if isinstance(func, types.MethodType):
+            log.info('k%sattr based %s_%s method is deprecated, '
+                     'replace it with a property' % (prefix, prefix, name))
+            return FAST_METHOD_ACCESS, func.im_func, True
+        return FAST_TUPLE_ACCESS, name, True
+
+    func = get_func(obj, name, CacheControl((cls, name)))
+    if isinstance(func, types.TupleType):
+        return TUPLE_ACCESS, func, False
+    return LAMBDA_ACCESS, func, False
+
+def _store_accessor(cache, key, accessor):
+    if len(cache) >= _MAX_CACHE_SIZE:
+        cache.clear()
+    cache[key] = accessor
 
 # 1. Break up attr_name into parts
 # 2. Loop around main lookup code for each part:
-#     2.1. Try and get accessor tuple out of cache
+#     2.1. Try and get accessor tuple out of the cache of the class
 #     2.2. If not there, generate tuple from callable and store it
 #     2.3. Use accessor tuple to grab value
 #     2.4. Value wasn't found, return default or raise ValueError
@@ -157,24 +173,7 @@ def kgetattr(model,
              default=_AttrUnset,
              flat=0,
              # bind to local variables for speed:
-             ref=weakref.ref,
-             TupleType=types.TupleType,
-             MethodType=types.MethodType,
-             split=string.split,
-             kgetattr_guard=kgetattr_guard,
              getattr=getattr,
-             dummycache=CacheControl((None,None)),
-             # constants:
-             # access opcodes:
-             LAMBDA_ACCESS = 0,
-             METHOD_ACCESS = 1,
-             TUPLE_ACCESS = 2,
-             NWR_METHOD_ACCESS = 3,
-             NWR_TUPLE_ACCESS = 4,
-             # FAST tuples do not store the object, as the input object
-             # is also the accesses object.
-             FAST_METHOD_ACCESS = 5,
-             FAST_TUPLE_ACCESS = 6,
              ):
     """Returns the value associated with the attribute in model
     named by attr_name. If default is provided and model does not
@@ -186,136 +185,55 @@ def kgetattr(model,
     if flat or "." not in attr_name:
         names = [attr_name, ]
     else:
-        try:
-            names = attr_name.split(".")
-        except AttributeError:
-            names = split(attr_name, ".")
+        names = attr_name.split(".")
 
     # 2. Loop around main lookup code for each part:
     obj = model
     for name in names:
-        key = (id(obj), name)
         # First time round, obj is the model. Every subsequent loop, obj
         # is the subattribute value indicated by the current part in
         # [names]. The last loop grabs the target value and returns it.
+        key = (obj.__class__, name)
 
         try:
-            # 2.1 Fetch the opcode tuple from the cache.
-            objref, icode, data1, data2 = _kgetattr_cache[key]
+            # 2.1 Fetch the accessor tuple from the cache.
+            icode, data = _kgetattr_cache[key]
         except KeyError:
             # 2.2. If not there, generate tuple from callable and store it
             try:
-                get_getter = obj.__class__.get_getter
-                cache = CacheControl(key)
-            except AttributeError:
-                # This is needed so that the check below if the result is
-                # cacheable can be done. The inbuilt get_getter always
-                # allows caching.
-                cache = dummycache
-                get_getter = None
-
-                func = getattr(obj, "get_%s" % name, None)
-                if callable(func):
-                    log.info('kgetattr based get_%s method is deprecated, '
-                             'replace it with a property' % name)
-                    icode = FAST_METHOD_ACCESS
-                    data1 = func.im_func
-                    data2 = None
-                else:
-                    icode = FAST_TUPLE_ACCESS
-                    data1 = None
-                    data2 = name
-
-            if get_getter is not None:
-                try:
-                    func = get_getter(obj, name, cache)
-                except DefaultValue:
-                    if default == _AttrUnset:
-                        raise
-                    return default
-
-                if isinstance(func, TupleType):
-                    data1, data2 = func
-                    if data1 == obj:
-                        data1 = None
-                        icode = FAST_TUPLE_ACCESS
-                    else:
-                        try:
-                            data1 = ref(data1, kgetattr_guard)
-                            _kgetattr_wref[id(data1)] = (key, data1)
-                            icode = TUPLE_ACCESS
-                        except TypeError:
-                            icode = NWR_TUPLE_ACCESS
-
-                elif isinstance(func, MethodType):
-                    data1 = func.im_func
-                    data2 = func.im_self
-                    if data2 == obj:
-                        data2 = None
-                        icode = FAST_METHOD_ACCESS
-                    else:
-                        try:
-                            data2 = ref(func.im_self, kgetattr_guard)
-                            _kgetattr_wref[id(data2)] = (key, data2)
-                            icode = METHOD_ACCESS
-                        except TypeError:
-                            data2 = func.im_self
-                            icode = NWR_METHOD_ACCESS
-                else:
-                    icode = LAMBDA_ACCESS
-                    data1 = func
-                    data2 = None
-            if cache.cacheable:
-                # Store access opcode:
-                # objref or obj are used as a protection against id-aliasing
-                # as we use just a plain id(obj) in the cache entry key.
-                #
-                # We either have to use a weakref, so we get to know when the
-                # object dies. We just remove the cache entry containing the
-                # weakref, _kgetattr_wref is used to associate which key has
-                # to be killed for a given weakref.
-
-                try:
-                    objref = ref(obj, kgetattr_guard)
-                    _kgetattr_wref[id(objref)] = (key, objref)
-                    _kgetattr_cache[key] = (objref, icode, data1, data2)
-                except TypeError:
-                    # it's not weakrefable (probably ZODB!)
-                    # store a hard reference.
-                    _kgetattr_cache[key] = (obj, icode, data1, data2)
-            else:
-                if _kgetattr_cache.has_key(key):
-                    del _kgetattr_cache[key]
+                icode, data, cacheable = _get_accessor(obj, name,
+                                                       'get_getter', 'get')
+            except DefaultValue:
+                if default is _AttrUnset:
+                    raise
+                return default
+            if cacheable:
+                _store_accessor(_kgetattr_cache, key, (icode, data))
 
         # 2.3. Use accessor tuple to grab value
         try:
-            if icode == FAST_METHOD_ACCESS:
-                obj = data1(obj)
-            elif icode == FAST_TUPLE_ACCESS:
-                obj = getattr(obj, data2, default)
-                if obj is _AttrUnset:
+            if icode == FAST_TUPLE_ACCESS:
+                value = getattr(obj, data, default)
+                if value is _AttrUnset:
                     raise AttributeError(
-                        "%r object has no attribute %r" % (obj, data2))
+                        "%r object has no attribute %r" % (obj, data))
+                obj = value
+            elif icode == FAST_METHOD_ACCESS:
+                obj = data(obj)
             elif icode == TUPLE_ACCESS:
-                o = data1()
-                obj = getattr(o, data2, default)
-                if obj is _AttrUnset:
+                value = getattr(data[0], data[1], default)
+                if value is _AttrUnset:
                     raise AttributeError(
-                        "%r object has no attribute %r" % (o, data2))
-            elif icode == NWR_TUPLE_ACCESS:
-                obj = getattr(data1, data2)
-            elif icode == NWR_METHOD_ACCESS:
-                obj = data1(data2)
-            elif icode == METHOD_ACCESS:
-                obj = data1(data2())
+                        "%r object has no attribute %r" % data)
+                obj = value
             elif icode == LAMBDA_ACCESS:
-                obj = data1()
+                obj = data()
             else:
                 raise AssertionError("Unknown tuple type in _kgetattr_cache")
 
         # 2.4. Value wasn't found, return default or raise ValueError
         except DefaultValue:
-            if default == _AttrUnset:
+            if default is _AttrUnset:
                 raise
             return default
 
@@ -324,10 +242,145 @@ def kgetattr(model,
     # 3. Return value
     return obj
 
+# Getters compiled by compile_getter, by attribute path
+_compiled_getters = {}
+# The class -> function dictionaries of each level of the compiled getters
+_compiled_getter_caches = []
+
+def _resolve_getter(cls, name):
+    # Returns the function fetching attribute name from the instances
+    # of cls, kgetattr is used for classes with a custom get_getter
+    if getattr(cls, 'get_getter', None) is None:
+        func = getattr(cls, 'get_%s' % name, None)
+        if not callable(func):
+            return attrgetter(name)
+        if isinstance(func, types.MethodType):
+            log.info('kgetattr based get_%s method is deprecated, '
+                     'replace it with a property' % name)
+            return func
+    return lambda obj: kgetattr(obj, name, flat=1)
+
+def compile_getter(attr_name):
+    """Returns a function which retrieves the value of the attribute
+    named by attr_name from a model, following the dot hierarchy like
+    kgetattr does. The function takes the model and an optional default
+    value, which is returned if an attribute is missing.
+
+    How an attribute is accessed, a plain attribute or a get_foo method,
+    is decided once for each class, so fetching a value costs about as
+    much as a plain attribute chain. The getter of each attribute path
+    is only compiled once."""
+    try:
+        return _compiled_getters[attr_name]
+    except KeyError:
+        pass
+
+    levels = [(name, {}) for name in attr_name.split('.')]
+    for name, getters in levels:
+        _compiled_getter_caches.append(getters)
+    if len(levels) == 1:
+        name, getters = levels[0]
+
+        def getter(model, default=_AttrUnset):
+            try:
+                func = getters[model.__class__]
+            except KeyError:
+                cls = model.__class__
+                func = getters[cls] = _resolve_getter(cls, name)
+            try:
+                return func(model)
+            except (AttributeError, DefaultValue):
+                if default is _AttrUnset:
+                    raise
+                return default
+    else:
+        def getter(model, default=_AttrUnset):
+            obj = model
+            try:
+                for name, getters in levels:
+                    cls = obj.__class__
+                    func = getters.get(cls)
+                    if func is None:
+                        func = getters[cls] = _resolve_getter(cls, name)
+                    obj = func(obj)
+            except (AttributeError, DefaultValue):
+                if default is _AttrUnset:
+                    raise
+                return default
+            return obj
+
+    getter.levels = levels
+    _compiled_getters[attr_name] = getter
+    return getter
+
+def _get_level_values(objects, name, getters):
+    # Fetches attribute name from all the objects, the function is only
+    # looked up when the class changes, which is rare in a list
+    values = []
+    append = values.append
+    cls = func = None
+    for obj in objects:
+        if obj.__class__ is not cls:
+            cls = obj.__class__
+            func = getters.get(cls)
+            if func is None:
+                func = getters[cls] = _resolve_getter(cls, name)
+        append(func(obj))
+    return values
+
+def kgetattr_many(objects, attr_name, default=_AttrUnset, typecode=None):
+    """Returns a list of the values of the attribute named by attr_name
+    of objects, like calling kgetattr for each of them, but the access
+    method is only resolved once for all the objects of a class and
+    each level of the dot hierarchy is fetched in a single loop.
+
+    @param objects: a sequence of models
+    @param attr_name: the attribute name, it can contain dots
+    @param default: if given, the value of the objects which do not
+      have the attribute
+    @param typecode: if given, an array.array of this typecode is
+      returned instead of a list, eg 'd' for floats. The values, and
+      default, must fit in it.
+    @returns: the values, in the same order as objects"""
+    if not isinstance(objects, (list, tuple)):
+        objects = list(objects)
+    getter = compile_getter(attr_name)
+    try:
+        values = objects
+        for name, getters in getter.levels:
+            values = _get_level_values(values, name, getters)
+    except (AttributeError, DefaultValue):
+        if default is _AttrUnset:
+            raise
+        # Some of the objects are missing the attribute
+        values = [getter(obj, default) for obj in objects]
+
+    if typecode is not None:
+        values = array.array(typecode, values)
+    return values
+
+def kgetattr_rows(objects, attr_names, default=_AttrUnset):
+    """Returns the values of several attributes of objects, as a list
+    with one tuple of values for each object. See L{kgetattr_many}.
+
+    @param objects: a sequence of models
+    @param attr_names: a sequence of attribute names
+    @param default: if given, the value of the missing attributes
+    @returns: a list of tuples, in the same order as objects"""
+    if not isinstance(objects, (list, tuple)):
+        objects = list(objects)
+    if not objects:
+        return []
+    columns = [kgetattr_many(objects, attr_name, default)
+               for attr_name in attr_names]
+    if not columns:
+        return [()] * len(objects)
+    return zip(*columns)
+
 # A general algo for ksetattr:
 #
 # 1. Use attr_name to kgetattr the target object, and get the real attribute
-# 2. Try and get accessor tuple from cache
+# 2. Try and get accessor tuple from the cache of the class
 # 3. If not there, generate accessor tuple and store it
 # 4. Set value to target object's attribute
 
@@ -335,24 +388,7 @@ def ksetattr(model,
              attr_name,
              value,
              flat=0,
-
-             # bind to local variables for speed:
-             ref=weakref.ref,
-             TupleType=types.TupleType,
-             MethodType=types.MethodType,
-             ksetattr_guard=ksetattr_guard,
-             getattr=getattr,
-             dummycache=CacheControl((None,None)),
-
-             # constants:
-             LAMBDA_ACCESS = 0,
-             METHOD_ACCESS = 1,
-             TUPLE_ACCESS = 2,
-             NWR_METHOD_ACCESS = 3,
-             NWR_TUPLE_ACCESS = 4,
-             FAST_METHOD_ACCESS = 5,
-             FAST_TUPLE_ACCESS = 6,
-                 ):
+             ):
     """Set the value associated with the attribute in model
     named by attr_name. If flat=1 is specified, no dot path parsing will
     be done."""
@@ -364,124 +400,57 @@ def ksetattr(model,
     # the attribute name and the model we want.
 
     if not flat:
-        lastdot = string.rfind(attr_name, ".")
+        lastdot = attr_name.rfind(".")
         if lastdot != -1:
             model = kgetattr(model, attr_name[:lastdot])
             attr_name = attr_name[lastdot+1:]
 
     # At this point we only have a flat attribute and the right model.
-    key = (id(model), attr_name)
+    key = (model.__class__, attr_name)
 
     try:
         # 2. Try and get accessor tuple from cache
-        objref, icode, data1, data2 = _ksetattr_cache[key]
+        icode, data = _ksetattr_cache[key]
     except KeyError:
         # 3. If not there, generate accessor tuple and store it
-        #    cache = CacheControl(key)
-        try:
-            get_setter = model.__class__.get_setter
-            cache = CacheControl(key)
-        except AttributeError:
-            # No get_setter found:
-            get_setter = None
-            # This is needed so the entry storing code can check if it's ok
-            # to cache.
-            cache = dummycache
-
-            func = getattr(model, "set_%s" % attr_name, None)
-            if callable(func):
-                log.info('ksetattr based set_%s method is deprecated, '
-                         'replace it with a property' % attr_name)
-                icode = FAST_METHOD_ACCESS
-                data1 = func.im_func
-                data2 = None
-            else:
-                icode = FAST_TUPLE_ACCESS
-                data1 = None
-                data2 = attr_name
-
-        if get_setter is not None:
-            func = get_setter(model, attr_name, cache)
-
-            if isinstance(func, TupleType):
-                data1, data2 = func
-                if data1 == model:
-                    data1 = None
-                    icode = FAST_TUPLE_ACCESS
-                else:
-                    try:
-                        data1 = ref(data1, ksetattr_guard)
-                        _ksetattr_wref[id(data1)] = (key, data1)
-                        icode = TUPLE_ACCESS
-                    except TypeError:
-                        icode = NWR_TUPLE_ACCESS
-            elif isinstance(func, MethodType):
-                data1 = func.im_func
-                data2 = func.im_self
-                if data2 == model:
-                    data2 = None
-                    icode = FAST_METHOD_ACCESS
-                else:
-                    try:
-                        data2 = ref(data2, ksetattr_guard)
-                        _ksetattr_wref[id(data2)] = (key, data2)
-                        icode = METHOD_ACCESS
-                    except TypeError:
-                        data2 = func.im_self
-                        icode = NWR_METHOD_ACCESS
-            else:
-                icode = LAMBDA_ACCESS
-                data1 = func
-                data2 = None
-
-        if cache.cacheable:
-            # store the access opcode.
-            # for the use of model/objref as first value in the opcode tuple
-            # see the kgetattr comments.
-            try:
-                objref = ref(model, ksetattr_guard)
-                _ksetattr_wref[id(objref)] = (key, objref)
-                _ksetattr_cache[key] = (objref, icode, data1, data2)
-            except TypeError:
-                # it's not weakref-able, store a hard reference.
-                _ksetattr_cache[key] = (model, icode, data1, data2)
-        else:
-            if _ksetattr_cache.has_key(key):
-                del _ksetattr_cache.has_key[key]
+        icode, data, cacheable = _get_accessor(model, attr_name,
+                                               'get_setter', 'set')
+        if cacheable:
+            _store_accessor(_ksetattr_cache, key, (icode, data))
 
+    # 4. Set value to target object's attribute
     if icode == FAST_TUPLE_ACCESS:
-        setattr(model, data2, value)
+        setattr(model, data, value)
     elif icode == FAST_METHOD_ACCESS:
-        data1(model, value)
+        data(model, value)
     elif icode == TUPLE_ACCESS:
-        setattr(data1(), data2, value)
-    elif icode == NWR_TUPLE_ACCESS:
-        setattr(data1, data2, value)
-    elif icode == NWR_METHOD_ACCESS:
-        data1(data2, value)
-    elif icode == METHOD_ACCESS:
-        data1(data2(), value)
+        setattr(data[0], data[1], value)
     elif icode == LAMBDA_ACCESS:
-        data1(value)
+        data(value)
     else:
         raise AssertionError("Unknown tuple type in _ksetattr_cache")
 
 def enable_attr_cache():
-    """Enables the use of the kgetattr cache when using Python
-    versions that do not support weakrefs (1.5.x and earlier). Be
-    warned, using the cache in these versions causes leaked
-    references to accessor methods and models!"""
-    global _kgetattr_cache, _ksetattr_cache, _kgetattr_wref, _ksetattr_wref
-    _kgetattr_cache = {}
-    _ksetattr_cache = {}
-    _kgetattr_wref = {}
-    _ksetattr_wref = {}
-
-def clear_attr_cache():
-    """Clears the kgetattr cache. It must be called repeatedly to
-    avoid memory leaks in Python 2.0 and earlier."""
-    global _kgetattr_cache, _ksetattr_cache, _kgetattr_wref, _ksetattr_wref
-    _kgetattr_cache = {}
-    _ksetattr_cache = {}
-    _kgetattr_wref = {}
-    _ksetattr_wref = {}
+    """Enables the use of the kgetattr cache. The cache is always
+    enabled, this is kept for compatibility and clears it."""
+    clear_attr_cache()
+
+def clear_attr_cache(cls=None):
+    """Clears the accessor caches, which is needed if the accessors of
+    a class change after an attribute of one of its instances was
+    retrieved or set.
+    @param cls: if given only the entries of this class are removed"""
+    if cls is None:
+        _kgetattr_cache.clear()
+        _ksetattr_cache.clear()
+        for getters in _compiled_getter_caches:
+            getters.clear()
+        return
+
+    for cache in [_kgetattr_cache, _ksetattr_cache]:
+        for key in cache.keys():
+            if key[0] is cls:
+                del cache[key]
+    for getters in _compiled_getter_caches:
+        if cls in getters:
+            del getters[cls]
@@ -82,6 +82,8 @@ class ValidationError(Exception):
 class ConverterRegistry:
     def __init__(self):
         self._converters = {}
+        # (converter_type, format) -> formatter, see get_formatter
+        self._formatters = {}
 
     def add(self, converter_type):
         """
@@ -98,6 +100,7 @@ class ConverterRegistry:
         self._converters[c.type] = c
         self._converters[str(c.type)] = c
         self._converters[c.type.__name__] = c
+        self._formatters.clear()
         return c
     
     def remove(self, converter_type):
@@ -113,6 +116,7 @@ class ConverterRegistry:
             raise KeyError(converter_type)
 
         del self._converters[ctype]
+        self._formatters.clear()
 
     def get_converter(self, converter_type):
         try:
@@ -175,6 +179,32 @@ class ConverterRegistry:
 
         return c.as_string(value, format=format)
 
+    def get_formatter(self, converter_type, format=None):
+        """
+        Returns a function which converts a value to a string, like
+        as_string does. The converter is only looked up once for each
+        type and format, so it is meant to be fetched when a widget or
+        a column is set up and called for each value. The type of the
+        values is not checked.
+        @param converter_type:
+        @param format:
+        @returns: a callable taking a value
+        """
+        key = converter_type, format
+        try:
+            return self._formatters[key]
+        except KeyError:
+            pass
+
+        c = self.get_converter(converter_type)
+        if c.as_string is None:
+            formatter = lambda value: value
+        else:
+            as_string = c.as_string
+            formatter = lambda value: as_string(value, format=format)
+        self._formatters[key] = formatter
+        return formatter
+
     def from_string(self, converter_type, value):
         """
         Convert from a string
@@ -640,7 +670,42 @@ def lformat(format, value):
     """Like locale.format but with grouping enabled"""
     return locale.format(format, value, 1)
 
+# The conventions returned by get_localeconv, computed the first time
+# they are needed after the locale changed
+_localeconv = None
+
+def set_locale(category, locale_name=None):
+    """Like locale.setlocale, but also resets the locale conventions
+    used by the converters. Code which calls locale.setlocale directly
+    must call L{locale_changed} afterwards.
+    @param category: a locale category, eg locale.LC_NUMERIC
+    @param locale_name: the name of the locale
+    @returns: the name of the new locale
+    """
+    try:
+        return locale.setlocale(category, locale_name)
+    finally:
+        locale_changed()
+
+def locale_changed():
+    """Tells the converters that the locale changed, so
+    get_localeconv has to fetch the conventions again"""
+    global _localeconv
+    _localeconv = None
+
 def get_localeconv():
+    """Returns the conventions of the current locale, like
+    locale.localeconv with a few fixes. They are only fetched again
+    after L{locale_changed} is called, the dictionary is shared and
+    must not be modified.
+    @returns: a dictionary
+    """
+    global _localeconv
+    if _localeconv is None:
+        _localeconv = _get_localeconv()
+    return _localeconv
+
+def _get_localeconv():
     conv = locale.localeconv()
 
     monetary_locale = locale.getlocale(locale.LC_MONETARY)
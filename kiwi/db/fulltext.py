@@ -0,0 +1,132 @@
+#
+# Kiwi: a Framework and Enhanced Widgets for Python
+#
+# Copyright (C) 2007 Async Open Source
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307
+# USA
+#
+
+"""
+Full text search strategies
+
+A strategy builds the SQL clause used to search for a text in a column,
+so free text searches can use a full text or trigram index instead of
+a LIKE '%text%' which has to scan the whole table.
+They are set per column on a query executer, see
+L{kiwi.db.query.QueryExecuter.set_full_text_strategy}.
+
+Clauses are returned as a (sql, args) tuple, the sql uses ? as the
+placeholder of the arguments and each executer turns it into an
+expression of its database layer.
+"""
+
+from kiwi.db.query import escape_like
+
+
+class FullTextStrategy(object):
+    """
+    Base class for full text strategies
+    """
+
+    def get_clause(self, table_name, column_name, text):
+        """
+        Builds a clause matching the rows where column contains text.
+        @param table_name: name of the table in the database
+        @param column_name: name of the column in the database
+        @param text: the text searched for
+        @returns: a (sql, args) tuple or None if text has nothing to
+          search for
+        """
+        raise NotImplementedError
+
+
+class PostgresFullText(FullTextStrategy):
+    """
+    Searches a PostgreSQL tsvector column, all the words of the text must
+    be present. The tsvector column is expected to be named after the
+    column it indexes plus a suffix, eg description_fti.
+    """
+
+    def __init__(self, suffix='_fti'):
+        """
+        Create a new PostgresFullText object.
+        @param suffix: suffix of the tsvector columns
+        """
+        self.suffix = suffix
+
+    def get_clause(self, table_name, column_name, text):
+        words = text.lower().split()
+        if not words:
+            return None
+        # FTI operators:
+        #  & = AND
+        #  | = OR
+        # CAST instead of ::tsquery, since the placeholder is replaced
+        # by a named parameter in some integrations
+        return ('%s.%s%s @@ CAST(? AS tsquery)' % (table_name, column_name,
+                                                   self.suffix),
+                (' & '.join(words),))
+
+
+class SQLiteFullText(FullTextStrategy):
+    """
+    Searches a SQLite FTS5 virtual table, all the words of the text
+    must be present in the column.
+    The virtual table is expected to be named after the table plus a
+    suffix and to use the rowid of the table, eg an external content
+    table created with::
+
+      CREATE VIRTUAL TABLE client_fts USING fts5(
+          name, content='client', content_rowid='id')
+
+    """
+
+    def __init__(self, suffix='_fts', rowid='id'):
+        """
+        Create a new SQLiteFullText object.
+        @param suffix: suffix of the virtual tables
+        @param rowid: column of the table used as the rowid of the
+          virtual table
+        """
+        self.suffix = suffix
+        self.rowid = rowid
+
+    def get_clause(self, table_name, column_name, text):
+        words = text.split()
+        if not words:
+            return None
+        fts_table = table_name + self.suffix
+        match = ' AND '.join(['%s : "%s"' % (column_name,
+                                             word.replace('"', '""'))
+                              for word in words])
+        return ('%s.%s IN (SELECT rowid FROM %s WHERE %s MATCH ?)' % (
+            table_name, self.rowid, fts_table, fts_table), (match,))
+
+
+class TrigramFullText(FullTextStrategy):
+    """
+    Searches a PostgreSQL column with a case insensitive ILIKE, which can
+    use a pg_trgm index, created with::
+
+      CREATE INDEX client_name_trgm ON client USING gin (name gin_trgm_ops)
+
+    """
+
+    def get_clause(self, table_name, column_name, text):
+        if not text:
+            return None
+        return ('%s.%s ILIKE ? ESCAPE ?' % (table_name, column_name),
+                ('%%%s%%' % (escape_like(text),), '\\'))
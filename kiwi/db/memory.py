@@ -0,0 +1,263 @@
+#
+# Kiwi: a Framework and Enhanced Widgets for Python
+#
+# Copyright (C) 2007 Async Open Source
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307
+# USA
+#
+
+"""
+Searching python objects in memory
+"""
+
+import bisect
+import datetime
+
+from kiwi.accessor import compile_getter, kgetattr_many
+from kiwi.db.query import StringQueryState, QueryExecuter
+
+
+class _Positions(object):
+    # The positions of the items matching a state, a set
+    # which is true even if it is empty
+    def __init__(self, positions):
+        self.positions = positions
+
+
+class _SortedIndex(object):
+    # The values of an attribute sorted, along with the position of
+    # their item, to find the items with values in a range using bisect.
+    # Items without a value are left out, like NULL in a database.
+    def __init__(self, values):
+        pairs = [(value, position)
+                 for position, value in enumerate(values)
+                     if value is not None]
+        pairs.sort()
+        self.keys = [value for value, position in pairs]
+        self.positions = [position for value, position in pairs]
+
+    def find(self, start=None, end=None):
+        if start is None:
+            low = 0
+        else:
+            low = bisect.bisect_left(self.keys, start)
+        if end is None:
+            high = len(self.keys)
+        else:
+            high = bisect.bisect_right(self.keys, end)
+        return set(self.positions[low:high])
+
+
+class _TrigramIndex(object):
+    # Maps each sequence of three characters of the lowered values to
+    # the positions of the items containing it. The items containing a
+    # text are among the ones which have all its trigrams.
+    def __init__(self, values):
+        self.values = []
+        self.trigrams = {}
+        for position, value in enumerate(values):
+            if value is None:
+                self.values.append(None)
+                continue
+            value = _to_unicode(value).lower()
+            self.values.append(value)
+            for i in range(len(value) - 2):
+                self.trigrams.setdefault(value[i:i + 3], set()).add(position)
+
+    def find(self, text):
+        text = _to_unicode(text).lower()
+        values = self.values
+        if len(text) < 3:
+            candidates = xrange(len(values))
+        else:
+            sets = []
+            for i in range(len(text) - 2):
+                positions = self.trigrams.get(text[i:i + 3])
+                if not positions:
+                    return set()
+                sets.append(positions)
+            sets.sort(key=len)
+            candidates = sets[0]
+            for positions in sets[1:]:
+                candidates = candidates & positions
+        return set([position for position in candidates
+                              if values[position] is not None and
+                                 text in values[position]])
+
+
+class InMemoryQueryExecuter(QueryExecuter):
+    """
+    A QueryExecuter which searches a sequence of python objects.
+    The columns of the filters are attributes of the objects, which
+    are compared like the database executers do.
+
+    Indexes are built the first time a column is searched: a sorted
+    index for numbers and dates and a trigram index for strings.
+    They are only rebuilt by L{set_items}, call it again after modifying
+    the objects.
+
+    Query callbacks return a callable, which is called with an object
+    and returns True if it matches, or None.
+    """
+
+    def __init__(self, items=()):
+        """
+        Create a new InMemoryQueryExecuter object.
+        @param items: a sequence of objects
+        """
+        QueryExecuter.__init__(self)
+        self._items = list(items)
+        self._indexes = {}
+
+    #
+    # Public API
+    #
+
+    def set_items(self, items):
+        """
+        Sets the objects which are searched.
+        @param items: a sequence of objects
+        """
+        self._items = list(items)
+        self._indexes = {}
+        if self._cache is not None:
+            self._cache.invalidate(self.table)
+
+    def get_items(self):
+        """
+        @returns: the objects which are searched
+        """
+        return self._items[:]
+
+    #
+    # QueryExecuter
+    #
+
+    def execute(self, states):
+        """
+        Execute a search.
+        @param states:
+        """
+        positions = None
+        predicates = []
+        for query in self._build_queries(None, states):
+            if isinstance(query, _Positions):
+                if positions is None:
+                    positions = query.positions
+                else:
+                    positions = positions & query.positions
+            else:
+                predicates.append(query)
+
+        items = self._items
+        if positions is None:
+            results = items[:]
+        else:
+            positions = list(positions)
+            positions.sort()
+            results = [items[position] for position in positions]
+        for predicate in predicates:
+            results = filter(predicate, results)
+
+        # Sort by the least significant column first, the sort is stable
+        order_columns = self._get_order_columns()
+        order_columns.reverse()
+        for column, descending in order_columns:
+            getter = compile_getter(column)
+            results.sort(key=lambda item: _get_sort_key(getter(item, None)),
+                         reverse=descending)
+        return results
+
+    #
+    # Private
+    #
+
+    def _get_index(self, column, index_type, convert=None):
+        key = column, index_type, convert
+        index = self._indexes.get(key)
+        if index is None:
+            values = kgetattr_many(self._items, column, None)
+            if convert is not None:
+                values = map(convert, values)
+            index = self._indexes[key] = index_type(values)
+        return index
+
+    def _construct_state_query(self, table, state, fields):
+        positions = set()
+        parse = self._get_state_parser(state)
+        for column, field in fields:
+            matches = parse(state, field, column)
+            # The state does not restrict the search
+            if matches is None:
+                return
+            positions |= matches
+        return _Positions(positions)
+
+    def _parse_number_state(self, state, field, column):
+        if state.value is not None:
+            index = self._get_index(column, _SortedIndex)
+            return index.find(state.value, state.value)
+
+    def _parse_number_interval_state(self, state, field, column):
+        if state.start is not None or state.end is not None:
+            index = self._get_index(column, _SortedIndex)
+            return index.find(state.start, state.end)
+
+    def _parse_string_state(self, state, field, column):
+        if not state.text:
+            return
+        index = self._get_index(column, _TrigramIndex)
+        positions = index.find(state.text)
+        if state.mode == StringQueryState.NOT_CONTAINS:
+            positions = set([position
+                             for position, value in enumerate(index.values)
+                                 if value is not None]) - positions
+        return positions
+
+    def _get_date_index(self, column):
+        return self._get_index(column, _SortedIndex, _get_date)
+
+    def _parse_date_state(self, state, field, column):
+        if state.date:
+            return self._get_date_index(column).find(state.date, state.date)
+
+    def _parse_date_interval_state(self, state, field, column):
+        if state.start or state.end:
+            return self._get_date_index(column).find(state.start or None,
+                                                     state.end or None)
+
+
+def _to_unicode(value):
+    # Values and texts are compared as unicode, so non ascii characters
+    # are lowered the same way in both
+    if isinstance(value, unicode):
+        return value
+    if isinstance(value, str):
+        return value.decode('utf-8', 'replace')
+    return unicode(value)
+
+
+def _get_sort_key(value):
+    # Objects without a value come first, they cannot always be
+    # compared to the other values
+    return value is not None, value
+
+
+def _get_date(value):
+    # Dates are compared without their time, like DATE() does
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
@@ -21,6 +21,9 @@
 # Author(s): Johan Dahlin <jdahlin@async.com.br>
 #
 
+import threading
+import time
+
 from kiwi.interfaces import ISearchFilter
 
 #
@@ -36,6 +39,18 @@ class QueryState(object):
         """
         self.filter = search_filter
 
+    def __eq__(self, other):
+        # States are equal if they are of the same type, belong to the
+        # same filter and have the same values
+        return (type(self) is type(other) and
+                self.__dict__ == other.__dict__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((type(self), tuple(sorted(self.__dict__.items()))))
+
 
 class NumberQueryState(QueryState):
     """
@@ -111,6 +126,196 @@ class DateIntervalQueryState(QueryState):
             self.start, self.end)
 
 
+class QueryCache(object):
+    """
+    A QueryCache keeps the results of recent searches in memory, so
+    that repeating a search does not have to hit the database again.
+
+    Results are keyed on the query states of the search; the least
+    recently used entries are dropped when the cache is full and
+    entries older than ttl seconds are considered expired.
+    The cache does not know when the database changes, call
+    L{invalidate} after modifying a table.
+    The query callbacks of an executer are not part of the key either,
+    if a callback builds its query from other state, such as a widget
+    or an attribute, call L{invalidate} when that state changes.
+    A cache can be shared by several query executers.
+    """
+    def __init__(self, size=50, ttl=None):
+        """
+        Create a new QueryCache object.
+        @param size: maximum number of searches to keep
+        @param ttl: number of seconds an entry is valid or None to
+          keep entries until they are evicted or invalidated
+        """
+        if size < 1:
+            raise ValueError("size must be at least 1, not %r" % (size,))
+        self._size = size
+        self._ttl = ttl
+        # key -> (table, timestamp, results)
+        self._entries = {}
+        # keys in least recently used order
+        self._keys = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Fetch the results stored for key.
+        @param key: cache key
+        @param default: value to return if key is not cached
+        @returns: the results or default
+        """
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            table, timestamp, results = entry
+            if self._ttl is not None and time.time() - timestamp > self._ttl:
+                del self._entries[key]
+                self._keys.remove(key)
+                return default
+            self._keys.remove(key)
+            self._keys.append(key)
+            return results
+        finally:
+            self._lock.release()
+
+    def set(self, key, results, table=None):
+        """
+        Store results for key.
+        @param key: cache key
+        @param results: list of objects
+        @param table: the table the results were fetched from
+        """
+        self._lock.acquire()
+        try:
+            if key in self._entries:
+                self._keys.remove(key)
+            self._entries[key] = table, time.time(), results
+            self._keys.append(key)
+            while len(self._keys) > self._size:
+                del self._entries[self._keys.pop(0)]
+        finally:
+            self._lock.release()
+
+    def invalidate(self, table=None):
+        """
+        Remove entries from the cache.
+        @param table: only remove the results fetched from this table,
+          if None everything is removed
+        """
+        self._lock.acquire()
+        try:
+            if table is None:
+                self._entries.clear()
+                self._keys = []
+                return
+            for key, (entry_table, timestamp, results) in self._entries.items():
+                if entry_table is table:
+                    del self._entries[key]
+                    self._keys.remove(key)
+        finally:
+            self._lock.release()
+
+
+_state_parsers = {
+    NumberQueryState: '_parse_number_state',
+    NumberIntervalQueryState: '_parse_number_interval_state',
+    StringQueryState: '_parse_string_state',
+    DateQueryState: '_parse_date_state',
+    DateIntervalQueryState: '_parse_date_interval_state',
+    }
+
+
+def escape_like(text, escape='\\'):
+    """
+    Escapes the wildcards of a LIKE pattern, so text is matched as is.
+    The pattern has to be used with an ESCAPE clause using the same
+    escape character.
+    @param text: text to escape
+    @param escape: the escape character
+    @returns: the escaped text
+    """
+    return text.replace(escape, escape + escape).replace(
+        '%', escape + '%').replace('_', escape + '_')
+
+
+def _count_results(results):
+    if isinstance(results, (list, tuple)):
+        return len(results)
+    return results.count()
+
+
+class QueryPager(object):
+    """
+    A QueryPager fetches the results of a search a page at a time,
+    using offset/limit on the result set of the query, so a view
+    can browse a large number of matches without loading all of them.
+    It is usually created by L{QueryExecuter.search_pages}.
+    """
+    def __init__(self, results, page_size):
+        """
+        Create a new QueryPager object.
+        @param results: result set of a query, which must support slicing
+        @param page_size: number of results in a page
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be positive, not %r" % (
+                page_size,))
+        self._results = results
+        self._page_size = page_size
+        self._offset = 0
+        self._count = None
+        self._exhausted = False
+
+    def count(self):
+        """
+        Counts the total number of results of the search, for a database
+        result set this runs a separate COUNT query the first time
+        it is called.
+        @returns: the number of results
+        """
+        if self._count is None:
+            self._count = _count_results(self._results)
+        return self._count
+
+    def fetch_next_page(self):
+        """
+        Fetches the next page of results.
+        @returns: a list of at most page_size objects, empty when all
+          the results were fetched
+        """
+        if self._exhausted:
+            return []
+        start = self._offset
+        # Fetch an extra row to know if there are more pages
+        rows = list(self._results[start:start + self._page_size + 1])
+        if len(rows) <= self._page_size:
+            self._exhausted = True
+        page = rows[:self._page_size]
+        self._offset += len(page)
+        return page
+
+    def has_more(self):
+        """
+        @returns: True if there are results left to fetch
+        """
+        return not self._exhausted
+
+    def get_offset(self):
+        """
+        @returns: the number of results fetched so far
+        """
+        return self._offset
+
+    def get_page_size(self):
+        return self._page_size
+
+
 class QueryExecuter(object):
     """
     A QueryExecuter is responsible for taking the state (as in QueryState)
@@ -124,6 +329,16 @@ class QueryExecuter(object):
     def __init__(self):
         self._columns = {}
         self._limit = self.default_search_limit
+        self._cache = None
+        self._query_callbacks = []
+        self._filter_query_callbacks = {}
+        self._sort_columns = {}
+        self._order_by = []
+        self._full_text_strategy = None
+        self._full_text_strategies = {}
+        # search filter -> (table, [(column, field), ...])
+        self._filter_fields = {}
+        self.table = None
 
     #
     # Public API
@@ -136,26 +351,286 @@ class QueryExecuter(object):
 
         assert not search_filter in self._columns
         self._columns[search_filter] = columns
+        if self.table is not None:
+            self._get_filter_fields(search_filter)
+
+    def set_sort_columns(self, attribute, columns):
+        """
+        Sets the table columns used to sort the results by an attribute,
+        allowing L{set_order_by} to sort by it.
+        @param attribute: attribute of the result objects, usually the
+          attribute of a L{kiwi.ui.objectlist.Column}
+        @param columns: list of column names
+        """
+        if not columns:
+            raise ValueError("columns can not be empty")
+        self._sort_columns[attribute] = columns
+
+    def can_sort_by(self, attribute):
+        """
+        @returns: True if the database can sort the results by attribute
+        """
+        return attribute in self._sort_columns
+
+    def set_order_by(self, order_by):
+        """
+        Sets the order of the results of the searches.
+        @param order_by: list of (attribute, descending) tuples, the
+          attributes must have been set with L{set_sort_columns}
+        """
+        for attribute, descending in order_by:
+            if not attribute in self._sort_columns:
+                raise ValueError("There are no sort columns for %s" % (
+                    attribute,))
+        self._order_by = list(order_by)
+
+    def get_order_by(self):
+        """
+        @returns: list of (attribute, descending) tuples
+        """
+        return self._order_by[:]
+
+    def set_full_text_strategy(self, strategy, columns=None):
+        """
+        Sets the strategy used to search for text in columns, instead of
+        a LIKE '%%text%%' which cannot use an index.
+        @param strategy: a L{kiwi.db.fulltext.FullTextStrategy} or None
+          to use LIKE
+        @param columns: list of column names or None to set the strategy
+          of all the columns without one
+        """
+        if columns is None:
+            self._full_text_strategy = strategy
+            return
+        for column in columns:
+            self._full_text_strategies[column] = strategy
+
+    def add_query_callback(self, callback):
+        """
+        Adds a generic query callback.
+        If a cache is set, see L{set_cache}, the cache must be
+        invalidated when the query built by the callback changes.
+
+        @param callback: a callable
+        """
+        if not callable(callback):
+            raise TypeError
+        self._query_callbacks.append(callback)
+
+    def add_filter_query_callback(self, search_filter, callback):
+        """
+        Adds a query callback for the filter search_filter.
+        If a cache is set, see L{set_cache}, the cache must be
+        invalidated when the query built by the callback changes
+        for the same state.
+
+        @param search_filter: a search filter
+        @param callback: a callable
+        """
+        if not ISearchFilter.providedBy(search_filter):
+            raise TypeError
+        if not callable(callback):
+            raise TypeError
+        l = self._filter_query_callbacks.setdefault(search_filter, [])
+        l.append(callback)
+
+    def set_cache(self, cache):
+        """
+        Set the cache used to store the results of searches.
+        When a cache is set the results of L{search} are always lists.
+        Results are keyed on the query states only, so the cache must
+        be invalidated with L{QueryCache.invalidate} when anything else
+        used by the query callbacks changes.
+        @param cache: a L{QueryCache} or None to disable caching
+        """
+        self._cache = cache
+
+    def get_cache(self):
+        """
+        @returns: the L{QueryCache} used by this executer or None
+        """
+        return self._cache
+
+    def search(self, states):
+        """
+        Execute a search, the results of a previous search with the same
+        states are returned if they are still in the cache.
+        @param states:
+        @type states: list of L{QueryStates}
+        @returns: list of objects matching query
+        """
+        cache = self._cache
+        if cache is None:
+            return self._limit_results(self.execute(states))
+
+        key = (self, self.table, self._limit, tuple(self._order_by),
+               tuple(states))
+        try:
+            results = cache.get(key)
+        except TypeError:
+            # A state holding an unhashable value, it cannot be cached
+            return self._limit_results(self.execute(states))
+
+        if results is None:
+            results = list(self._limit_results(self.execute(states)))
+            cache.set(key, results, self.table)
+        return results[:]
+
+    def search_pages(self, states, page_size=None):
+        """
+        Execute a search whose results are fetched a page at a time.
+        The search limit does not apply, all the results can be fetched
+        by requesting enough pages.
+        @param states:
+        @type states: list of L{QueryStates}
+        @param page_size: number of results in a page, defaults to
+          the search limit
+        @returns: a L{QueryPager}
+        """
+        if page_size is None:
+            page_size = self._limit or self.default_search_limit
+        return QueryPager(self.execute(states), page_size)
+
+    def count(self, states):
+        """
+        Counts the results of a search, ignoring the search limit.
+        For a database this runs a COUNT query, the results
+        are not fetched.
+        @param states:
+        @type states: list of L{QueryStates}
+        @returns: the number of objects matching the query
+        """
+        cache = self._cache
+        if cache is None:
+            return _count_results(self.execute(states))
+
+        # The count does not depend on the limit nor on the order
+        key = (self, self.table, 'count', tuple(states))
+        try:
+            count = cache.get(key)
+        except TypeError:
+            return _count_results(self.execute(states))
+
+        if count is None:
+            count = _count_results(self.execute(states))
+            cache.set(key, count, self.table)
+        return count
 
     #
     # Overridable
     #
 
-    def search(self, states):
+    def execute(self, states):
         """
-        Execute a search.
+        Build and execute the query for a search.
+        The search limit should not be applied here, it is applied by
+        the caller.
         @param states:
         @type states: list of L{QueryStates}
-        @returns: list of objects matching query
+        @returns: result set of the query, it must support slicing
+          like a list does
         """
         raise NotImplementedError
 
     def set_limit(self, limit):
         """
         Set the maximum number of result items to return in a search query.
-        @param limit:
+        @param limit: the limit or None to return all the results
         """
         self._limit = limit
 
     def get_limit(self):
         return self._limit
+
+    #
+    # Private
+    #
+
+    def _limit_results(self, results):
+        if self._limit is None:
+            return results
+        return results[:self._limit]
+
+    def _get_field(self, table, column):
+        # The object of the database layer for a column of table
+        return column
+
+    def _get_filter_fields(self, search_filter):
+        # The (column, field) pairs of the columns of a filter, the fields
+        # are looked up once instead of on every search
+        table, fields = self._filter_fields.get(search_filter, (None, None))
+        if fields is None or table is not self.table:
+            fields = [(column, self._get_field(self.table, column))
+                      for column in self._columns[search_filter]]
+            self._filter_fields[search_filter] = self.table, fields
+        return fields
+
+    def _get_state_parser(self, state):
+        # The _parse_*_state method building the query for state, it is
+        # called with the state, the field and the name of a column
+        name = _state_parsers.get(type(state))
+        if name is None:
+            for state_type, name in _state_parsers.items():
+                if isinstance(state, state_type):
+                    break
+            else:
+                raise NotImplementedError(state.__class__.__name__)
+        return getattr(self, name)
+
+    def _construct_state_query(self, table, state, fields):
+        # Build the query for the state of a filter with search columns,
+        # None if the state does not restrict the search
+        raise NotImplementedError
+
+    def _get_order_columns(self):
+        # List of (column, descending) tuples to sort the results by
+        order_columns = []
+        for attribute, descending in self._order_by:
+            for column in self._sort_columns[attribute]:
+                order_columns.append((column, descending))
+        return order_columns
+
+    def _get_full_text_clause(self, column, table_name, column_name, text):
+        # The (sql, args) clause of the full text strategy of column,
+        # None if it has no strategy
+        strategy = self._full_text_strategies.get(column,
+                                                  self._full_text_strategy)
+        if strategy is None:
+            return None
+        return strategy.get_clause(table_name, column_name, text)
+
+    def _accepts_any_filter(self):
+        # Whether filters without columns or callbacks are allowed,
+        # a generic query callback may take care of them
+        return bool(self._query_callbacks)
+
+    def _build_queries(self, table, states):
+        # Build the list of queries for the states, which the executer
+        # combines with AND
+        queries = []
+        for state in states:
+            search_filter = state.filter
+            assert search_filter
+
+            # Column query
+            if search_filter in self._columns:
+                query = self._construct_state_query(
+                    table, state, self._get_filter_fields(search_filter))
+                if query:
+                    queries.append(query)
+            # Custom per filter/state query.
+            elif search_filter in self._filter_query_callbacks:
+                for callback in self._filter_query_callbacks[search_filter]:
+                    query = callback(state)
+                    if query:
+                        queries.append(query)
+            elif not self._accepts_any_filter():
+                raise ValueError(
+                    "You need to add a search column or a query callback "
+                    "for filter %s" % (search_filter))
+
+        for callback in self._query_callbacks:
+            query = callback(states)
+            if query:
+                queries.append(query)
+        return queries
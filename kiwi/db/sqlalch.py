@@ -24,12 +24,9 @@
 SQLAlchemy integration for Kiwi
 """
 
-from sqlalchemy import and_, or_, not_
+from sqlalchemy import and_, or_, not_, desc, text, bindparam
 
-from kiwi.db.query import NumberQueryState, StringQueryState, \
-     DateQueryState, DateIntervalQueryState, QueryExecuter, \
-     NumberIntervalQueryState
-from kiwi.interfaces import ISearchFilter
+from kiwi.db.query import StringQueryState, QueryExecuter, escape_like
 
 
 class SQLAlchemyQueryExecuter(QueryExecuter):
@@ -37,8 +34,6 @@ class SQLAlchemyQueryExecuter(QueryExecuter):
         QueryExecuter.__init__(self)
         self.session = session
         self.table = None
-        self._query_callbacks = []
-        self._filter_query_callbacks = {}
         self._query = self._default_query
         self._full_text_indexes = {}
 
@@ -53,30 +48,6 @@ class SQLAlchemyQueryExecuter(QueryExecuter):
         """
         self.table = table
 
-    def add_query_callback(self, callback):
-        """
-        Adds a generic query callback
-
-        @param callback: a callable
-        """
-        if not callable(callback):
-            raise TypeError
-        self._query_callbacks.append(callback)
-
-    def add_filter_query_callback(self, search_filter, callback):
-        """
-        Adds a query callback for the filter search_filter
-
-        @param search_filter: a search filter
-        @param callback: a callable
-        """
-        if not ISearchFilter.providedBy(search_filter):
-            raise TypeError
-        if not callable(callback):
-            raise TypeError
-        l = self._filter_query_callbacks.setdefault(search_filter, [])
-        l.append(callback)
-
     def set_query(self, callback):
         """
         Overrides the default query mechanism.
@@ -94,86 +65,65 @@ class SQLAlchemyQueryExecuter(QueryExecuter):
     # QueryBuilder
     #
 
-    def search(self, states):
+    def execute(self, states):
         """
         Execute a search.
         @param states:
         """
         if self.table is None:
             raise ValueError("table cannot be None")
-        table = self.table
-        queries = []
-        for state in states:
-            search_filter = state.filter
-            assert state.filter
-
-            # Column query
-            if search_filter in self._columns:
-                query = self._construct_state_query(
-                    table, state, self._columns[search_filter])
-                if query:
-                    queries.append(query)
-            # Custom per filter/state query.
-            elif search_filter in self._filter_query_callbacks:
-                for callback in self._filter_query_callbacks[search_filter]:
-                    query = callback(state)
-                    if query:
-                        queries.append(query)
-            else:
-                if (self._query == self._default_query and
-                    not self._query_callbacks):
-                    raise ValueError(
-                        "You need to add a search column or a query callback "
-                        "for filter %s" % (search_filter))
-
-        for callback in self._query_callbacks:
-            query = callback(states)
-            if query:
-                queries.append(query)
-
+        queries = self._build_queries(self.table, states)
         if queries:
             query = and_(*queries)
         else:
             query = None
         result = self._query(query)
+        order_columns = self._get_order_columns()
+        if order_columns:
+            order_by = []
+            for column, descending in order_columns:
+                field = getattr(self.table.c, column)
+                if descending:
+                    field = desc(field)
+                order_by.append(field)
+            result = result.order_by(*order_by)
         return result
 
     #
     # Private
     #
 
+    def _accepts_any_filter(self):
+        return (self._query != self._default_query or
+                QueryExecuter._accepts_any_filter(self))
+
     def _default_query(self, query):
-        return self.session.query(self.table).select(query)
+        # A Query is only executed when it is sliced or iterated, so the
+        # search limit and paging turn into LIMIT/OFFSET
+        result = self.session.query(self.table)
+        if query is not None:
+            result = result.filter(query)
+        return result
 
-    def _construct_state_query(self, table, state, columns):
-        queries = []
-        for column in columns:
-            query = None
-            table_field = getattr(table.c, column)
-            if isinstance(state, NumberQueryState):
-                query = self._parse_number_state(state, table_field)
-            elif isinstance(state, NumberIntervalQueryState):
-                query = self._parse_number_interval_state(state, table_field)
-            elif isinstance(state, StringQueryState):
-                query = self._parse_string_state(state, table_field)
-            elif isinstance(state, DateQueryState):
-                query = self._parse_date_state(state, table_field)
-            elif isinstance(state, DateIntervalQueryState):
-                query = self._parse_date_interval_state(state, table_field)
-            else:
-                raise NotImplementedError(state.__class__.__name__)
+    def _get_field(self, table, column):
+        return getattr(table.c, column)
 
+    def _construct_state_query(self, table, state, fields):
+        queries = []
+        parse = self._get_state_parser(state)
+        for column, table_field in fields:
+            query = parse(state, table_field, column)
             if query:
                 queries.append(query)
 
         if queries:
             return or_(*queries)
 
-    def _parse_number_state(self, state, table_field):
+    def _parse_number_state(self, state, table_field, column):
         if state.value is not None:
             return table_field == state.value
 
-    def _parse_number_interval_state(self, state, table_field):
+    def _parse_number_interval_state(self, state, table_field, column):
         queries = []
         if state.start:
             queries.append(table_field >= state.start)
@@ -182,20 +132,33 @@ class SQLAlchemyQueryExecuter(QueryExecuter):
         if queries:
             return and_(*queries)
 
-    def _parse_string_state(self, state, table_field):
-        if state.text is not None:
-            text = '%%%s%%' % state.text.lower()
-            retval = table_field.like(text)
+    def _parse_string_state(self, state, table_field, column):
+        if not state.text:
+            return
+        clause = self._get_full_text_clause(
+            column, table_field.table.name, table_field.name, state.text)
+        if clause is not None:
+            sql, args = clause
+            parts = sql.split('?')
+            params = []
+            for i, arg in enumerate(args):
+                name = 'kiwi_text_%d' % (i,)
+                parts[i] += ':' + name
+                params.append(bindparam(name, arg))
+            retval = text(''.join(parts), bindparams=params)
+        else:
+            value = '%%%s%%' % escape_like(state.text.lower())
+            retval = table_field.like(value, escape='\\')
         if state.mode == StringQueryState.NOT_CONTAINS:
             retval = not_(retval)
 
         return retval
 
-    def _parse_date_state(self, state, table_field):
+    def _parse_date_state(self, state, table_field, column):
         if state.date:
             return table_field == state.date
 
-    def _parse_date_interval_state(self, state, table_field):
+    def _parse_date_interval_state(self, state, table_field, column):
         queries = []
         if state.start:
             queries.append(table_field >= state.start)
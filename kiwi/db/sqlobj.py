@@ -26,12 +26,18 @@
 SQLObject integration for Kiwi
 """
 
-from sqlobject.sqlbuilder import func, AND, OR, LIKE, SQLExpression, NOT
+from sqlobject.sqlbuilder import func, AND, OR, SQLExpression, NOT, \
+     DESC
 
-from kiwi.db.query import NumberQueryState, StringQueryState, \
-     DateQueryState, DateIntervalQueryState, QueryExecuter, \
-     NumberIntervalQueryState
-from kiwi.interfaces import ISearchFilter
+from kiwi.db.fulltext import PostgresFullText
+from kiwi.db.query import StringQueryState, QueryExecuter, escape_like
+
+class _StateQuery(object):
+    # The query of a state with columns which are aggregates, those
+    # have to be restricted in the HAVING part of the query
+    def __init__(self, where, having):
+        self.where = where
+        self.having = having
 
 class _FTI(SQLExpression):
     def __init__(self, q):
@@ -39,13 +45,14 @@ class _FTI(SQLExpression):
     def __sqlrepr__(self, db):
         return self.q
 
+# Used for the tsvector columns found by _check_has_fulltext_index
+_postgres_full_text = PostgresFullText()
+
 class SQLObjectQueryExecuter(QueryExecuter):
     def __init__(self, conn=None):
         QueryExecuter.__init__(self)
         self.conn = conn
         self.table = None
-        self._query_callbacks = []
-        self._filter_query_callbacks = {}
         self._query = self._default_query
         self._full_text_indexes = {}
 
@@ -60,30 +67,6 @@ class SQLObjectQueryExecuter(QueryExecuter):
         """
         self.table = table
 
-    def add_query_callback(self, callback):
-        """
-        Adds a generic query callback
-
-        @param callback: a callable
-        """
-        if not callable(callback):
-            raise TypeError
-        self._query_callbacks.append(callback)
-
-    def add_filter_query_callback(self, search_filter, callback):
-        """
-        Adds a query callback for the filter search_filter
-
-        @param search_filter: a search filter
-        @param callback: a callable
-        """
-        if not ISearchFilter.providedBy(search_filter):
-            raise TypeError
-        if not callable(callback):
-            raise TypeError
-        l = self._filter_query_callbacks.setdefault(search_filter, [])
-        l.append(callback)
-
     def set_query(self, callback):
         """
         Overrides the default query mechanism.
@@ -101,42 +84,23 @@ class SQLObjectQueryExecuter(QueryExecuter):
     # QueryBuilder
     #
 
-    def search(self, states):
+    def execute(self, states):
         """
         Execute a search.
         @param states:
         """
         if self.table is None:
             raise ValueError("table cannot be None")
-        table = self.table
+        # The HAVING clauses are kept apart from the WHERE ones of the
+        # states, so nothing is shared between concurrent searches
         queries = []
-        self._having = []
-        for state in states:
-            search_filter = state.filter
-            assert state.filter
-
-            # Column query
-            if search_filter in self._columns:
-                query = self._construct_state_query(
-                    table, state, self._columns[search_filter])
-                if query:
-                    queries.append(query)
-            # Custom per filter/state query.
-            elif search_filter in self._filter_query_callbacks:
-                for callback in self._filter_query_callbacks[search_filter]:
-                    query = callback(state)
-                    if query:
-                        queries.append(query)
+        having_queries = []
+        for query in self._build_queries(self.table, states):
+            if isinstance(query, _StateQuery):
+                if query.where is not None:
+                    queries.append(query.where)
+                having_queries.append(query.having)
             else:
-                if (self._query == self._default_query and
-                    not self._query_callbacks):
-                    raise ValueError(
-                        "You need to add a search column or a query callback "
-                        "for filter %s" % (search_filter))
-
-        for callback in self._query_callbacks:
-            query = callback(states)
-            if query:
                 queries.append(query)
 
         if queries:
@@ -145,47 +109,46 @@ class SQLObjectQueryExecuter(QueryExecuter):
             query = None
 
         having = None
-        if self._having:
-            having = AND(self._having)
+        if having_queries:
+            having = AND(*having_queries)
 
         result = self._query(query, having, self.conn)
-        return result.limit(self.get_limit())
+        order_columns = self._get_order_columns()
+        if order_columns:
+            order_by = []
+            for column, descending in order_columns:
+                field = getattr(self.table.q, column)
+                if descending:
+                    field = DESC(field)
+                order_by.append(field)
+            result = result.orderBy(order_by)
+        return result
 
     #
     # Private
     #
 
-    def _add_having(self, clause):
-        self._having.append(clause)
+    def _accepts_any_filter(self):
+        return (self._query != self._default_query or
+                QueryExecuter._accepts_any_filter(self))
 
     def _default_query(self, query, having, conn):
         return self.table.select(query, having=having, connection=conn)
 
-    def _construct_state_query(self, table, state, columns):
+    def _get_field(self, table, column):
+        return getattr(table.q, column)
+
+    def _construct_state_query(self, table, state, fields):
         queries = []
         having_queries = []
 
-        for column in columns:
-            query = None
-            table_field = getattr(table.q, column)
-
+        parse = self._get_state_parser(state)
+        for column, table_field in fields:
             # If the field has an aggregate function (sum, avg, etc..), then
             # this clause should be in the HAVING part of the query.
             use_having = table_field.hasSQLCall()
 
-            if isinstance(state, NumberQueryState):
-                query = self._parse_number_state(state, table_field)
-            elif isinstance(state, NumberIntervalQueryState):
-                query = self._parse_number_interval_state(state, table_field)
-            elif isinstance(state, StringQueryState):
-                query = self._parse_string_state(state, table_field)
-            elif isinstance(state, DateQueryState):
-                query = self._parse_date_state(state, table_field)
-            elif isinstance(state, DateIntervalQueryState):
-                query = self._parse_date_interval_state(state, table_field)
-            else:
-                raise NotImplementedError(state.__class__.__name__)
-
+            query = parse(state, table_field, column)
             if query and use_having:
                 having_queries.append(query)
                 query = None
@@ -194,7 +157,10 @@ class SQLObjectQueryExecuter(QueryExecuter):
                 queries.append(query)
 
         if having_queries:
-            self._add_having(OR(*having_queries))
+            where = None
+            if queries:
+                where = OR(*queries)
+            return _StateQuery(where, OR(*having_queries))
 
         if queries:
             return OR(*queries)
@@ -224,11 +190,11 @@ class SQLObjectQueryExecuter(QueryExecuter):
             self._full_text_indexes[fullname] = value
         return value
 
-    def _parse_number_state(self, state, table_field):
+    def _parse_number_state(self, state, table_field, column):
         if state.value is not None:
             return table_field == state.value
 
-    def _parse_number_interval_state(self, state, table_field):
+    def _parse_number_interval_state(self, state, table_field, column):
         queries = []
         if state.start is not None:
             queries.append(table_field >= state.start)
@@ -237,35 +203,40 @@ class SQLObjectQueryExecuter(QueryExecuter):
         if queries:
             return AND(*queries)
 
-    def _parse_string_state(self, state, table_field):
+    def _parse_string_state(self, state, table_field, column):
         if not state.text:
             return
 
-        if self._check_has_fulltext_index(table_field.tableName,
-                                          table_field.fieldName):
-            value = state.text.lower()
-            # FTI operators:
-            #  & = AND
-            #  | = OR
-            value = value.replace(' ', ' & ')
-            retval = _FTI("%s.%s_fti @@ %s::tsquery" % (
-                table_field.tableName,
-                table_field.fieldName,
-                self.conn.sqlrepr(value)))
+        clause = self._get_full_text_clause(
+            column, table_field.tableName, table_field.fieldName, state.text)
+        if clause is None and self._check_has_fulltext_index(
+            table_field.tableName, table_field.fieldName):
+            clause = _postgres_full_text.get_clause(
+                table_field.tableName, table_field.fieldName, state.text)
+
+        if clause is not None:
+            sql, args = clause
+            parts = sql.split('?')
+            for i, arg in enumerate(args):
+                parts[i] += self.conn.sqlrepr(arg)
+            retval = _FTI(''.join(parts))
         else:
-            text = '%%%s%%' % state.text.lower()
-            retval = LIKE(func.LOWER(table_field), text)
+            text = '%%%s%%' % escape_like(state.text.lower())
+            # LIKE does not support an ESCAPE clause
+            retval = _FTI('(%s LIKE %s ESCAPE %s)' % (
+                self.conn.sqlrepr(func.LOWER(table_field)),
+                self.conn.sqlrepr(text), self.conn.sqlrepr('\\')))
 
         if state.mode == StringQueryState.NOT_CONTAINS:
             retval = NOT(retval)
 
         return retval
 
-    def _parse_date_state(self, state, table_field):
+    def _parse_date_state(self, state, table_field, column):
         if state.date:
             return func.DATE(table_field) == state.date
 
-    def _parse_date_interval_state(self, state, table_field):
+    def _parse_date_interval_state(self, state, table_field, column):
         queries = []
         if state.start:
             queries.append(table_field >= state.start)
@@ -27,11 +27,9 @@
 Storm integration for Kiwi
 """
 
-from storm.expr import And, Or, Like, Not
+from storm.expr import And, Or, Like, Not, Desc, SQL
 
-from kiwi.db.query import NumberQueryState, StringQueryState, \
-     DateQueryState, DateIntervalQueryState, QueryExecuter, \
-     NumberIntervalQueryState
+from kiwi.db.query import StringQueryState, QueryExecuter, escape_like
 
 
 class StormQueryExecuter(QueryExecuter):
@@ -42,21 +40,25 @@ class StormQueryExecuter(QueryExecuter):
         self.store = store
         self.table = None
 
-    def search(self, states):
+    def execute(self, states):
         """
         Build and execute a query for the search states
         """
-        queries = []
-        for state in states:
-            search_filter = state.filter
-            assert state.filter
-            if search_filter in self._columns:
-                query = self._construct_state_query(
-                    self.table, state, self._columns[search_filter])
-                if query:
-                    queries.append(query)
+        if self.table is None:
+            raise ValueError("table cannot be None")
+        queries = self._build_queries(self.table, states)
         # Storm will unpack those values.
-        return self.store.find(self.table, *queries)
+        result = self.store.find(self.table, *queries)
+        order_columns = self._get_order_columns()
+        if order_columns:
+            order_by = []
+            for column, descending in order_columns:
+                field = getattr(self.table, column)
+                if descending:
+                    field = Desc(field)
+                order_by.append(field)
+            result = result.order_by(*order_by)
+        return result
 
     def set_table(self, table):
         """
@@ -65,34 +67,29 @@ class StormQueryExecuter(QueryExecuter):
         """
         self.table = table
 
+    def _accepts_any_filter(self):
+        # Filters without columns are ignored
+        return True
+
     # Basically stolen from sqlobject integration
-    def _construct_state_query(self, table, state, columns):
+    def _get_field(self, table, column):
+        return getattr(table, column)
+
+    def _construct_state_query(self, table, state, fields):
         queries = []
-        for column in columns:
-            query = None
-            table_field = getattr(table, column)
-            if isinstance(state, NumberQueryState):
-                query = self._parse_number_state(state, table_field)
-            elif isinstance(state, NumberIntervalQueryState):
-                query = self._parse_number_interval_state(state, table_field)
-            elif isinstance(state, StringQueryState):
-                query = self._parse_string_state(state, table_field)
-            elif isinstance(state, DateQueryState):
-                query = self._parse_date_state(state, table_field)
-            elif isinstance(state, DateIntervalQueryState):
-                query = self._parse_date_interval_state(state, table_field)
-            else:
-                raise NotImplementedError(state.__class__.__name__)
+        parse = self._get_state_parser(state)
+        for column, table_field in fields:
+            query = parse(state, table_field, column)
             if query:
                 queries.append(query)
         if queries:
             return Or(*queries)
 
-    def _parse_number_state(self, state, table_field):
+    def _parse_number_state(self, state, table_field, column):
         if state.value is not None:
             return table_field == state.value
 
-    def _parse_number_interval_state(self, state, table_field):
+    def _parse_number_interval_state(self, state, table_field, column):
         queries = []
         if state.start:
             queries.append(table_field >= state.start)
@@ -101,21 +98,27 @@ class StormQueryExecuter(QueryExecuter):
         if queries:
             return And(*queries)
 
-    def _parse_string_state(self, state, table_field):
+    def _parse_string_state(self, state, table_field, column):
         if not state.text:
             return
-        text = '%%%s%%' % state.text.lower()
-        retval = Like(table_field, text)
+        clause = self._get_full_text_clause(
+            column, self.table.__storm_table__, table_field.name, state.text)
+        if clause is not None:
+            sql, args = clause
+            retval = SQL(sql, args)
+        else:
+            text = '%%%s%%' % escape_like(state.text.lower())
+            retval = Like(table_field, text, escape='\\')
         if state.mode == StringQueryState.NOT_CONTAINS:
             retval = Not(retval)
 
         return retval
 
-    def _parse_date_state(self, state, table_field):
+    def _parse_date_state(self, state, table_field, column):
         if state.date:
             return table_field == state.date
 
-    def _parse_date_interval_state(self, state, table_field):
+    def _parse_date_interval_state(self, state, table_field, column):
         queries = []
         if state.start:
             queries.append(table_field >= state.start)
@@ -28,6 +28,7 @@
 
 import datetime
 import gettext
+import itertools
 import pickle
 
 import gobject
@@ -35,12 +36,14 @@ import pango
 import gtk
 from gtk import gdk
 
-from kiwi.accessor import kgetattr
+from kiwi.accessor import compile_getter, kgetattr_many
 from kiwi.datatypes import converter, number, Decimal, ValidationError
 from kiwi.currency import currency # after datatypes
 from kiwi.enums import Alignment
 from kiwi.log import Logger
+from kiwi.model import Model
 from kiwi.python import enum, slicerange
+from kiwi import tasklet
 from kiwi.utils import PropertyObject, gsignal, gproperty, type_register
 from kiwi.ui.widgets.contextmenu import ContextMenu
 
@@ -142,6 +145,13 @@ class Column(PropertyObject, gobject.GObject):
         -  a callable which will be used to sort the contents of the column.
            The function will take two values (x and y) from the column and
            should return negative if x<y, zero if x==y, positive if x>y.
+      - B{cache}: bool I{False}
+        - if true the text displayed in the cells is cached instead of
+          being formatted each time a cell is drawn. The cached text of a
+          row is discarded by L{ObjectList.update}, L{ObjectList.refresh},
+          when a cell of the row is edited and, for L{kiwi.model.Model}
+          instances, when the attribute displayed is set.
+          Only use it for columns of text, numbers and dates.
     """
     __gtype_name__ = 'Column'
     gproperty('attribute', str, flags=(gobject.PARAM_READWRITE | gobject.PARAM_CONSTRUCT_ONLY))
@@ -169,6 +179,7 @@ class Column(PropertyObject, gobject.GObject):
     gproperty('font-desc', str)
     gproperty('column', str)
     gproperty('sort_func', object, default=None)
+    gproperty('cache', bool, default=False)
     #gproperty('title_pixmap', str)
 
     # This can be set in subclasses, to be able to allow custom
@@ -207,6 +218,7 @@ class Column(PropertyObject, gobject.GObject):
             raise AttributeError(msg)
 
         self._objectlist = None
+        self._formatter = None
         self.compare = None
         self.from_string = None
 
@@ -265,8 +277,17 @@ class Column(PropertyObject, gobject.GObject):
             conv = converter.get_converter(data)
             self.compare = self.compare or conv.get_compare_function()
             self.from_string = conv.from_string
+        self._formatter = None
         return data
 
+    def prop_set_format(self, format):
+        self._formatter = None
+        return format
+
+    def prop_set_format_func(self, format_func):
+        self._formatter = None
+        return format_func
+
     def attach(self, objectlist):
         self._objectlist = objectlist
 
@@ -324,8 +345,13 @@ class Column(PropertyObject, gobject.GObject):
             expand = True
         treeview_column.pack_start(renderer, expand)
 
-        treeview_column.set_cell_data_func(renderer, cell_data_func,
-                                           (self, renderer_prop))
+        if isinstance(objectlist, ObjectTree):
+            treeview_column.set_cell_data_func(
+                renderer, self._cell_data_tree_func,
+                (cell_data_func, (self, renderer_prop)))
+        else:
+            treeview_column.set_cell_data_func(renderer, cell_data_func,
+                                               (self, renderer_prop))
         treeview_column.set_visible(self.visible)
 
         if self.width:
@@ -430,6 +456,15 @@ class Column(PropertyObject, gobject.GObject):
         return renderer, prop
 
     # CellRenderers
+    def _cell_data_tree_func(self, tree_column, renderer, model, treeiter,
+                             (cell_data_func, data)):
+        "To hide the placeholder rows of a tree, see ObjectTree"
+        if model.get_value(treeiter, COL_MODEL) is _placeholder:
+            renderer.set_property('visible', False)
+            return
+        renderer.set_property('visible', True)
+        cell_data_func(tree_column, renderer, model, treeiter, data)
+
     def _cell_data_text_func(self, tree_column, renderer, model, treeiter,
                              (column, renderer_prop)):
         "To render the data of a cell renderer text"
@@ -445,10 +480,12 @@ class Column(PropertyObject, gobject.GObject):
             else:
                 raise AssertionError
 
-        data = column.get_attribute(row[COL_MODEL],
-                                    column.attribute, None)
-
-        text = column.as_string(data)
+        if column.cache:
+            text = self._objectlist._get_cell_text(row[COL_MODEL], column)
+        else:
+            data = column.get_attribute(row[COL_MODEL],
+                                        column.attribute, None)
+            text = column.as_string(data)
 
         renderer.set_property(renderer_prop, text)
 
@@ -568,32 +605,41 @@ class Column(PropertyObject, gobject.GObject):
         # XXX convert new_text to the proper data type
         setattr(self._model[path][COL_MODEL], column.attribute, value)
 
+    def _get_formatter(self):
+        # The function used by as_string, it is looked up again when
+        # the data type or the format of the column changes
+        if self.format_func:
+            return self.format_func
+        data_type = self.data_type
+        if (self.format or
+            data_type in (float, Decimal, currency, datetime.date,
+                          datetime.datetime, datetime.time) or
+            issubclass(data_type, enum)):
+            return converter.get_formatter(data_type, self.format or None)
+        return lambda data: data
+
     # Public API
 
-    # This is meant to be subclassable, we're using kgetattr, as
-    # a staticmethod as an optimization, so we can avoid a function call.
-    get_attribute = staticmethod(kgetattr)
+    # This is meant to be subclassable, it takes the same arguments as
+    # kgetattr. The getter of an attribute is only compiled once, so
+    # rendering a cell costs little more than a plain attribute access.
+    def get_attribute(instance, attribute, *default):
+        return compile_getter(attribute)(instance, *default)
+    get_attribute = staticmethod(get_attribute)
 
-    def as_string(self, data):
-        data_type = self.data_type
-        if data is None and data_type != gdk.Pixbuf:
-            text = ''
-        elif self.format_func:
-            text = self.format_func(data)
-        elif (self.format or
-            data_type == float or
-            data_type == Decimal or
-            data_type == currency or
-            data_type == datetime.date or
-            data_type == datetime.datetime or
-            data_type == datetime.time or
-            issubclass(data_type, enum)):
-            conv = converter.get_converter(data_type)
-            text = conv.as_string(data, format=self.format or None)
-        else:
-            text = data
+    # The values of attribute of several instances, it should be
+    # overridden together with get_attribute.
+    def get_attributes(instances, attribute, *default):
+        return kgetattr_many(instances, attribute, *default)
+    get_attributes = staticmethod(get_attributes)
 
-        return text
+    def as_string(self, data):
+        if data is None and self.data_type != gdk.Pixbuf:
+            return ''
+        formatter = self._formatter
+        if formatter is None:
+            formatter = self._formatter = self._get_formatter()
+        return formatter(data)
 
     def set_spinbutton_precision_digits(self, digits):
         """Set the number of precision digits to be shown in the
@@ -818,6 +864,205 @@ class _ContextMenu(gtk.Menu):
 COL_MODEL = 0
 
 _marker = object()
+# Marks the key of instances without the key attribute of the list
+_no_key = object()
+# The only child of a tree row whose children are not loaded yet
+_placeholder = object()
+
+class _RowTextCache(object):
+    """
+    The cached texts of a row, by column. When the instance of the row
+    is a Model it is registered as a proxy for the cached attributes, so
+    the texts are forgotten when one of them is set. It stays registered
+    until the row is removed or the list is cleared.
+    """
+    def __init__(self, objectlist, key, instance):
+        self.objectlist = objectlist
+        self.key = key
+        self.instance = instance
+        self.texts = {}
+        self._attributes = []
+
+    def add(self, column, text):
+        self.texts[column] = text
+        if not isinstance(self.instance, Model):
+            return
+        # Only changes to the first level of a dotted attribute are noticed
+        attribute = column.attribute.split('.')[0]
+        if not attribute in self._attributes:
+            self.instance.register_proxy_for_attribute(attribute, self)
+            self._attributes.append(attribute)
+
+    def discard(self):
+        if self._attributes:
+            self.instance.unregister_proxy(self)
+            self._attributes = []
+
+    # Proxy API, called by Model.notify_proxies
+
+    def update(self, attribute, value=None, block=False):
+        # Unregistering here would modify the list of proxies which
+        # Model.notify_proxies is going through, and skip the next one
+        self.texts = {}
+        self.objectlist._row_texts_changed(self.key)
+
+def _get_attribute_values(column, instances, attribute):
+    # The values of attribute of instances, or None for the missing
+    # ones, fetched like column does. A subclass which only overrides
+    # get_attribute is called for each instance.
+    if (column.get_attribute is not Column.get_attribute and
+        column.get_attributes is Column.get_attributes):
+        get_attribute = column.get_attribute
+        return [get_attribute(instance, attribute, None)
+                for instance in instances]
+    return column.get_attributes(instances, attribute, None)
+
+def _check_lazy_sizes(page_size, cache_size):
+    if page_size is not None and page_size < 1:
+        raise ValueError("page_size must be positive, not %r" % (
+            page_size,))
+    # The iter being used and the one being fetched might live in
+    # different pages, so we always need to keep at least two around
+    if cache_size is not None and cache_size < 2:
+        raise ValueError("cache_size must be at least 2, not %r" % (
+            cache_size,))
+
+class LazyObjectModel(gtk.GenericTreeModel):
+    """
+    A read-only model which does not copy its instances up front.
+
+    Instances are fetched in pages the first time the view asks for them,
+    from any sequence or database result set which can be sliced and
+    supports len() or count() (SQLObject, Storm and SQLAlchemy results all
+    qualify). At most cache_size pages are kept in memory at the same time,
+    plus a row reference for each row the view has asked for.
+
+    You normally don't create this yourself, see
+    L{ObjectList.set_lazy_results}.
+    """
+
+    def __init__(self, results=None, page_size=100, cache_size=10):
+        """
+        Create a new LazyObjectModel object.
+        @param results: a sequence or result set, or None
+        @param page_size: number of instances fetched at a time
+        @param cache_size: maximum number of pages kept in memory
+        """
+        gtk.GenericTreeModel.__init__(self)
+        # Row references are kept alive by the model until the results
+        # are replaced, so there is no need for pygtk to leak a reference
+        # for each iter it creates
+        self.set_property('leak-references', False)
+
+        self.set_results(results or [], page_size, cache_size)
+
+    def set_results(self, results, page_size=None, cache_size=None):
+        """
+        Replaces the results displayed by the model.
+        Views should be detached from the model before calling this.
+        @param results: a sequence or result set
+        @param page_size: number of instances fetched at a time, or None
+          to keep the current one
+        @param cache_size: maximum number of pages kept in memory, or
+          None to keep the current one
+        """
+        _check_lazy_sizes(page_size, cache_size)
+        if page_size is not None:
+            self._page_size = page_size
+        if cache_size is not None:
+            self._cache_size = cache_size
+
+        self._results = results
+        try:
+            self._length = len(results)
+        except TypeError:
+            # SQLObject and Storm result sets only provide count()
+            self._length = results.count()
+        self._pages = {}
+        # page numbers, least recently used first
+        self._lru = []
+        # index -> row reference, of all the iters handed out. The
+        # iters kept by the view or the application point to them, so
+        # they must outlive the pages, which are evicted
+        self._rowrefs = {}
+        self.invalidate_iters()
+
+    def get_results(self):
+        """
+        @returns: the results displayed by the model
+        """
+        return self._results
+
+    def _get_page(self, index):
+        page_size = self._page_size
+        page_no = index // page_size
+        lru = self._lru
+        page = self._pages.get(page_no)
+        if page is None:
+            start = page_no * page_size
+            end = min(start + page_size, self._length)
+            page = list(self._results[start:end])
+            self._pages[page_no] = page
+            if len(lru) >= self._cache_size:
+                del self._pages[lru.pop(0)]
+        else:
+            lru.remove(page_no)
+        lru.append(page_no)
+        return page, index - page_no * page_size
+
+    def _get_rowref(self, index):
+        rowref = self._rowrefs.get(index)
+        if rowref is None:
+            rowref = self._rowrefs[index] = index
+        return rowref
+
+    # GenericTreeModel
+
+    def on_get_flags(self):
+        return gtk.TREE_MODEL_LIST_ONLY
+
+    def on_get_n_columns(self):
+        return 1
+
+    def on_get_column_type(self, index):
+        return object
+
+    def on_get_iter(self, path):
+        index = path[0]
+        if index < self._length:
+            return self._get_rowref(index)
+
+    def on_get_path(self, rowref):
+        return (rowref,)
+
+    def on_get_value(self, rowref, column):
+        instances, offset = self._get_page(rowref)
+        return instances[offset]
+
+    def on_iter_next(self, rowref):
+        index = rowref + 1
+        if index < self._length:
+            return self._get_rowref(index)
+
+    def on_iter_children(self, parent):
+        if parent is None and self._length:
+            return self._get_rowref(0)
+
+    def on_iter_has_child(self, rowref):
+        return False
+
+    def on_iter_n_children(self, rowref):
+        if rowref is None:
+            return self._length
+        return 0
+
+    def on_iter_nth_child(self, parent, n):
+        if parent is None and 0 <= n < self._length:
+            return self._get_rowref(n)
+
+    def on_iter_parent(self, child):
+        return None
+
 
 class ObjectList(PropertyObject, gtk.ScrolledWindow):
     """
@@ -865,6 +1110,12 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
       - B{has-rows} (list, bool):
         - Emitted when the objectlist goes from an empty to a non-empty
           state or vice verse.
+      - B{load-progress} (list, int):
+        - Emitted after each chunk of an incremental L{add_list} was
+          added, with the number of instances loaded so far.
+      - B{load-finished} (list):
+        - Emitted when an incremental L{add_list} finished loading
+          all the instances. It is not emitted if the load is cancelled.
 
     Properties
     ==========
@@ -895,6 +1146,12 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
     # emitted when empty or non-empty status changes
     gsignal('has-rows', bool)
 
+    # number of instances loaded so far by an incremental add_list
+    gsignal('load-progress', int)
+
+    # emitted when an incremental add_list is done
+    gsignal('load-finished')
+
     gproperty('selection-mode', gtk.SelectionMode,
               default=gtk.SELECTION_BROWSE, nick="SelectionMode")
 
@@ -902,7 +1159,8 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
                  objects=None,
                  mode=gtk.SELECTION_BROWSE,
                  sortable=False,
-                 model=None):
+                 model=None,
+                 key=None):
         """
         Create a new ObjectList object.
         @param columns:       a list of L{Column}s
@@ -910,6 +1168,10 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         @param mode:          selection mode
         @param sortable:      whether the user can sort the list
         @param model:         gtk.TreeModel to use or None to create one
+        @param key:           how rows are identified, the name of an
+          attribute (eg the primary key of a database object) or a callable
+          taking an instance. Instances with the same key are considered
+          to be the same row. If None, the identity of instances is used.
         """
         if columns is None:
             columns = []
@@ -930,11 +1192,48 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
 
         self._sortable = sortable
 
+        if key is None:
+            get_key = id
+        elif isinstance(key, basestring):
+            # Instances without the attribute are keyed by identity,
+            # so they do not match any other row
+            getter = compile_getter(key)
+            def get_key(instance):
+                value = getter(instance, _no_key)
+                if value is _no_key:
+                    return (_no_key, id(instance))
+                return value
+        elif callable(key):
+            get_key = key
+        else:
+            raise TypeError(
+                "key must be an attribute name or a callable, not %r" % (
+                key,))
+        self._get_key = get_key
+        # If rows are compared by key instead of equality
+        self._has_key = key is not None
+
         self._columns = []
-        # Mapping of instance id -> treeiter
+        # Mapping of instance key -> treeiter
         self._iters = {}
+        # Mapping of instance key -> number of rows, an instance can
+        # be added more than once
+        self._counts = {}
+        # Mapping of instance key -> _RowTextCache, for cached columns
+        self._text_cache = {}
+        # Mapping of attribute -> instance key -> value, for sorting
+        self._sort_values = {}
+        # Aggregates following the rows of the list
+        self._aggregates = []
+        # List of (get_value, compare, descending) the rows are sorted by,
+        # most significant first, and the treeview column showing it
+        self._sort_keys = []
+        self._sort_column = None
         self._autosize = True
         self._vscrollbar = None
+        # idle source of an incremental load in progress
+        self._load_source_id = None
+        self._load_count = 0
 
         gtk.ScrolledWindow.__init__(self)
 
@@ -1013,7 +1312,7 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
 
     def __contains__(self, instance):
         "item in list"
-        return bool(self._iters.get(id(instance), False))
+        return bool(self._iters.get(self._get_key(instance), False))
 
     def __iter__(self):
         "for item in list"
@@ -1050,13 +1349,23 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         "list[n] = m"
         if isinstance(arg, (int, gtk.TreeIter, str)):
             model = self._model
-            olditem = model[arg][COL_MODEL]
-            model[arg] = (item,)
+            treeiter = model[arg].iter
+            olditem = model[treeiter][COL_MODEL]
+            model[treeiter] = (item,)
 
             # Update iterator cache
             iters = self._iters
-            iters[id(item)] = model[arg].iter
-            del iters[id(olditem)]
+            oldkey = self._get_key(olditem)
+            del iters[oldkey]
+            self._uncount(oldkey)
+            self._discard_row_caches(oldkey)
+            key = self._get_key(item)
+            iters[key] = treeiter
+            self._counts[key] = self._counts.get(key, 0) + 1
+            if self._sort_keys:
+                self._resort_row(treeiter)
+            if self._aggregates:
+                self._update_aggregates([(key, item)], [oldkey])
 
         elif isinstance(arg, slice):
             raise NotImplementedError("slices for list are not implemented")
@@ -1087,18 +1396,32 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         if start is not None or stop is not None:
             raise NotImplementedError("start and stop")
 
-        treeiter = self._iters.get(id(item), _marker)
+        treeiter = self._iters.get(self._get_key(item), _marker)
         if treeiter is _marker:
             raise ValueError("item %r is not in the list" % item)
 
         return self._model[treeiter].path[0]
 
     def count(self, item):
-        "L.count(item) -> integer -- return number of occurrences of value"
+        """L.count(item) -> integer -- return number of occurrences of value
+        Only the top level rows are counted. They are counted if their
+        instance is equal to item or, if the list was created with a key,
+        has the same key as item.
+        """
+        model = self._model
+        if self._has_key:
+            key = self._get_key(item)
+            # The counts of a tree include the children
+            if isinstance(model, gtk.ListStore):
+                return self._counts.get(key, 0)
+            get_key = self._get_key
+            match = lambda instance: get_key(instance) == key
+        else:
+            match = lambda instance: instance == item
 
         count = 0
-        for row in self._model:
-            if row[COL_MODEL] == item:
+        for row in model:
+            if match(row[COL_MODEL]):
                 count += 1
         return count
 
@@ -1108,10 +1431,18 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         @param instance: the instance to be added (according to the columns spec)
         @param select: whether or not the new item should appear selected.
         """
+        self._check_writable()
         self._treeview.freeze_notify()
 
+        # A sorted list decides the position itself
+        if self._sort_keys:
+            index = self._get_sort_position(instance)
         row_iter = self._model.insert(index, (instance,))
-        self._iters[id(instance)] = row_iter
+        key = self._get_key(instance)
+        self._iters[key] = row_iter
+        self._counts[key] = self._counts.get(key, 0) + 1
+        if self._aggregates:
+            self._update_aggregates([(key, instance)])
 
         if self._autosize:
             self._treeview.columns_autosize()
@@ -1145,13 +1476,68 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         @param order: one of gtk.SORT_ASCENDING, gtk.SORT_DESCENDING
         @type order: gtk.SortType
         """
-        def _sort_func(model, iter1, iter2):
-            return cmp(
-                getattr(model[iter1][0], attribute, None),
-                getattr(model[iter2][0], attribute, None))
-        unused_sort_col_id = len(self._columns)
-        self._model.set_sort_func(unused_sort_col_id, _sort_func)
-        self._model.set_sort_column_id(unused_sort_col_id, order)
+        self.sort_by_attributes([attribute], order)
+
+    def sort_by_attributes(self, attributes, order=gtk.SORT_ASCENDING):
+        """
+        Sort by several attributes in the object model, see L{sort_by}.
+
+        @param attributes: attributes to sort on
+        @type attributes: list of strings
+        @param order: one of gtk.SORT_ASCENDING, gtk.SORT_DESCENDING
+        @type order: gtk.SortType
+        """
+        self.sort_by([(attribute, order) for attribute in attributes])
+
+    def sort_by(self, keys):
+        """
+        Sort by several attributes in the object model. Rows are sorted
+        by the first attribute, rows with equal values for it by the
+        second one and so on. The sort is stable, rows which are equal
+        for all the attributes keep their current order.
+
+        The list stays sorted, rows added later are inserted at their
+        sorted position. Attributes of a column are compared using the
+        sort function of the column.
+
+        The values of the rows are cached, if an instance is modified
+        L{update} must be called for it to be sorted again.
+
+        Example::
+
+          klist.sort_by([('date', gtk.SORT_DESCENDING),
+                         ('client.name', gtk.SORT_ASCENDING)])
+
+        @param keys: a list of (attribute, order) tuples, order is one of
+          gtk.SORT_ASCENDING, gtk.SORT_DESCENDING
+        """
+        if not isinstance(self._model, (gtk.ListStore, gtk.TreeStore)):
+            raise TypeError("Only a gtk.ListStore or a gtk.TreeStore "
+                            "can be sorted, not %r" % (self._model,))
+
+        sort_keys = []
+        treeview_column = None
+        for attribute, order in keys:
+            for column in self._columns:
+                if column.attribute == attribute:
+                    sort_keys.append(self._get_column_sort_key(column, order))
+                    break
+            else:
+                column = None
+                sort_keys.append(
+                    (attribute,
+                     lambda instance, attribute=attribute:
+                         Column.get_attribute(instance, attribute, None),
+                     lambda instances, attribute=attribute:
+                         _get_attribute_values(Column, instances, attribute),
+                     cmp, order == gtk.SORT_DESCENDING))
+            if len(sort_keys) == 1:
+                if column is not None:
+                    treeview_column = self.get_treeview_column(column)
+                first_order = order
+        if not sort_keys:
+            raise ValueError("keys can not be empty")
+        self._set_sort(sort_keys, treeview_column, first_order)
 
     def set_context_menu(self, menu):
         """Sets a context-menu (eg, when you right click) for the list.
@@ -1174,8 +1560,8 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
     # Columns handling
 
     def _load(self, instances, clear):
+        self._check_writable()
         # do nothing if empty list or None provided
-        model = self._model
         if clear:
             if not instances:
                 self.unselect_all()
@@ -1183,57 +1569,54 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
                 return
 
         model = self._model
-        iters = self._iters
-
-        old_instances = [row[COL_MODEL] for row in model]
-
-        # Save selection
-        selected_instances = []
-        if old_instances:
-            selection = self._treeview.get_selection()
-            _, paths = selection.get_selected_rows()
-            if paths:
-                selected_instances = [model[path][COL_MODEL]
-                                          for (path,) in paths]
-
-        iters = self._iters
-        prev = None
+        # Sorting all the rows at once is a lot faster than finding
+        # the sorted position of each one of them, unless only a few
+        # rows are added to the list
+        insert_sorted = False
         # Do not always just clear the list, check if we have the same
         # instances in the list we want to insert and merge in the new
-        # items
+        # items. This keeps the selection and the scroll position
         if clear:
-            for instance in iter(instances):
-                objid = id(instance)
-                # If the instance is not in the list insert it after
-                # the previous inserted object
-                if not objid in iters:
-                    if prev is None:
-                        prev = model.append((instance,))
-                    else:
-                        prev = model.insert_after(prev, (instance,))
-                    iters[objid] = prev
-                else:
-                    prev = iters[objid]
-
-            # Optimization when we were empty, we wont need to remove anything
-            # nor restore selection
-            if old_instances:
-                # Remove
-                objids = [id(instance) for instance in instances]
-                for instance in old_instances:
-                    objid = id(instance)
-                    if objid in objids:
-                        continue
-                    self._remove(objid)
+            self._merge(instances)
+            if self._aggregates:
+                self._update_aggregates(reset=True)
         else:
+            iters = self._iters
+            counts = self._counts
+            get_key = self._get_key
+            added = []
+            # Instances are added to the top level of a tree
+            if isinstance(model, gtk.TreeStore):
+                append = lambda row: model.append(None, row)
+                insert = lambda position, row: model.insert(None, position,
+                                                            row)
+            else:
+                append = model.append
+                insert = model.insert
+            if self._sort_keys:
+                instances = list(instances)
+                insert_sorted = len(instances) < len(model)
+            if insert_sorted:
+                # The new rows are sorted by themselves, so each one
+                # goes after the position of the previous one
+                instances = self._sort_instances(instances)
+            position = 0
             for instance in iter(instances):
-                iters[id(instance)] = model.append((instance,))
+                key = get_key(instance)
+                if insert_sorted:
+                    position = self._get_sort_position(instance, None,
+                                                       position)
+                    iters[key] = insert(position, (instance,))
+                    position += 1
+                else:
+                    iters[key] = append((instance,))
+                counts[key] = counts.get(key, 0) + 1
+                added.append((key, instance))
+            if self._aggregates:
+                self._update_aggregates(added)
 
-        # Restore selection
-        for instance in selected_instances:
-            objid = id(instance)
-            if objid in iters:
-                selection.select_iter(iters[objid])
+        if self._sort_keys and not insert_sorted:
+            self._sort()
 
         # As soon as we have data for that list, we can autosize it, and
         # we don't want to autosize again, or we may cancel user
@@ -1242,6 +1625,130 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
             self._treeview.columns_autosize()
             self._autosize = False
 
+    def _merge(self, instances):
+        # Makes the model contain instances, in the same order, using as
+        # few row operations as possible: rows of instances which are
+        # already in the list are kept and, unless the model is sorted,
+        # moved in a single reorder. Everything is done with hash lookups
+        # so this is linear in the size of the list and of instances.
+        model = self._model
+        get_key = self._get_key
+
+        # Unique keys of the new instances, in order
+        new_keys = []
+        new_instances = {}
+        for instance in iter(instances):
+            key = get_key(instance)
+            if key in new_instances:
+                continue
+            new_instances[key] = instance
+            new_keys.append(key)
+
+        # Rows which are going to be kept, in the current order
+        kept_keys = []
+        removed = []
+        removed_keys = []
+        replaced = []
+        self._iters = iters = {}
+        self._counts = counts = {}
+        for row in model:
+            instance = row[COL_MODEL]
+            key = get_key(instance)
+            if key in new_instances and not key in iters:
+                iters[key] = row.iter
+                counts[key] = 1
+                kept_keys.append(key)
+                # An equal instance, eg the same database row fetched again
+                if new_instances[key] is not instance:
+                    replaced.append(key)
+            else:
+                removed.append(row.iter)
+                if not key in new_instances:
+                    removed_keys.append(key)
+                for treeiter in self._iter_descendants(row.iter):
+                    removed_keys.append(
+                        get_key(model.get_value(treeiter, COL_MODEL)))
+
+        for treeiter in removed:
+            model.remove(treeiter)
+
+        # The children of a tree row are kept with it, unless they are
+        # going to be top level rows
+        for key in kept_keys:
+            self._remove_children_in(iters[key], iters, new_instances,
+                                     removed_keys)
+            for treeiter in self._iter_descendants(iters[key]):
+                child_key = get_key(model.get_value(treeiter, COL_MODEL))
+                iters.setdefault(child_key, treeiter)
+                counts[child_key] = counts.get(child_key, 0) + 1
+        for key in removed_keys:
+            self._discard_row_caches(key)
+        for key in replaced:
+            self._discard_row_caches(key)
+            model.set(iters[key], COL_MODEL, new_instances[key])
+
+        # Insert each new instance after the one preceding it, in a
+        # tree the instances are the top level rows
+        is_tree = isinstance(model, gtk.TreeStore)
+        prev = None
+        for key in new_keys:
+            treeiter = iters.get(key)
+            if treeiter is None:
+                row = (new_instances[key],)
+                if prev is None and is_tree:
+                    treeiter = model.prepend(None, row)
+                elif prev is None:
+                    treeiter = model.prepend(row)
+                elif is_tree:
+                    treeiter = model.insert_after(None, prev, row)
+                else:
+                    treeiter = model.insert_after(prev, row)
+                iters[key] = treeiter
+                counts[key] = 1
+            prev = treeiter
+
+        # The rows are only in the right order now if the rows which were
+        # kept did not change their relative order, otherwise move them
+        if (not kept_keys or self._sort_keys or
+            model.get_sort_column_id()[0] is not None):
+            return
+        kept = set(kept_keys)
+        if kept_keys == [key for key in new_keys if key in kept]:
+            return
+
+        positions = {}
+        for row in model:
+            positions[get_key(row[COL_MODEL])] = row.path[0]
+        order = [positions[key] for key in new_keys]
+        if is_tree:
+            model.reorder(None, order)
+        else:
+            model.reorder(order)
+
+    def _remove_children_in(self, parent, iters, new_instances,
+                            removed_keys):
+        # Removes the rows below parent whose instance is in
+        # new_instances but not yet a top level row, along with their
+        # children, so _merge can insert them at the top level
+        model = self._model
+        get_key = self._get_key
+        treeiter = model.iter_children(parent)
+        while treeiter is not None:
+            next_iter = model.iter_next(treeiter)
+            instance = model.get_value(treeiter, COL_MODEL)
+            if instance is not _placeholder:
+                key = get_key(instance)
+                if key in new_instances and not key in iters:
+                    removed_keys.append(key)
+                    for child in self._iter_descendants(treeiter):
+                        removed_keys.append(
+                            get_key(model.get_value(child, COL_MODEL)))
+                    model.remove(treeiter)
+                else:
+                    self._remove_children_in(treeiter, iters, new_instances,
+                                             removed_keys)
+            treeiter = next_iter
+
     def _setup_columns(self, columns):
         searchable = None
         sorted = None
@@ -1287,14 +1794,25 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
                        self._on_treeview_header__button_release_event)
 
         index = self._columns.index(column)
-        if self._sortable:
-            self._model.set_sort_func(index,
-                                      self._model_sort_func,
-                                      (column, column.attribute))
+        model = self._model
+        # ListStores and TreeStores are sorted by ourselves, see _sort()
+        sort_rows = isinstance(model, (gtk.ListStore, gtk.TreeStore))
+        if self._sortable and sort_rows:
+            if not column.column:
+                treeview_column.connect('clicked',
+                                        self._on_treeview_column__clicked,
+                                        column)
+        elif self._sortable and isinstance(model, gtk.TreeSortable):
+            model.set_sort_func(index,
+                                self._model_sort_func,
+                                (column, column.attribute))
             treeview_column.set_sort_column_id(index)
 
-        if column.sorted:
-            self._model.set_sort_column_id(index, column.order)
+        if column.sorted and sort_rows:
+            self._set_sort([self._get_column_sort_key(column, column.order)],
+                           treeview_column, column.order)
+        elif column.sorted and isinstance(model, gtk.TreeSortable):
+            model.set_sort_column_id(index, column.order)
 
         if column.searchable:
             if not issubclass(column.data_type, basestring):
@@ -1312,12 +1830,250 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         if column.expander:
             self._treeview.set_expander_column(treeview_column)
 
+    def _get_cell_text(self, instance, column):
+        key = self._get_key(instance)
+        cache = self._text_cache.get(key)
+        # Another instance with the same key replaced the one cached
+        if cache is not None and cache.instance is not instance:
+            self._discard_row_caches(key)
+            cache = None
+        if cache is None:
+            cache = self._text_cache[key] = _RowTextCache(self, key, instance)
+
+        text = cache.texts.get(column, _marker)
+        if text is _marker:
+            data = column.get_attribute(instance, column.attribute, None)
+            text = column.as_string(data)
+            cache.add(column, text)
+        return text
+
+    def _discard_row_caches(self, key=_marker):
+        # Discards the cached texts and sort values of a row, or of
+        # all rows
+        if key is _marker:
+            self._sort_values = {}
+            caches = self._text_cache.values()
+            self._text_cache = {}
+        else:
+            for values in self._sort_values.itervalues():
+                values.pop(key, None)
+            cache = self._text_cache.pop(key, None)
+            if cache is None:
+                return
+            caches = [cache]
+        for cache in caches:
+            cache.discard()
+
+    def _row_texts_changed(self, key):
+        # The attributes of the instance of a row changed, its sort
+        # values have to be fetched again and its cells redrawn
+        for values in self._sort_values.itervalues():
+            values.pop(key, None)
+        treeiter = self._iters.get(key)
+        if treeiter is not None:
+            model = self._model
+            model.row_changed(model.get_path(treeiter), treeiter)
+
+    def _load_chunk(self, instances, chunk_size):
+        chunk = list(itertools.islice(instances, chunk_size))
+        self._treeview.freeze_notify()
+        self._load(chunk, clear=False)
+        self._treeview.thaw_notify()
+
+        finished = len(chunk) < chunk_size
+        if finished:
+            self._load_source_id = None
+        self._load_count += len(chunk)
+        self.emit('load-progress', self._load_count)
+        if finished:
+            self.emit('load-finished')
+        return not finished
+
+    def _setup_lazy_view(self):
+        # The treeview would otherwise measure every row of the
+        # model to calculate the height of the list, fetching all of them
+        treeview = self._treeview
+        for treeview_column in treeview.get_columns():
+            treeview_column.set_sort_column_id(-1)
+            treeview_column.set_sort_indicator(False)
+            if treeview_column.get_sizing() != gtk.TREE_VIEW_COLUMN_FIXED:
+                width = treeview_column.get_width() or 100
+                treeview_column.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+                treeview_column.set_fixed_width(width)
+        treeview.set_fixed_height_mode(True)
+        self._autosize = False
+        self._sort_keys = []
+        self._sort_column = None
+
+    def _get_column_sort_key(self, column, order):
+        attribute = column.attribute
+        get_attribute = column.get_attribute
+        return (attribute,
+                lambda instance: get_attribute(instance, attribute, None),
+                lambda instances: _get_attribute_values(column, instances,
+                                                        attribute),
+                column.compare or cmp, order == gtk.SORT_DESCENDING)
+
+    def _set_sort(self, sort_keys, treeview_column, order):
+        if self._sort_column not in (None, treeview_column):
+            self._sort_column.set_sort_indicator(False)
+        self._sort_keys = sort_keys
+        self._sort_column = treeview_column
+        if treeview_column is not None:
+            treeview_column.set_sort_indicator(True)
+            treeview_column.set_sort_order(order)
+        if sort_keys:
+            self._sort()
+
+    def _sort(self, parent=None):
+        # Sorts the children of parent and their children. The key of
+        # each row is fetched only once and the rows are sorted in
+        # python, instead of letting GTK+ call a python compare function
+        # for every comparison, then moved with a single reorder().
+        # Sorting by the least significant key first keeps it stable.
+        model = self._model
+        instances = []
+        parents = []
+        treeiter = model.iter_children(parent)
+        while treeiter is not None:
+            instances.append(model.get_value(treeiter, COL_MODEL))
+            if model.iter_has_child(treeiter):
+                parents.append(treeiter)
+            treeiter = model.iter_next(treeiter)
+
+        if len(instances) > 1:
+            self._sort_level(parent, instances)
+
+        for treeiter in parents:
+            self._sort(treeiter)
+
+    def _sort_level(self, parent, instances):
+        model = self._model
+        keys = map(self._get_key, instances)
+        order = range(len(instances))
+        for (attribute, get_value, get_values, compare,
+             descending) in reversed(self._sort_keys):
+            cache = self._sort_values.setdefault(attribute, {})
+            if not cache:
+                # Sorting by this key for the first time, fetch the
+                # values of all the rows at once
+                values = get_values(instances)
+                cache.update(zip(keys, values))
+            else:
+                values = []
+                for key, instance in zip(keys, instances):
+                    try:
+                        value = cache[key]
+                    except KeyError:
+                        value = cache[key] = get_value(instance)
+                    values.append(value)
+            if compare is cmp:
+                order.sort(key=values.__getitem__, reverse=descending)
+            else:
+                order.sort(compare, values.__getitem__, descending)
+
+        if order != range(len(instances)):
+            if isinstance(model, gtk.TreeStore):
+                model.reorder(parent, order)
+            else:
+                model.reorder(order)
+
+    def _sort_instances(self, instances):
+        # Returns instances sorted like the rows of the list
+        values = map(self._get_sort_values, instances)
+        compare = self._compare_sort_values
+        order = range(len(instances))
+        order.sort(lambda a, b: compare(values[a], values[b]))
+        return [instances[i] for i in order]
+
+    def _get_sort_values(self, instance):
+        # The values of instance for each sort key, they are cached
+        # until the row is updated
+        key = self._get_key(instance)
+        values = []
+        for (attribute, get_value, get_values, compare,
+             descending) in self._sort_keys:
+            cache = self._sort_values.setdefault(attribute, {})
+            try:
+                value = cache[key]
+            except KeyError:
+                value = cache[key] = get_value(instance)
+            values.append(value)
+        return values
+
+    def _compare_sort_values(self, values1, values2):
+        for i, (attribute, get_value, get_values, compare,
+                descending) in enumerate(self._sort_keys):
+            retval = compare(values1[i], values2[i])
+            if retval:
+                if descending:
+                    return -retval
+                return retval
+        return 0
+
+    def _get_sort_position(self, instance, parent=None, start=0, end=None):
+        # Binary search of the position of instance among the children
+        # of parent, after the rows which are equal to it
+        model = self._model
+        values = self._get_sort_values(instance)
+        if end is None:
+            end = model.iter_n_children(parent)
+        while start < end:
+            middle = (start + end) // 2
+            other = model.get_value(model.iter_nth_child(parent, middle),
+                                    COL_MODEL)
+            if self._compare_sort_values(
+                values, self._get_sort_values(other)) < 0:
+                end = middle
+            else:
+                start = middle + 1
+        return start
+
+    def _resort_row(self, treeiter):
+        # Moves a row whose sort key may have changed to its sorted
+        # position, which is usually where it already is
+        model = self._model
+        instance = model.get_value(treeiter, COL_MODEL)
+        values = self._get_sort_values(instance)
+        parent = model.iter_parent(treeiter)
+        index = model.get_path(treeiter)[-1]
+        if index > 0:
+            prev = model.get_value(model.iter_nth_child(parent, index - 1),
+                                   COL_MODEL)
+            if self._compare_sort_values(
+                self._get_sort_values(prev), values) > 0:
+                position = self._get_sort_position(instance, parent, 0, index)
+                model.move_before(treeiter,
+                                  model.iter_nth_child(parent, position))
+                return
+
+        following = model.iter_next(treeiter)
+        if following is None:
+            return
+        following = model.get_value(following, COL_MODEL)
+        if self._compare_sort_values(
+            values, self._get_sort_values(following)) > 0:
+            position = self._get_sort_position(instance, parent, index + 1)
+            model.move_after(treeiter,
+                             model.iter_nth_child(parent, position - 1))
+
+    def _check_writable(self):
+        if isinstance(self._model, LazyObjectModel):
+            raise TypeError("A lazy list is read-only, use "
+                            "set_lazy_results() to change its contents")
+
     # selection methods
     def _select_and_focus_row(self, row_iter):
         self._treeview.set_cursor(self._model[row_iter].path)
 
     # handlers & callbacks
 
+    def do_cell_edited(self, instance, attribute):
+        key = self._get_key(instance)
+        self._discard_row_caches(key)
+        if self._aggregates:
+            self._update_aggregates([(key, instance)], [key])
+
     # Model
     def _on_model__row_inserted(self, model, path, iter):
         if len(model) == 1:
@@ -1327,6 +2083,22 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         if not len(model):
             self.emit('has-rows', False)
 
+    def _on_treeview_column__clicked(self, treeview_column, column):
+        if isinstance(self._model, LazyObjectModel):
+            return
+        if (self._sort_column is treeview_column and
+            treeview_column.get_sort_order() == gtk.SORT_ASCENDING):
+            order = gtk.SORT_DESCENDING
+        else:
+            order = gtk.SORT_ASCENDING
+        self._sort_by_column(column, treeview_column, order)
+
+    def _sort_by_column(self, column, treeview_column, order):
+        # Called when the header of a column is clicked, subclasses can
+        # override it to sort the rows some other way
+        self._set_sort([self._get_column_sort_key(column, order)],
+                       treeview_column, order)
+
     def _model_sort_func(self, model, iter1, iter2, (column, attr)):
         "This method is used to sort the GtkTreeModel"
         return column.compare(
@@ -1392,6 +2164,8 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
                 path, map(list, self._model))
             return
         item = row[COL_MODEL]
+        if item is _placeholder:
+            return
         self.emit('row-activated', item)
 
     def _get_selection_or_selected_rows(self):
@@ -1541,11 +2315,15 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         self._treeview.grab_focus()
 
     def _clear_columns(self):
+        self._sort_keys = []
+        self._sort_column = None
+
         # Reset the sort function for all model columns
         model = self._model
-        for i, column in enumerate(self._columns):
-            # Bug in PyGTK, it should be possible to remove a sort func.
-            model.set_sort_func(i, lambda m, i1, i2: -1)
+        if isinstance(model, gtk.TreeSortable):
+            for i, column in enumerate(self._columns):
+                # Bug in PyGTK, it should be possible to remove a sort func.
+                model.set_sort_func(i, lambda m, i1, i2: -1)
 
         # Remove all columns
         treeview = self._treeview
@@ -1567,6 +2345,8 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         self._clear_columns()
         self._columns = columns
         self._setup_columns(columns)
+        if isinstance(self._model, LazyObjectModel):
+            self._setup_lazy_view()
 
     def append(self, instance, select=False):
         """Adds an instance to the list.
@@ -1574,11 +2354,20 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         @param select: whether or not the new item should appear selected.
         """
 
+        self._check_writable()
         # Freeze and save original selection mode to avoid blinking
         self._treeview.freeze_notify()
 
-        row_iter = self._model.append((instance,))
-        self._iters[id(instance)] = row_iter
+        if self._sort_keys:
+            row_iter = self._model.insert(self._get_sort_position(instance),
+                                          (instance,))
+        else:
+            row_iter = self._model.append((instance,))
+        key = self._get_key(instance)
+        self._iters[key] = row_iter
+        self._counts[key] = self._counts.get(key, 0) + 1
+        if self._aggregates:
+            self._update_aggregates([(key, instance)])
 
         if self._autosize:
             self._treeview.columns_autosize()
@@ -1587,17 +2376,68 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
             self._select_and_focus_row(row_iter)
         self._treeview.thaw_notify()
 
-    def _remove(self, objid):
-        # linear search for the instance to remove
-        treeiter = self._iters.pop(objid)
+    def _remove(self, key):
+        treeiter = self._iters.pop(key)
         if not treeiter:
             return False
 
+        self._uncount(key)
+        self._discard_row_caches(key)
+        removed = [key]
+
+        # The children of a tree row are removed with it
+        model = self._model
+        for child_iter in self._iter_descendants(treeiter):
+            child_key = self._get_key(model.get_value(child_iter, COL_MODEL))
+            self._iters.pop(child_key, None)
+            self._uncount(child_key)
+            self._discard_row_caches(child_key)
+            removed.append(child_key)
+
         # All references to the iter gone, now it can be removed
-        self._model.remove(treeiter)
+        model.remove(treeiter)
+        if self._aggregates:
+            self._update_aggregates(removed=removed)
 
         return True
 
+    def _get_rows(self):
+        # The key and instance of all the rows, including the children
+        # of the rows of a tree
+        if isinstance(self._model, LazyObjectModel):
+            return []
+        model = self._model
+        get_key = self._get_key
+        rows = []
+        for treeiter in self._iter_descendants(None):
+            instance = model.get_value(treeiter, COL_MODEL)
+            rows.append((get_key(instance), instance))
+        return rows
+
+    def _update_aggregates(self, added=(), removed=(), reset=False):
+        for aggregate in self._aggregates:
+            aggregate._update(added, removed, reset)
+
+    def _uncount(self, key):
+        count = self._counts.get(key, 0) - 1
+        if count > 0:
+            self._counts[key] = count
+        else:
+            self._counts.pop(key, None)
+
+    def _iter_descendants(self, treeiter):
+        # Yields the iters below treeiter in a tree, depth first
+        model = self._model
+        stack = [model.iter_children(treeiter)]
+        while stack:
+            child = stack.pop()
+            if child is None:
+                continue
+            if model.get_value(child, COL_MODEL) is not _placeholder:
+                yield child
+            stack.append(model.iter_next(child))
+            stack.append(model.iter_children(child))
+
     def remove(self, instance, select=False):
         """Remove an instance from the list.
         If the instance is not in the list it returns False. Otherwise it
@@ -1608,26 +2448,40 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
           if there is one.
         """
 
-        objid = id(instance)
-        if not objid in self._iters:
+        key = self._get_key(instance)
+        if not key in self._iters:
             raise ValueError("instance %r is not in the list" % instance)
 
 
         if select:
             prev = self.get_previous(instance)
-            rv = self._remove(objid)
+            rv = self._remove(key)
             if prev != instance:
                 self.select(prev)
         else:
-            rv = self._remove(objid)
+            rv = self._remove(key)
         return rv
 
     def update(self, instance):
-        objid = id(instance)
-        if not objid in self._iters:
+        """
+        Refreshes the row of an instance. If the list contains another
+        instance with the same key, it will be replaced by instance.
+        @param instance: the instance
+        """
+        key = self._get_key(instance)
+        if not key in self._iters:
             raise ValueError("instance %r is not in the list" % instance)
-        treeiter = self._iters[objid]
-        self._model.row_changed(self._model[treeiter].path, treeiter)
+        treeiter = self._iters[key]
+        self._discard_row_caches(key)
+        model = self._model
+        if model[treeiter][COL_MODEL] is not instance:
+            model.set(treeiter, COL_MODEL, instance)
+        else:
+            model.row_changed(model[treeiter].path, treeiter)
+        if self._sort_keys:
+            self._resort_row(treeiter)
+        if self._aggregates:
+            self._update_aggregates([(key, instance)], [key])
 
     def refresh(self, view_only=False):
         """
@@ -1636,10 +2490,13 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         @param view_only: if True, only force a refresh of the
             visible part of this objectlist's Treeview.
         """
+        self._discard_row_caches()
         if view_only:
             self._treeview.queue_draw()
         else:
             self._model.foreach(gtk.TreeModel.row_changed)
+        if self._aggregates:
+            self._update_aggregates(reset=True)
 
     def set_column_visibility(self, column_index, visibility):
         treeview_column = self._treeview.get_column(column_index)
@@ -1681,11 +2538,11 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         if selection.get_mode() == gtk.SELECTION_NONE:
             raise TypeError("Selection not allowed")
 
-        objid = id(instance)
-        if not objid in self._iters:
+        key = self._get_key(instance)
+        if not key in self._iters:
             raise ValueError("instance %s is not in the list" % repr(instance))
 
-        treeiter = self._iters[objid]
+        treeiter = self._iters[key]
 
         selection.select_iter(treeiter)
 
@@ -1711,7 +2568,9 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
 
         model, treeiter = selection.get_selected()
         if treeiter:
-            return model[treeiter][COL_MODEL]
+            instance = model[treeiter][COL_MODEL]
+            if instance is not _placeholder:
+                return instance
 
     def get_selected_rows(self):
         """Returns a list of currently selected objects
@@ -1730,19 +2589,48 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
                      'can be selected')
 
         model, paths = selection.get_selected_rows()
-        if paths:
-            return [model[path][COL_MODEL] for (path,) in paths]
-        return []
+        instances = [model[path][COL_MODEL] for path in paths]
+        return [instance for instance in instances
+                if instance is not _placeholder]
 
-    def add_list(self, instances, clear=True):
+    def add_list(self, instances, clear=True, incremental=False,
+                 chunk_size=250):
         """
         Allows a list to be loaded, by default clearing it first.
         freeze() and thaw() are called internally to avoid flashing.
 
+        An incremental load adds the first chunk of instances right away
+        and the rest from an idle callback, so the main loop is not blocked
+        while loading large results. The load-progress signal is emitted
+        after each chunk and load-finished when all instances are added.
+        It can be cancelled by L{cancel_load}, and is cancelled
+        automatically if the list is loaded or cleared again.
+        Note that an incremental load which clears the list does not keep
+        the rows which are present in both the list and instances.
+
         @param instances: a list to be added
         @param clear: a boolean that specifies whether or not to
           clear the list
-        """
+        @param incremental: if True, load the instances in chunks
+        @param chunk_size: number of instances added at a time in an
+          incremental load
+        """
+        self.cancel_load()
+
+        if incremental:
+            if chunk_size < 1:
+                raise ValueError("chunk_size must be positive, not %r" % (
+                    chunk_size,))
+            self._check_writable()
+            if clear:
+                self.unselect_all()
+                self.clear()
+            self._load_count = 0
+            instances = iter(instances)
+            if self._load_chunk(instances, chunk_size):
+                self._load_source_id = gobject.idle_add(
+                    self._load_chunk, instances, chunk_size)
+            return
 
         self._treeview.freeze_notify()
 
@@ -1752,10 +2640,83 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
 
         return ret
 
+    def set_lazy_results(self, results, page_size=100, cache_size=10):
+        """
+        Displays results without copying them into the model, instances
+        are only fetched when the rows displaying them become visible.
+        This makes it possible to open lists of hundreds of thousands of
+        instances without loading them: only cache_size pages of instances
+        are kept in memory. Opening the list is still linear in the number
+        of rows though, the view walks all of them and the model keeps a
+        small row reference for each one.
+
+        The results can be any sequence or database result set which
+        can be sliced and supports len() or count().
+        A lazy list is read-only, it can only be cleared or replaced
+        by calling this method again. Lookups by instance, such as
+        L{select}, L{index} or the C{in} operator are not available either.
+        Columns are switched to fixed sizing and sorting is disabled.
+        Calling it again reuses the model of the list, with the new
+        page_size and cache_size.
+
+        @param results: a sequence or result set
+        @param page_size: number of instances fetched at a time
+        @param cache_size: maximum number of pages kept in memory
+        """
+        _check_lazy_sizes(page_size, cache_size)
+        self.cancel_load()
+        treeview = self._treeview
+        had_rows = bool(len(self._model))
+
+        model = self._model
+        is_lazy = isinstance(model, LazyObjectModel)
+        if not is_lazy:
+            model = LazyObjectModel()
+
+        self._discard_row_caches()
+        treeview.freeze_notify()
+        treeview.set_model(None)
+        if not is_lazy:
+            self._model = model
+            self._iters = {}
+            self._counts = {}
+            self._setup_lazy_view()
+        model.set_results(results, page_size, cache_size)
+
+        treeview.set_model(model)
+        treeview.thaw_notify()
+        # Lazy lists have no aggregates, the rows are not fetched
+        if self._aggregates:
+            self._update_aggregates(reset=True)
+
+        has_rows = bool(len(model))
+        if has_rows != had_rows:
+            self.emit('has-rows', has_rows)
+
+    def cancel_load(self):
+        """
+        Cancels an incremental load started by L{add_list}. The instances
+        which were already added are kept in the list.
+        @returns: True if a load was in progress, False otherwise
+        """
+        if self._load_source_id is None:
+            return False
+        gobject.source_remove(self._load_source_id)
+        self._load_source_id = None
+        return True
+
     def clear(self):
         """Removes all the instances of the list"""
+        self.cancel_load()
+        self._discard_row_caches()
+        if isinstance(self._model, LazyObjectModel):
+            self.set_lazy_results([])
+            return
         self._model.clear()
         self._iters = {}
+        self._counts = {}
+        if self._aggregates:
+            self._update_aggregates(reset=True)
 
     def get_next(self, instance):
         """
@@ -1766,11 +2727,11 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         @param instance: the instance
         """
 
-        objid = id(instance)
-        if not objid in self._iters:
+        key = self._get_key(instance)
+        if not key in self._iters:
             raise ValueError("instance %r is not in the list" % instance)
 
-        treeiter = self._iters[objid]
+        treeiter = self._iters[key]
 
         model = self._model
         pos = model[treeiter].path[0]
@@ -1789,10 +2750,10 @@ class ObjectList(PropertyObject, gtk.ScrolledWindow):
         @param instance: the instance
         """
 
-        objid = id(instance)
-        if not objid in self._iters:
+        key = self._get_key(instance)
+        if not key in self._iters:
             raise ValueError("instance %r is not in the list" % instance)
-        treeiter = self._iters[objid]
+        treeiter = self._iters[key]
 
         model = self._model
         pos = model[treeiter].path[0]
@@ -1891,31 +2852,82 @@ class ObjectTree(ObjectList):
     gsignal('row-expanded', object)
 
     def __init__(self, columns=[], objects=None, mode=gtk.SELECTION_BROWSE,
-                 sortable=False, model=None):
+                 sortable=False, model=None, key=None):
         if not model:
             model = gtk.TreeStore(object)
-        ObjectList.__init__(self, columns, objects, mode, sortable, model)
+        self._children_loader = None
+        self._has_children = None
+        # Mapping of instance key -> tasklet loading its children
+        self._loading_children = {}
+        ObjectList.__init__(self, columns, objects, mode, sortable, model,
+                            key)
         self.get_treeview().connect('row-expanded', self._on_treeview__row_expanded)
+        # The placeholder rows of children being loaded can not be selected
+        self.get_treeview().get_selection().set_select_function(
+            self._is_selectable)
+
+    def _is_selectable(self, path):
+        return self._model[path][COL_MODEL] is not _placeholder
+
+    def _load(self, instances, clear):
+        ObjectList._load(self, instances, clear)
+        if self._children_loader is None:
+            return
+        model = self._model
+        for row in model:
+            if not model.iter_has_child(row.iter):
+                self._add_placeholder(row.iter)
 
-    def _append_internal(self, parent, instance, select, prepend):
+    def _add_placeholder(self, treeiter, has_children=None):
+        if self._children_loader is None:
+            return
+        if has_children is None and self._has_children is not None:
+            has_children = self._has_children(
+                self._model.get_value(treeiter, COL_MODEL))
+        if has_children or has_children is None:
+            self._model.append(treeiter, (_placeholder,))
+
+    def _remove_placeholder(self, treeiter):
+        # Returns True if the children of the row were not loaded yet
+        model = self._model
+        child = model.iter_children(treeiter)
+        if (child is None or
+            model.get_value(child, COL_MODEL) is not _placeholder):
+            return False
+        model.remove(child)
+        return True
+
+    def _append_internal(self, parent, instance, select, prepend,
+                         has_children=None):
         iters = self._iters
-        parent_id = id(parent)
-        if parent_id in iters:
-            parent_iter = iters[parent_id]
-        elif parent is None:
+        if parent is None:
             parent_iter = None
         else:
-            raise TypeError("parent must be an Object, ObjectRow or None")
+            parent_key = self._get_key(parent)
+            if not parent_key in iters:
+                raise TypeError("parent must be an Object, ObjectRow or None")
+            parent_iter = iters[parent_key]
+            # Adding a child to a row means its children are loaded
+            self._remove_placeholder(parent_iter)
 
         # Freeze and save original selection mode to avoid blinking
         self._treeview.freeze_notify()
 
-        if prepend:
+        if self._sort_keys:
+            row_iter = self._model.insert(
+                parent_iter, self._get_sort_position(instance, parent_iter),
+                (instance,))
+        elif prepend:
             row_iter = self._model.prepend(parent_iter, (instance,))
         else:
             row_iter = self._model.append(parent_iter, (instance,))
 
-        self._iters[id(instance)] = row_iter
+        key = self._get_key(instance)
+        self._iters[key] = row_iter
+        self._counts[key] = self._counts.get(key, 0) + 1
+        self._add_placeholder(row_iter, has_children)
+        if self._aggregates:
+            self._update_aggregates([(key, instance)])
 
         if self._autosize:
             self._treeview.columns_autosize()
@@ -1926,25 +2938,211 @@ class ObjectTree(ObjectList):
 
         return instance
 
-    def append(self, parent, instance, select=False):
+    def append(self, parent, instance, select=False, has_children=None):
         """
         Append the selected row in an instance.
         @param parent: Object or None, representing the parent
         @param instance: the instance to be added
         @param select: select the row
+        @param has_children: if the children of the instance are loaded
+          when it is expanded, see L{set_children_loader}
         @returns: the appended object
         """
-        return self._append_internal(parent, instance, select, prepend=False)
+        return self._append_internal(parent, instance, select,
+                                     prepend=False, has_children=has_children)
 
-    def prepend(self, parent, instance, select=False):
+    def prepend(self, parent, instance, select=False, has_children=None):
         """
         Prepend the selected row in an instance.
         @param parent: Object or None, representing the parent
         @param instance: the instance to be added
         @param select: select the row
+        @param has_children: if the children of the instance are loaded
+          when it is expanded, see L{set_children_loader}
         @returns: the prepended object
         """
-        return self._append_internal(parent, instance, select, prepend=True)
+        return self._append_internal(parent, instance, select,
+                                     prepend=True, has_children=has_children)
+
+    def set_children_loader(self, children_loader, has_children=None):
+        """
+        Makes the tree load the children of a row when it is expanded
+        for the first time, instead of requiring the whole hierarchy to
+        be added upfront.
+
+        children_loader is called with the instance of the row and
+        returns its children, or a L{kiwi.tasklet.Tasklet} returning
+        them to load them asynchronously. It can also add the children
+        itself, using L{append}, and return None.
+
+        Rows added afterwards by L{append}, L{prepend}, L{add_list} or
+        by children_loader can be expanded if has_children returns
+        True for their instance, or if it is None. Rows added by
+        L{add_tree} are considered complete.
+
+        @param children_loader: a callable taking an instance, or None
+          to stop loading children
+        @param has_children: a callable taking an instance or None
+        """
+        if children_loader is not None and not callable(children_loader):
+            raise TypeError("children_loader must be a callable, not %r" % (
+                children_loader,))
+        if has_children is not None and not callable(has_children):
+            raise TypeError("has_children must be a callable, not %r" % (
+                has_children,))
+        self._children_loader = children_loader
+        self._has_children = has_children
+
+    def _load_children(self, treeiter):
+        model = self._model
+        child = model.iter_children(treeiter)
+        if (child is None or
+            model.get_value(child, COL_MODEL) is not _placeholder):
+            return
+        instance = model.get_value(treeiter, COL_MODEL)
+        key = self._get_key(instance)
+        if key in self._loading_children:
+            return
+
+        children = self._children_loader(instance)
+        if isinstance(children, tasklet.Tasklet):
+            if children.state != tasklet.Tasklet.STATE_ZOMBIE:
+                self._loading_children[key] = children
+                children.add_join_callback(
+                    self._on_children_loader__finished, key)
+                return
+            children = children.return_value
+        self._add_children(treeiter, children)
+
+    def _add_children(self, treeiter, children):
+        model = self._model
+        iters = self._iters
+        counts = self._counts
+        get_key = self._get_key
+        # The loader may have appended the children itself
+        if not self._remove_placeholder(treeiter) or children is None:
+            return
+        self._treeview.freeze_notify()
+        added = []
+        for instance in children:
+            key = get_key(instance)
+            row_iter = model.append(treeiter, (instance,))
+            iters[key] = row_iter
+            counts[key] = counts.get(key, 0) + 1
+            self._add_placeholder(row_iter)
+            added.append((key, instance))
+        if self._sort_keys:
+            self._sort(treeiter)
+        self._treeview.thaw_notify()
+        if self._aggregates:
+            self._update_aggregates(added)
+
+    def add_tree(self, instances, parent_of, clear=True):
+        """
+        Adds a hierarchy of instances to the tree in one go. This is a
+        lot faster than appending them one by one, the model is
+        detached from the view while the rows are inserted.
+
+        The instances can be in any order, parents are always inserted
+        before their children. Siblings are inserted in the order they
+        have in instances.
+
+        Example::
+
+          tree.add_tree(accounts, parent_of='parent_account')
+
+        @param instances: a sequence of instances
+        @param parent_of: how to find the parent of an instance, the name
+          of an attribute or a callable taking an instance. The parent
+          must be None, for the top level rows, an instance of instances
+          or, if clear is False, an instance already in the tree.
+        @param clear: if True, the tree is cleared first
+        """
+        if isinstance(parent_of, basestring):
+            getter = compile_getter(parent_of)
+            parent_of = lambda instance: getter(instance, None)
+        elif not callable(parent_of):
+            raise TypeError(
+                "parent_of must be an attribute name or a callable, not %r" % (
+                parent_of,))
+
+        self._check_writable()
+        self.cancel_load()
+
+        get_key = self._get_key
+        if clear:
+            existing = {}
+        else:
+            existing = self._iters
+        instances = list(instances)
+        keys = set([get_key(instance) for instance in instances])
+
+        # Group the instances by parent
+        top_level = []
+        children = {}
+        for instance in instances:
+            parent = parent_of(instance)
+            if parent is None:
+                top_level.append(instance)
+                continue
+            parent_key = get_key(parent)
+            if not parent_key in keys and not parent_key in existing:
+                raise ValueError("The parent %r of %r is not in the tree" % (
+                    parent, instance))
+            children.setdefault(parent_key, []).append(instance)
+
+        # Order the instances so parents come before their children,
+        # starting with the top level and the rows already in the tree
+        ordered = []
+        pending = [(_marker, top_level)]
+        for parent_key in children.keys():
+            if parent_key in existing and not parent_key in keys:
+                pending.append((parent_key, children.pop(parent_key)))
+        while pending:
+            parent_key, level = pending.pop()
+            for instance in level:
+                ordered.append((parent_key, instance))
+                key = get_key(instance)
+                if key in children:
+                    pending.append((key, children.pop(key)))
+        if len(ordered) < len(instances):
+            raise ValueError("The parents of %d instances form a cycle" % (
+                len(instances) - len(ordered)))
+
+        if clear:
+            self.unselect_all()
+            self.clear()
+
+        model = self._model
+        iters = self._iters
+        counts = self._counts
+        treeview = self._treeview
+        treeview.freeze_notify()
+        treeview.set_model(None)
+        try:
+            for parent_key, instance in ordered:
+                if parent_key is _marker:
+                    parent_iter = None
+                else:
+                    parent_iter = iters[parent_key]
+                key = get_key(instance)
+                iters[key] = model.append(parent_iter, (instance,))
+                counts[key] = counts.get(key, 0) + 1
+
+            if self._sort_keys:
+                self._sort()
+        finally:
+            treeview.set_model(model)
+            treeview.thaw_notify()
+
+        if self._aggregates:
+            self._update_aggregates(
+                [(get_key(instance), instance)
+                 for (parent_key, instance) in ordered])
+
+        if self._autosize:
+            treeview.columns_autosize()
+            self._autosize = False
 
     def expand(self, instance, open_all=True):
         """
@@ -1954,10 +3152,10 @@ class ObjectTree(ObjectList):
         @param open_all: If True, expand all rows, otherwise just the
         immediate children
         """
-        objid = id(instance)
-        if not objid in self._iters:
+        key = self._get_key(instance)
+        if not key in self._iters:
             raise ValueError("instance %r is not in the list" % instance)
-        treeiter = self._iters[objid]
+        treeiter = self._iters[key]
 
         self.get_treeview().expand_row(
             self._model[treeiter].path, open_all)
@@ -1968,10 +3166,10 @@ class ObjectTree(ObjectList):
         (hides its child rows, if they exist).
         @param instance: an instance to collapse
         """
-        objid = id(instance)
-        if not objid in self._iters:
+        key = self._get_key(instance)
+        if not key in self._iters:
             raise ValueError("instance %r is not in the list" % instance)
-        treeiter = self._iters[objid]
+        treeiter = self._iters[key]
 
         self.get_treeview().collapse_row(
             self._model[treeiter].path)
@@ -1982,17 +3180,17 @@ class ObjectTree(ObjectList):
         the instance is the root, then returns the given instance.
         @param instance: an instance which we want the root object
         """
-        objid = id(instance)
-        if not objid in self._iters:
+        key = self._get_key(instance)
+        if not key in self._iters:
             raise ValueError("instance %r is not in the list" % instance)
 
-        instance_iter = self._iters[objid]
-        if self._model.iter_depth(instance_iter) == 0:
-            return self._model[instance_iter][COL_MODEL]
-
-        for iter in self._iters.values():
-            if self._model.is_ancestor(iter, instance_iter):
-                return self.get_root(self._model[iter][COL_MODEL])
+        model = self._model
+        treeiter = self._iters[key]
+        parent = model.iter_parent(treeiter)
+        while parent is not None:
+            treeiter = parent
+            parent = model.iter_parent(treeiter)
+        return model.get_value(treeiter, COL_MODEL)
 
     def get_descendants(self, root_instance):
         """
@@ -2001,22 +3199,264 @@ class ObjectTree(ObjectList):
         @param root_instance: an instance which we want the descendants
         @returns: a sequence of descendants objects
         """
-        objid = id(root_instance)
-        if not objid in self._iters:
+        key = self._get_key(root_instance)
+        if not key in self._iters:
             raise ValueError("instance %r is not in the list" % root_instance)
 
-        root_instance_iter = self._iters[objid]
-        children = []
-        for iter in self._iters.values():
-            if self._model.is_ancestor(root_instance_iter, iter):
-                children.append(self._model[iter][COL_MODEL])
-        return children
+        model = self._model
+        return [model.get_value(treeiter, COL_MODEL)
+                for treeiter in self._iter_descendants(self._iters[key])]
 
     def _on_treeview__row_expanded(self, treeview, treeiter, treepath):
+        if self._children_loader is not None:
+            self._load_children(treeiter)
         self.emit('row-expanded', self.get_model()[treeiter][COL_MODEL])
 
+    def _on_children_loader__finished(self, task, children, key):
+        del self._loading_children[key]
+        # The row may have been removed while loading
+        treeiter = self._iters.get(key)
+        if treeiter is not None:
+            self._add_children(treeiter, children)
+
 type_register(ObjectTree)
 
+class _AggregateValues(object):
+    def __init__(self):
+        self.sum = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+        # False if min or max were removed and must be calculated again
+        self.exact = True
+
+    def add(self, value):
+        self.sum += value
+        self.count += 1
+        if self.exact:
+            if self.count == 1 or value < self.min:
+                self.min = value
+            if self.count == 1 or value > self.max:
+                self.max = value
+
+    def remove(self, value):
+        self.count -= 1
+        if not self.count:
+            self.__init__()
+            return
+        self.sum -= value
+        if value == self.min or value == self.max:
+            self.exact = False
+
+
+class Aggregate(gobject.GObject):
+    """I keep the sum, count, minimum, maximum and average of an attribute
+    of the instances of an L{ObjectList}, optionally for groups of them.
+
+    Instead of going through all the rows each time a value is needed,
+    they are updated as rows are added, removed and edited, or when
+    L{ObjectList.update} is called for an instance. The values of an
+    attribute must be numbers, None values are ignored. In an
+    L{ObjectTree} the rows of all the levels are included.
+
+    Example::
+
+      aggregate = Aggregate(klist, 'price', group_by='category')
+      total = aggregate.get_sum()
+      subtotal = aggregate.get_sum(group=books)
+
+    Signals
+    =======
+      - B{changed} (aggregate):
+        - Emitted when the values changed
+
+    @ivar attribute: the attribute
+    """
+
+    gsignal('changed')
+
+    def __init__(self, klist, attribute, group_by=None):
+        """
+        @param klist: list to follow
+        @type klist: L{ObjectList}
+        @param attribute: name of the attribute to aggregate
+        @param group_by: the name of an attribute or a callable taking an
+          instance which return the group of the instance, or None
+        """
+        gobject.GObject.__init__(self)
+        if not isinstance(klist, ObjectList):
+            raise TypeError("list must be a kiwi list and not %r" %
+                            type(klist).__name__)
+        if isinstance(group_by, basestring):
+            getter = compile_getter(group_by)
+            group_by = lambda instance: getter(instance, None)
+        elif group_by is not None and not callable(group_by):
+            raise TypeError(
+                "group_by must be an attribute name or a callable, not %r" % (
+                group_by,))
+
+        self.attribute = attribute
+        self._klist = klist
+        self._group_by = group_by
+        self._reset()
+        klist._aggregates.append(self)
+        self._update(reset=True)
+
+    # Public API
+
+    def get_sum(self, group=_marker):
+        """
+        @param group: a group, if not given the sum of all the rows is
+          returned
+        @returns: the sum of the values, 0 if there are none
+        """
+        return self._get_values(group).sum
+
+    def get_count(self, group=_marker):
+        """
+        @param group: a group, if not given all the rows are counted
+        @returns: the number of values which are not None
+        """
+        return self._get_values(group).count
+
+    def get_min(self, group=_marker):
+        """
+        @param group: a group, if not given all the rows are used
+        @returns: the smallest value or None if there are no values
+        """
+        return self._get_exact_values(group).min
+
+    def get_max(self, group=_marker):
+        """
+        @param group: a group, if not given all the rows are used
+        @returns: the largest value or None if there are no values
+        """
+        return self._get_exact_values(group).max
+
+    def get_average(self, group=_marker):
+        """
+        @param group: a group, if not given all the rows are used
+        @returns: the average of the values or None if there are no values
+        """
+        values = self._get_values(group)
+        if not values.count:
+            return None
+        if isinstance(values.sum, (int, long)):
+            return values.sum / float(values.count)
+        return values.sum / values.count
+
+    def get_groups(self):
+        """
+        @returns: the groups which have values
+        """
+        return self._groups.keys()
+
+    def destroy(self):
+        """
+        Stops following the list
+        """
+        if self in self._klist._aggregates:
+            self._klist._aggregates.remove(self)
+
+    # Private
+
+    def _reset(self):
+        # Mapping of instance key -> (group, value, copies) of the rows,
+        # an instance can be added to the list more than once
+        self._rows = {}
+        self._total = _AggregateValues()
+        self._groups = {}
+
+    def _get_values(self, group):
+        if group is _marker:
+            return self._total
+        values = self._groups.get(group)
+        if values is None:
+            values = _AggregateValues()
+        return values
+
+    def _get_exact_values(self, group):
+        values = self._get_values(group)
+        if not values.exact:
+            # The minimum or the maximum was removed
+            rows = [value for (row_group, value, copies) in self._rows.values()
+                    if value is not None and
+                       (group is _marker or row_group == group)]
+            values.min = min(rows)
+            values.max = max(rows)
+            values.exact = True
+        return values
+
+    def _remove_value(self, group, value):
+        if value is None:
+            return
+        self._total.remove(value)
+        if self._group_by is not None:
+            values = self._groups[group]
+            values.remove(value)
+            if not values.count:
+                del self._groups[group]
+
+    def _add_value(self, group, value):
+        if value is None:
+            return
+        self._total.add(value)
+        if self._group_by is not None:
+            values = self._groups.get(group)
+            if values is None:
+                values = self._groups[group] = _AggregateValues()
+            values.add(value)
+
+    def _remove_row(self, key):
+        # Removes one copy of the row
+        row = self._rows.get(key)
+        if row is None:
+            return
+        group, value, copies = row
+        if copies > 1:
+            self._rows[key] = group, value, copies - 1
+        else:
+            del self._rows[key]
+        self._remove_value(group, value)
+
+    def _add_row(self, key, instance, value):
+        # Adds one copy of the row, the other copies are the same
+        # instance, so their value is replaced too
+        group = None
+        if self._group_by is not None:
+            group = self._group_by(instance)
+        copies = 0
+        row = self._rows.get(key)
+        if row is not None:
+            old_group, old_value, copies = row
+            for i in range(copies):
+                self._remove_value(old_group, old_value)
+        self._rows[key] = group, value, copies + 1
+        for i in range(copies + 1):
+            self._add_value(group, value)
+
+    def _update(self, added=(), removed=(), reset=False):
+        # Called by the list when rows are added, removed or replaced
+        if reset:
+            self._reset()
+            added = self._klist._get_rows()
+        for key in removed:
+            self._remove_row(key)
+        if added:
+            # Fetch all the values at once, it is a lot faster for
+            # the whole list. They are fetched like the column of the
+            # attribute does, if there is one, so they match what it shows
+            try:
+                column = self._klist.get_column_by_name(self.attribute)
+            except LookupError:
+                column = Column
+            values = _get_attribute_values(
+                column, [instance for key, instance in added], self.attribute)
+            for (key, instance), value in zip(added, values):
+                self._add_row(key, instance, value)
+        self.emit('changed')
+
+
 class ListLabel(gtk.HBox):
     """I am a subclass of a GtkHBox which you can use if you want
     to vertically align a label with a column
@@ -2135,31 +3575,74 @@ class SummaryLabel(ListLabel):
     """I am a subclass of ListLabel which you can use if you want
     to summarize all the values of a specific column.
     Please note that I only know how to handle number column
-    data types and I will complain if you give me something else."""
+    data types and I will complain if you give me something else.
+
+    The value is kept up to date by an L{Aggregate} as the rows of the
+    list change, without going through all of them. Several labels can
+    share a grouped aggregate to show subtotals, eg in a footer.
+    """
 
     def __init__(self, klist, column, label=_('Total:'), value_format='%s',
-                 font_desc=None):
+                 font_desc=None, function='sum', aggregate=None,
+                 group=_marker):
+        """
+        @param function: one of 'sum', 'count', 'min', 'max' and 'average'
+        @param aggregate: an L{Aggregate} of the attribute of the column
+          or None to create one
+        @param group: if given, only the rows of this group of aggregate
+          are summarized
+        """
         ListLabel.__init__(self, klist, column, label, value_format, font_desc)
         if not issubclass(self._column.data_type, number):
             raise TypeError("data_type of column must be a number, not %r",
                             self._column.data_type)
-        klist.connect('cell-edited', self._on_klist__cell_edited)
-        self.update_total()
+        if not function in ('sum', 'count', 'min', 'max', 'average'):
+            raise ValueError("Invalid function: %r" % (function,))
+        if aggregate is None:
+            aggregate = Aggregate(klist, self._column.attribute)
+            self.connect('destroy', self._on_destroy)
+        elif aggregate.attribute != self._column.attribute:
+            raise ValueError("aggregate must be of the attribute %s, not %s" %
+                             (self._column.attribute, aggregate.attribute))
+        self._aggregate = aggregate
+        self._get_value = getattr(aggregate, 'get_' + function)
+        self._function = function
+        self._group = group
+        self._aggregate_id = aggregate.connect('changed',
+                                               self._on_aggregate__changed)
+        self._update_value()
 
     # Public API
 
     def update_total(self):
-        """Recalculate the total value of all columns"""
-        column = self._column
-        attr = column.attribute
-        get_attribute = column.get_attribute
+        """Recalculate the total value of all columns.
+        This is only needed if instances were modified without calling
+        L{ObjectList.update} for them.
+        """
+        self._aggregate._update(reset=True)
 
-        value = sum([get_attribute(obj, attr, 0) or 0 for obj in self._klist],
-                    column.data_type('0'))
+    def get_aggregate(self):
+        """
+        @returns: the L{Aggregate} used by the label
+        """
+        return self._aggregate
 
-        self.set_value(column.as_string(value))
+    # Private
+
+    def _update_value(self):
+        value = self._get_value(self._group)
+        if self._function == 'count':
+            self.set_value(str(value))
+            return
+        if self._function == 'sum':
+            value = self._column.data_type('0') + value
+        self.set_value(self._column.as_string(value))
 
     # Callbacks
 
-    def _on_klist__cell_edited(self, klist, object, attribute):
-        self.update_total()
+    def _on_aggregate__changed(self, aggregate):
+        self._update_value()
+
+    def _on_destroy(self, label):
+        self._aggregate.disconnect(self._aggregate_id)
+        self._aggregate.destroy()
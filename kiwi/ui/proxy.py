@@ -32,7 +32,7 @@ import gobject
 import gtk
 
 from kiwi import ValueUnset
-from kiwi.accessor import kgetattr, ksetattr, clear_attr_cache
+from kiwi.accessor import compile_getter, ksetattr
 from kiwi.datatypes import converter
 from kiwi.decorators import deprecated
 from kiwi.interfaces import IProxyWidget, IValidatableProxyWidget
@@ -102,7 +102,7 @@ class Proxy:
         else:
             # if we have a model, grab its value to update the widgets
             self._register_proxy_in_model(attribute)
-            value = kgetattr(self._model, attribute, ValueUnset)
+            value = compile_getter(attribute)(self._model, ValueUnset)
 
         self.update(attribute, value, block=True)
 
@@ -288,7 +288,7 @@ class Proxy:
                 # can help it.
                 value = ValueUnset
             else:
-                value = kgetattr(self._model, attribute, ValueUnset)
+                value = compile_getter(attribute)(self._model, ValueUnset)
 
         widget = self._model_attributes.get(attribute, None)
 
@@ -341,12 +341,6 @@ class Proxy:
                 raise TypeError("model has wrong type %s, expected %s"
                                 % (type(model), type(self._model)))
 
-        # the following isn't strictly necessary, but it currently works
-        # around a bug with reused ids in the attribute cache and also
-        # makes a lot of sense for most applications (don't want a huge
-        # eternal cache pointing to models that you're not using anyway)
-        clear_attr_cache()
-
         # unregister previous proxy
         self._unregister_proxy_in_model()
 
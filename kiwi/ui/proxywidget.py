@@ -94,6 +94,8 @@ class ProxyWidgetMixin(object):
     # To be able to call the as/from_string without setting the data_type
     # property and still receiving a good warning.
     _converter = None
+    # The function used by _as_string, see _get_formatter
+    _formatter = None
 
     def __init__(self):
         if not type(self.allowed_data_types) == tuple:
@@ -120,11 +122,13 @@ class ProxyWidgetMixin(object):
         # A type object will always be returned
         data_type = converter.check_supported(data_type)
         self._converter = converter.get_converter(data_type)
+        self._formatter = None
         return self._converter.type.__name__
 
     # Public API
     def set_data_format(self, format):
         self._data_format = format
+        self._formatter = None
 
     def set_options_for_datatype(self, datatype, **options):
         """Set some options to be passed to the datatype converter.
@@ -139,6 +143,7 @@ class ProxyWidgetMixin(object):
             raise ValueError
 
         self._converter_options[datatype] = options
+        self._formatter = None
 
     def read(self):
         """Get the content of the widget.
@@ -161,12 +166,24 @@ class ProxyWidgetMixin(object):
         """Convert a value to a string
         @param data: data to convert
         """
+        formatter = self._formatter
+        if formatter is None:
+            formatter = self._formatter = self._get_formatter()
+        return formatter(data)
+
+    def _get_formatter(self):
+        # Looked up once, until the data type, the format or the
+        # options of the widget change
         conv = self._converter
         if conv is None:
             conv = converter.get_converter(str)
 
-        return conv.as_string(data, format=self._data_format,
-                              **self._converter_options.get(conv.type,{}))
+        format = self._data_format
+        options = self._converter_options.get(conv.type)
+        if options:
+            return lambda data: conv.as_string(data, format=format,
+                                               **options)
+        return converter.get_formatter(conv.type, format)
 
     def _from_string(self, data):
         """Convert a string to the data type of the widget
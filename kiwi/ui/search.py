@@ -28,7 +28,9 @@ Search related widgets
 import datetime
 from decimal import Decimal
 import gettext
+import itertools
 import sys
+import threading
 
 import gobject
 import gtk
@@ -50,10 +52,21 @@ from kiwi.utils import gsignal, gproperty
 _ = lambda m: gettext.dgettext('kiwi', m)
 
 
+_threads_initialized = False
+
+def _init_threads():
+    # Must be called before any search thread is started, only once
+    global _threads_initialized
+    if not _threads_initialized:
+        gobject.threads_init()
+        _threads_initialized = True
+
+
 #
 # Date Search Options
 #
 
+
 class DateSearchOption(object):
     """
     Base class for Date search options
@@ -885,8 +898,76 @@ class SearchFilterButton(gtk.Button):
 
 
 class SearchResults(ObjectList):
+    """
+    The result list of a L{SearchContainer}.
+    When a pager is set, the next page of results is fetched when
+    the list is scrolled close to its end.
+    """
     def __init__(self, columns):
         ObjectList.__init__(self, columns)
+        self._pager = None
+        self._sort_handler = None
+        vadjustment = self.get_vadjustment()
+        vadjustment.connect('changed', self._on_vadjustment__changed)
+        vadjustment.connect('value-changed', self._on_vadjustment__changed)
+
+    def set_pager(self, pager):
+        """
+        Sets the pager used to fetch more results as the list is scrolled,
+        the rows which are already in the list are kept.
+        @param pager: a L{kiwi.db.query.QueryPager} or None
+        """
+        self._pager = pager
+
+    def get_pager(self):
+        """
+        @returns: the L{kiwi.db.query.QueryPager} or None
+        """
+        return self._pager
+
+    def set_sort_handler(self, handler):
+        """
+        Sets a handler which is called when the header of a column is
+        clicked. It is called with the attribute of the column and
+        the sort order and should return True if it sorted the results,
+        eg by searching again with a different order, or False to let the
+        list sort the rows itself.
+        @param handler: a callable or None
+        """
+        if handler is not None and not callable(handler):
+            raise TypeError("handler must be callable")
+        self._sort_handler = handler
+
+    def fetch_next_page(self):
+        """
+        Fetches the next page of results from the pager and adds
+        them to the list.
+        @returns: True if more results were added
+        """
+        if self._pager is None:
+            return False
+        page = self._pager.fetch_next_page()
+        if not page:
+            return False
+        self.extend(page)
+        return True
+
+    def _sort_by_column(self, column, treeview_column, order):
+        if self._sort_handler is not None:
+            # Only update the sort indicator, so the rows stay in the
+            # order the handler puts them in
+            self._set_sort([], treeview_column, order)
+            if self._sort_handler(column.attribute, order):
+                return
+        ObjectList._sort_by_column(self, column, treeview_column, order)
+
+    def _on_vadjustment__changed(self, adjustment):
+        if self._pager is None or not self._pager.has_more():
+            return
+        # Fetch when less than a screen of rows is left below the
+        # visible ones
+        if adjustment.value + adjustment.page_size * 2 >= adjustment.upper:
+            self.fetch_next_page()
 
 
 class SearchContainer(gtk.VBox):
@@ -900,9 +981,30 @@ class SearchContainer(gtk.VBox):
     Additionally you can add a number of search filters to the SearchContainer.
     You can chose if you want to add the filter in the top-left corner
     of bottom, see L{SearchFilterPosition}
+
+    Signals
+    =======
+      - B{search-started} (container):
+        - Emitted when a search starts
+      - B{search-finished} (container):
+        - Emitted when all the results of a search are in the results
+          list. It is not emitted for searches which are cancelled.
+      - B{result-count} (container, count):
+        - Emitted when the total number of results of a search is known,
+          including the ones left out because of the search limit.
+          For synchronous searches which reached the limit the results
+          are only counted when L{get_result_count} is called.
+      - B{search-failed} (container, exception):
+        - Emitted when an asynchronous search raised an exception, the
+          result list is cleared. The exception is raised again
+          afterwards, in the main loop.
     """
     __gtype_name__ = 'SearchContainer'
     gproperty('filter-label', str)
+    gsignal('search-started')
+    gsignal('search-finished')
+    gsignal('result-count', object)
+    gsignal('search-failed', object)
 
     def __init__(self, columns=None, chars=25):
         """
@@ -916,6 +1018,19 @@ class SearchContainer(gtk.VBox):
         self._query_executer = None
         self._auto_search = True
         self._summary_label = None
+        self._async_search = False
+        self._auto_search_delay = 0
+        self._auto_search_id = None
+        # The states of the last search, to skip identical auto searches
+        self._last_states = None
+        self._search_chunk_size = 100
+        self._page_size = None
+        self._result_count = None
+        # States of the last search, if its results were not counted yet
+        self._count_states = None
+        # Incremented for each search, results of older ones are ignored
+        self._search_id = 0
+        self._searching = False
 
         search_filter = StringSearchFilter(_('Search:'), chars=chars)
         search_filter.connect('changed', self._on_search_filter__changed)
@@ -1054,6 +1169,7 @@ class SearchContainer(gtk.VBox):
             raise TypeError("querty_executer must be a QueryExecuter instance")
 
         self._query_executer = querty_executer
+        self._last_states = None
 
     def get_query_executer(self):
         """
@@ -1076,16 +1192,133 @@ class SearchContainer(gtk.VBox):
         """
         Starts a search.
         Fetches the states of all filters and send it to a query executer and
-        finally puts the result in the result class
+        finally puts the result in the result class.
+
+        If asynchronous searches are enabled this returns immediately,
+        see L{set_async_search}. A search which is still running is
+        cancelled.
         """
         if not self._query_executer:
             raise ValueError("A query executer needs to be set at this point")
-        states = [(sf.get_state()) for sf in self._search_filters]
-        results = self._query_executer.search(states)
-        self.results.clear()
-        self.results.extend(results)
-        if self._summary_label:
-            self._summary_label.update_total()
+        self._cancel_auto_search()
+        states = self._get_states()
+        self.cancel_search()
+        self._last_states = states
+        self._result_count = None
+        self._count_states = None
+        self.results.set_pager(None)
+        self.emit('search-started')
+        executer = self._query_executer
+        if self._page_size:
+            pager = executer.search_pages(states, self._page_size)
+            self.results.add_list(pager.fetch_next_page())
+            self.results.set_pager(pager)
+            if pager.has_more():
+                self._set_result_count(pager.count())
+            else:
+                self._set_result_count(pager.get_offset())
+            self.emit('search-finished')
+            return
+
+        if not self._async_search:
+            results = executer.search(states)
+            # Merge the results, so rows which are still present are kept
+            # along with the selection
+            self.results.add_list(results)
+            if self._is_limited():
+                # Counting is another query, only do it when needed
+                self._count_states = states
+            else:
+                self._set_result_count(len(self.results))
+            self.emit('search-finished')
+            return
+
+        self._searching = True
+        _init_threads()
+        thread = threading.Thread(target=self._search_thread,
+                                  args=(self._search_id, executer, states,
+                                        self._search_chunk_size))
+        thread.setDaemon(True)
+        thread.start()
+
+    def cancel_search(self):
+        """
+        Cancels the asynchronous search which is running, its results
+        are discarded.
+        @returns: True if a search was cancelled
+        """
+        # Old threads notice it and stop fetching results
+        self._search_id += 1
+        if not self._searching:
+            return False
+        self._searching = False
+        return True
+
+    def is_searching(self):
+        """
+        @returns: True if an asynchronous search is running
+        """
+        return self._searching
+
+    def get_result_count(self):
+        """
+        Fetches the total number of results of the last search, including
+        the ones left out because of the search limit or which are
+        in pages not fetched yet.
+        @returns: the number of results or None if it is not known yet
+        """
+        if self._count_states is not None:
+            states = self._count_states
+            self._count_states = None
+            self._set_result_count(self._query_executer.count(states))
+        return self._result_count
+
+    def has_more_results(self):
+        """
+        @returns: True if the last search matched more results than
+          there are in the result list
+        """
+        pager = self.results.get_pager()
+        if pager is not None:
+            return pager.has_more()
+        count = self.get_result_count()
+        if count is None:
+            return False
+        return count > len(self.results)
+
+    def set_async_search(self, async_search, chunk_size=100):
+        """
+        Enables/Disables asynchronous searches. The query is executed
+        and its results fetched in a separate thread, so the user
+        interface does not block during slow queries. The results are
+        added to the result list as they arrive, chunk_size at a time.
+
+        The query executer, and the database connection it uses, must
+        be usable from another thread.
+
+        @param async_search: True to enable, False to disable
+        @param chunk_size: number of results to add to the list at once
+        """
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive, not %d" % (
+                chunk_size,))
+        if async_search:
+            _init_threads()
+        self._async_search = async_search
+        self._search_chunk_size = chunk_size
+
+    def set_page_size(self, page_size):
+        """
+        Enables/Disables paged searches. A search only fetches the first
+        page_size results, the following pages are fetched as the result
+        list is scrolled, so the search limit of the query executer
+        does not apply. Paged searches are never asynchronous.
+        @param page_size: number of results in a page or None to disable
+        """
+        if page_size is not None and page_size < 1:
+            raise ValueError("page_size must be positive, not %d" % (
+                page_size,))
+        self._page_size = page_size
 
     def set_auto_search(self, auto_search):
         """
@@ -1094,6 +1327,20 @@ class SearchContainer(gtk.VBox):
         @param auto_search: True to enable, False to disable
         """
         self._auto_search = auto_search
+        if not auto_search:
+            self._cancel_auto_search()
+
+    def set_auto_search_delay(self, delay):
+        """
+        Sets how long an auto search waits after a filter changes.
+        All the changes done during that time, eg typing a word in the
+        search entry, result in a single search. The search is also
+        skipped if the filters are back to the state of the last search.
+        @param delay: delay in milliseconds, 0 to search immediately
+        """
+        if delay < 0:
+            raise ValueError("delay can not be negative, not %d" % (delay,))
+        self._auto_search_delay = delay
 
     def set_text_field_columns(self, columns):
         if self._primary_filter is None:
@@ -1130,6 +1377,7 @@ class SearchContainer(gtk.VBox):
 
         if self._summary_label:
             self._summary_label.parent.remove(self._summary_label)
+            self._summary_label.destroy()
         self._summary_label = SummaryLabel(klist=self.results,
                                            column=column,
                                            label=label,
@@ -1155,17 +1403,131 @@ class SearchContainer(gtk.VBox):
         self.remove_filter(filter)
 
     def _on_search_filter__changed(self, search_filter):
-        if self._auto_search:
-            self.search()
+        if not self._auto_search:
+            return
+        if not self._auto_search_delay:
+            self._auto_search_changed()
+            return
+        self._cancel_auto_search()
+        self._auto_search_id = gobject.timeout_add(
+            self._auto_search_delay, self._on_auto_search__timeout)
+
+    def _on_auto_search__timeout(self):
+        self._auto_search_id = None
+        self._auto_search_changed()
+        return False
+
+    def _on_search__results(self, search_id, chunk, first, finished,
+                            exc_info):
+        # Called in the main loop with the results of a search thread
+        if search_id != self._search_id:
+            return False
+        if first:
+            self.results.add_list(chunk)
+        else:
+            self.results.extend(chunk)
+        if finished:
+            self._searching = False
+            if exc_info:
+                # Do not leave the results of the previous search around
+                self.results.clear()
+                self._set_result_count(None)
+                self.emit('search-failed', exc_info[1])
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if self._result_count is None and not self._is_limited():
+                self._set_result_count(len(self.results))
+            self.emit('search-finished')
+        return False
+
+    def _on_search__count(self, search_id, count, exc_info):
+        # Called in the main loop with the result of a count thread
+        if search_id != self._search_id:
+            return False
+        if exc_info:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        if self._result_count is None:
+            self._set_result_count(count)
+        return False
 
     #
     # Private
     #
 
+    def _get_states(self):
+        return [(sf.get_state()) for sf in self._search_filters]
+
+    def _auto_search_changed(self):
+        if self._get_states() != self._last_states:
+            self.search()
+
+    def _sort_results(self, attribute, order):
+        # Let the database sort the results when the executer knows the
+        # columns of the attribute, the whole result set is sorted
+        # instead of only the rows within the search limit
+        executer = self._query_executer
+        if executer is None or not executer.can_sort_by(attribute):
+            return False
+        executer.set_order_by([(attribute, order == gtk.SORT_DESCENDING)])
+        self.search()
+        return True
+
+    def _is_limited(self):
+        # If the search limit may have left out some of the results
+        limit = self._query_executer.get_limit()
+        return limit is not None and len(self.results) >= limit
+
+    def _set_result_count(self, count):
+        self._result_count = count
+        self.emit('result-count', count)
+
+    def _cancel_auto_search(self):
+        if self._auto_search_id is not None:
+            gobject.source_remove(self._auto_search_id)
+            self._auto_search_id = None
+
+    def _search_thread(self, search_id, executer, states, chunk_size):
+        # Executes the query and fetches its results in a separate
+        # thread and passes them to the main loop a chunk at a time.
+        # Stops as soon as a newer search is started.
+        first = True
+        fetched = 0
+        try:
+            results = iter(executer.search(states))
+            while search_id == self._search_id:
+                chunk = list(itertools.islice(results, chunk_size))
+                fetched += len(chunk)
+                finished = len(chunk) < chunk_size
+                gobject.idle_add(self._on_search__results, search_id,
+                                 chunk, first, finished, None)
+                if finished:
+                    break
+                first = False
+        except:
+            gobject.idle_add(self._on_search__results, search_id,
+                             [], False, True, sys.exc_info())
+            return
+
+        # Count the results once they are fetched, in the same thread
+        # since the executer and its connection can not be used by two
+        # threads at once. It is only needed if the search limit left
+        # out some of them.
+        limit = executer.get_limit()
+        if (search_id != self._search_id or limit is None or
+            fetched < limit):
+            return
+        try:
+            count = executer.count(states)
+        except:
+            gobject.idle_add(self._on_search__count, search_id, None,
+                             sys.exc_info())
+        else:
+            gobject.idle_add(self._on_search__count, search_id, count, None)
+
     def _create_ui(self):
         self._create_basic_search()
 
         self.results = SearchResults(self._columns)
+        self.results.set_sort_handler(self._sort_results)
         self.pack_end(self.results, True, True, 6)
         self.results.show()
 
@@ -1343,6 +1705,30 @@ class SearchSlaveDelegate(SlaveDelegate):
         """
         self.search.search()
 
+    def set_auto_search_delay(self, delay):
+        """
+        See L{SearchContainer.set_auto_search_delay}
+        """
+        self.search.set_auto_search_delay(delay)
+
+    def set_async_search(self, async_search, chunk_size=100):
+        """
+        See L{SearchContainer.set_async_search}
+        """
+        self.search.set_async_search(async_search, chunk_size)
+
+    def cancel_search(self):
+        """
+        See L{SearchContainer.cancel_search}
+        """
+        return self.search.cancel_search()
+
+    def set_page_size(self, page_size):
+        """
+        See L{SearchContainer.set_page_size}
+        """
+        self.search.set_page_size(page_size)
+
     def clear(self):
         """
         Clears the result list
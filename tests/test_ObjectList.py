@@ -4,7 +4,10 @@ import unittest
 import gobject
 import gtk
 
-from kiwi.ui.objectlist import ObjectList, ObjectTree, Column
+from kiwi import tasklet
+from kiwi.ui.objectlist import ObjectList, ObjectTree, Column, \
+     Aggregate, SummaryLabel
+from kiwi.model import Model
 from kiwi.python import Settable
 
 from utils import refresh_gui
@@ -185,6 +188,21 @@ class TreeDataTests(unittest.TestCase):
         self.win.destroy()
         del self.win
 
+    def testCount(self):
+        root = Person('Big Kahuna', 7000)
+        child = Person('Craf Kahuna', 200)
+        self.tree.append(None, root)
+        self.tree.append(root, child)
+        # Only the top level rows are counted
+        self.assertEqual(self.tree.count(root), 1)
+        self.assertEqual(self.tree.count(child), 0)
+
+        tree = ObjectTree([Column('name')], key='name')
+        tree.append(None, root)
+        tree.append(root, child)
+        self.assertEqual(tree.count(Person('Big Kahuna', 1)), 1)
+        self.assertEqual(tree.count(Person('Craf Kahuna', 1)), 0)
+
     def testGetRoot(self):
         root = Person('Big Kahuna', 7000)
         child1 = Person('Craf Kahuna', 200)
@@ -218,6 +236,152 @@ class TreeDataTests(unittest.TestCase):
         test_descendants = self.tree.get_descendants(child2)
         self.assertEqual(test_descendants, [])
 
+    def testRemoveParent(self):
+        root = Person('Big Kahuna', 7000)
+        child = Person('Craf Kahuna', 200)
+        self.tree.append(None, root)
+        self.tree.append(root, child)
+
+        self.tree.remove(root)
+        self.failIf(child in self.tree)
+        self.assertEqual(self.tree.count(child), 0)
+
+    def testMergeKeepsChildren(self):
+        root = Person('Big Kahuna', 7000)
+        child = Person('Craf Kahuna', 200)
+        self.tree.append(None, root)
+        self.tree.append(root, child)
+
+        self.tree.add_list([Person('Other Kahuna', 20), root])
+        self.failUnless(child in self.tree)
+        self.assertEqual(self.tree.get_root(child), root)
+
+    def testMergeChildToRoot(self):
+        root = Person('Big Kahuna', 7000)
+        child = Person('Craf Kahuna', 200)
+        grandchild = Person('Sorcerer Kahuna', 150)
+        self.tree.append(None, root)
+        self.tree.append(root, child)
+        self.tree.append(child, grandchild)
+
+        self.tree.add_list([child, root])
+        self.assertEqual(list(self.tree), [child, root])
+        self.assertEqual(self.tree.get_root(child), child)
+        self.failIf(grandchild in self.tree)
+        self.assertEqual(self.tree.get_model().iter_n_children(
+            self.tree._iters[id(root)]), 0)
+
+    def testAddTree(self):
+        root = Settable(name='root', parent=None)
+        child1 = Settable(name='child1', parent=root)
+        child2 = Settable(name='child2', parent=root)
+        grandchild = Settable(name='grandchild', parent=child2)
+        self.tree.add_tree([grandchild, child1, root, child2], 'parent')
+
+        model = self.tree.get_model()
+        self.assertEqual(len(model), 1)
+        self.assertEqual([row[0] for row in model[0].iterchildren()],
+                         [child1, child2])
+        self.assertEqual(self.tree.get_root(grandchild), root)
+        self.assertEqual(self.tree.get_descendants(child2), [grandchild])
+
+        other = Settable(name='other', parent=child1)
+        self.tree.add_tree([other], lambda item: item.parent, clear=False)
+        self.assertEqual(self.tree.get_descendants(child1), [other])
+
+    def testAddTreeErrors(self):
+        self.assertRaises(TypeError, self.tree.add_tree, [], None)
+        orphan = Settable(name='orphan', parent=Settable(name='missing'))
+        self.assertRaises(ValueError, self.tree.add_tree, [orphan], 'parent')
+
+        item1 = Settable(name='item1')
+        item2 = Settable(name='item2', parent=item1)
+        item1.parent = item2
+        self.assertRaises(ValueError, self.tree.add_tree, [item1, item2],
+                          'parent')
+
+class LazyTreeTests(unittest.TestCase):
+    def setUp(self):
+        self.tree = ObjectTree([Column('name')])
+        self.loaded = []
+        self.root = Settable(name='root')
+
+    def _load_children(self, instance):
+        self.loaded.append(instance)
+        return [Settable(name=instance.name + str(i)) for i in range(3)]
+
+    def _load_children_later(self, instance):
+        yield tasklet.WaitForIdle()
+        tasklet.get_event()
+        raise StopIteration(self._load_children(instance))
+
+    def testLoadOnExpand(self):
+        self.tree.set_children_loader(self._load_children)
+        self.tree.append(None, self.root)
+        self.assertEqual(self.tree.get_descendants(self.root), [])
+        self.failIf(self.loaded)
+
+        self.tree.expand(self.root, open_all=False)
+        self.assertEqual(self.loaded, [self.root])
+        names = [child.name for child in
+                 self.tree.get_descendants(self.root)]
+        self.assertEqual(names, ['root0', 'root1', 'root2'])
+
+        self.tree.collapse(self.root)
+        self.tree.expand(self.root, open_all=False)
+        self.assertEqual(self.loaded, [self.root])
+
+    def testHasChildren(self):
+        self.tree.set_children_loader(self._load_children,
+                                      lambda instance: False)
+        self.tree.add_list([self.root])
+        model = self.tree.get_model()
+        self.failIf(model.iter_has_child(model[0].iter))
+
+        self.tree.append(None, Settable(name='other'), has_children=True)
+        self.failUnless(model.iter_has_child(model[1].iter))
+
+    def testAsync(self):
+        self.tree.set_children_loader(
+            lambda instance: tasklet.Tasklet(
+            self._load_children_later(instance)))
+        self.tree.append(None, self.root)
+        self.tree.expand(self.root, open_all=False)
+        self.assertEqual(self.tree.get_descendants(self.root), [])
+
+        refresh_gui()
+        self.assertEqual(len(self.tree.get_descendants(self.root)), 3)
+
+    def testSelectPlaceholder(self):
+        self.tree.set_children_loader(
+            lambda instance: tasklet.Tasklet(
+            self._load_children_later(instance)))
+        self.tree.append(None, self.root)
+        self.tree.expand(self.root, open_all=False)
+        activated = []
+        self.tree.connect('row-activated',
+                          lambda tree, instance: activated.append(instance))
+
+        treeview = self.tree.get_treeview()
+        treeview.get_selection().select_path((0, 0))
+        self.assertEqual(self.tree.get_selected(), None)
+        treeview.row_activated((0, 0), treeview.get_column(0))
+        self.assertEqual(activated, [])
+
+        self.tree.set_selection_mode(gtk.SELECTION_MULTIPLE)
+        treeview.get_selection().select_all()
+        self.assertEqual(self.tree.get_selected_rows(), [self.root])
+
+        refresh_gui()
+        treeview.get_selection().select_path((0, 0))
+        self.assertEqual(self.tree.get_selected_rows(),
+                         [self.root, self.tree.get_descendants(self.root)[0]])
+
+    def testInvalidArguments(self):
+        self.assertRaises(TypeError, self.tree.set_children_loader, 1)
+        self.assertRaises(TypeError, self.tree.set_children_loader,
+                          self._load_children, 1)
+
 class TestSignals(unittest.TestCase):
     def setUp(self):
         self.klist = ObjectList()
@@ -337,6 +501,14 @@ class MethodTest(unittest.TestCase):
         self.klist.clear()
         self.assertEqual(self.klist.count(item), 0)
 
+    def testCountEquality(self):
+        class Equal(Person):
+            def __eq__(self, other):
+                return self.name == other.name
+        self.klist.append(Equal('Johan', 30))
+        self.klist.append(Equal('Johan', 40))
+        self.assertEqual(self.klist.count(Equal('Johan', 24)), 2)
+
     def testPop(self):
         self.assertRaises(NotImplementedError, self.klist.pop, None)
 
@@ -400,6 +572,495 @@ class MethodTest(unittest.TestCase):
         self.assertEqual(self.klist[1].name, 'three')
         self.assertEqual(self.klist[2].name, 'one')
 
+class _SlicedResults:
+    """A result set which only supports count() and slicing, like the
+    ones returned by SQLObject and Storm"""
+    def __init__(self, items):
+        self.items = items
+        self.slices = []
+
+    def count(self):
+        return len(self.items)
+
+    def __getitem__(self, arg):
+        self.slices.append((arg.start, arg.stop))
+        return self.items[arg]
+
+class LazyTests(unittest.TestCase):
+    def setUp(self):
+        self.klist = ObjectList([Column('name')])
+        self.items = [Settable(name=str(i)) for i in range(1000)]
+
+    def testLength(self):
+        results = _SlicedResults(self.items)
+        self.klist.set_lazy_results(results, page_size=10)
+        self.assertEqual(len(self.klist), 1000)
+        self.assertEqual(results.slices, [])
+
+    def testFetchPages(self):
+        results = _SlicedResults(self.items)
+        self.klist.set_lazy_results(results, page_size=10, cache_size=2)
+        self.assertEqual(self.klist[0], self.items[0])
+        self.assertEqual(self.klist[15], self.items[15])
+        self.assertEqual(self.klist[9], self.items[9])
+        self.assertEqual(results.slices, [(0, 10), (10, 20)])
+        self.assertEqual(self.klist[995], self.items[995])
+        self.assertEqual(self.klist[5], self.items[5])
+        self.assertEqual(self.klist[15], self.items[15])
+        self.assertEqual(results.slices, [(0, 10), (10, 20), (990, 1000),
+                                          (10, 20)])
+
+    def testIterOutlivesPage(self):
+        self.klist.set_lazy_results(self.items, page_size=10, cache_size=2)
+        model = self.klist.get_model()
+        treeiter = model.get_iter((5,))
+        for path in [(15,), (25,), (35,)]:
+            model.get_iter(path)
+        self.assertEqual(model.get_value(treeiter, 0), self.items[5])
+        self.assertEqual(model.get_path(treeiter), (5,))
+
+    def testSetAgain(self):
+        self.klist.set_lazy_results(self.items, page_size=10)
+        results = _SlicedResults(self.items)
+        self.klist.set_lazy_results(results, page_size=20)
+        self.assertEqual(self.klist[25], self.items[25])
+        self.assertEqual(results.slices, [(20, 40)])
+
+    def testReadOnly(self):
+        self.klist.set_lazy_results(self.items)
+        self.assertRaises(TypeError, self.klist.append, Settable(name='x'))
+        self.assertRaises(TypeError, self.klist.add_list, self.items)
+
+    def testClear(self):
+        self.klist.set_lazy_results(self.items)
+        self.klist.clear()
+        self.assertEqual(len(self.klist), 0)
+        self.assertEqual(list(self.klist), [])
+
+    def testHasRows(self):
+        rows = []
+        self.klist.connect('has-rows', lambda klist, value: rows.append(value))
+        self.klist.set_lazy_results(self.items)
+        self.klist.set_lazy_results(self.items[:10])
+        self.klist.set_lazy_results([])
+        self.assertEqual(rows, [True, False])
+
+    def testInvalidArguments(self):
+        self.assertRaises(ValueError, self.klist.set_lazy_results,
+                          self.items, page_size=0)
+        self.assertRaises(ValueError, self.klist.set_lazy_results,
+                          self.items, cache_size=1)
+
+class MergeTests(unittest.TestCase):
+    def setUp(self):
+        self.klist = ObjectList([Column('name')])
+        self.items = [Settable(name=str(i)) for i in range(10)]
+        self.klist.add_list(self.items)
+        self.model = self.klist.get_model()
+
+    def testKeepRows(self):
+        first_iter = self.klist._iters[id(self.items[0])]
+        self.klist.add_list(self.items[:5])
+        self.assertEqual(list(self.klist), self.items[:5])
+        self.assertEqual(self.model.get_path(first_iter), (0,))
+
+    def testInsert(self):
+        new = [Settable(name='new%d' % i) for i in range(3)]
+        items = [new[0]] + self.items[:3] + [new[1]] + self.items[3:] + [new[2]]
+        self.klist.add_list(items)
+        self.assertEqual(list(self.klist), items)
+
+    def testMove(self):
+        items = self.items[:]
+        items.reverse()
+        del items[4]
+        items.insert(2, Settable(name='new'))
+        self.klist.add_list(items)
+        self.assertEqual(list(self.klist), items)
+
+    def testDuplicates(self):
+        self.klist.append(self.items[0])
+        self.klist.add_list(self.items[:2] + self.items[:2])
+        self.assertEqual(list(self.klist), self.items[:2])
+
+    def testKeepSelection(self):
+        self.klist.select(self.items[5])
+        self.klist.add_list(self.items[3:] + [Settable(name='new')])
+        self.assertEqual(self.klist.get_selected(), self.items[5])
+
+    def testSorted(self):
+        klist = ObjectList([Column('name', sorted=True)])
+        klist.add_list(self.items)
+        items = self.items[:]
+        items.reverse()
+        klist.add_list(items)
+        self.assertEqual(list(klist), self.items)
+
+class KeyTests(unittest.TestCase):
+    def setUp(self):
+        self.klist = ObjectList([Column('name')], key='id')
+        self.items = [Settable(id=i, name=str(i)) for i in range(5)]
+        self.klist.add_list(self.items)
+
+    def _fetch(self):
+        # The same rows, fetched again from the database
+        return [Settable(id=item.id, name=item.name) for item in self.items]
+
+    def testInvalidKey(self):
+        self.assertRaises(TypeError, ObjectList, key=1)
+
+    def testCallable(self):
+        klist = ObjectList([Column('name')], key=lambda item: item.id)
+        klist.add_list(self.items)
+        self.failUnless(self._fetch()[0] in klist)
+
+    def testContains(self):
+        self.failUnless(self._fetch()[2] in self.klist)
+        self.failIf(Settable(id=10, name='10') in self.klist)
+
+    def testMissingKey(self):
+        item = Settable(name='0')
+        self.failIf(item in self.klist)
+        self.assertRaises(ValueError, self.klist.select, item)
+        self.assertRaises(ValueError, self.klist.index, item)
+
+    def testMissingKeys(self):
+        first = Settable(name='a')
+        second = Settable(name='b')
+        self.klist.append(first)
+        self.klist.append(second)
+        self.assertEqual(len(self.klist), 7)
+        self.failUnless(first in self.klist)
+        self.failUnless(second in self.klist)
+        self.failIf(Settable(name='a') in self.klist)
+        self.klist.remove(first)
+        self.failIf(first in self.klist)
+        self.assertEqual(self.klist[-1], second)
+
+    def testMerge(self):
+        first_iter = self.klist._iters[0]
+        items = self._fetch()
+        self.klist.add_list(items)
+        self.assertEqual(list(self.klist), items)
+        self.assertEqual(self.klist.get_model().get_path(first_iter), (0,))
+
+    def testSelect(self):
+        self.klist.select(self._fetch()[3])
+        self.assertEqual(self.klist.get_selected(), self.items[3])
+
+    def testUpdate(self):
+        item = self._fetch()[1]
+        item.name = 'changed'
+        self.klist.update(item)
+        self.assertEqual(self.klist[1], item)
+
+    def testRemove(self):
+        self.klist.remove(self._fetch()[1])
+        self.assertEqual(list(self.klist), self.items[:1] + self.items[2:])
+
+class _Item(Model):
+    def __init__(self, name):
+        Model.__init__(self)
+        self.name = name
+
+class TextCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.formatted = []
+        self.column = Column('name', cache=True, format_func=self._format)
+        self.klist = ObjectList([self.column])
+        self.items = [_Item('a'), _Item('b')]
+        self.klist.add_list(self.items)
+
+    def _format(self, value):
+        self.formatted.append(value)
+        return value.upper()
+
+    def _get_text(self, item):
+        return self.klist._get_cell_text(item, self.column)
+
+    def testCache(self):
+        self.assertEqual(self._get_text(self.items[0]), 'A')
+        self.assertEqual(self._get_text(self.items[0]), 'A')
+        self.assertEqual(self.formatted, ['a'])
+
+    def testUpdate(self):
+        self._get_text(self.items[0])
+        self.items[0].__dict__['name'] = 'c'
+        self.assertEqual(self._get_text(self.items[0]), 'A')
+        self.klist.update(self.items[0])
+        self.assertEqual(self._get_text(self.items[0]), 'C')
+
+    def testRefresh(self):
+        self._get_text(self.items[1])
+        self.items[1].__dict__['name'] = 'c'
+        self.klist.refresh()
+        self.assertEqual(self._get_text(self.items[1]), 'C')
+
+    def testCellEdited(self):
+        self._get_text(self.items[0])
+        self.items[0].__dict__['name'] = 'c'
+        self.klist.emit('cell-edited', self.items[0], 'name')
+        self.assertEqual(self._get_text(self.items[0]), 'C')
+
+    def testNotifyProxies(self):
+        self._get_text(self.items[0])
+        self.items[0].name = 'c'
+        self.assertEqual(self._get_text(self.items[0]), 'C')
+
+    def testRemove(self):
+        self._get_text(self.items[0])
+        self.klist.remove(self.items[0])
+        self.assertEqual(self.klist._text_cache, {})
+        self.assertEqual(self.items[0]._v_proxies, {'name': []})
+
+    def testOtherProxies(self):
+        updated = []
+        class _Proxy:
+            def update(self, attribute, value=None, block=False):
+                updated.append(attribute)
+        item = self.items[0]
+        self._get_text(item)
+        item.register_proxy_for_attribute('name', _Proxy())
+        changed = []
+        self.klist.get_model().connect(
+            'row-changed', lambda model, path, treeiter: changed.append(path))
+        item.name = 'c'
+        self.assertEqual(updated, ['name'])
+        self.assertEqual(changed, [(0,)])
+        self.assertEqual(self._get_text(item), 'C')
+        item.name = 'd'
+        self.assertEqual(updated, ['name', 'name'])
+        self.assertEqual(self._get_text(item), 'D')
+
+class IncrementalLoadTests(unittest.TestCase):
+    def setUp(self):
+        self.klist = ObjectList([Column('name')])
+        self.klist.connect('load-progress', self._on_klist__load_progress)
+        self.klist.connect('load-finished', self._on_klist__load_finished)
+        self.items = [Settable(name=str(i)) for i in range(25)]
+        self.progress = []
+        self.finished = False
+
+    def _on_klist__load_progress(self, klist, count):
+        self.progress.append(count)
+
+    def _on_klist__load_finished(self, klist):
+        self.finished = True
+
+    def testFirstChunk(self):
+        self.klist.add_list(self.items, incremental=True, chunk_size=10)
+        self.assertEqual(list(self.klist), self.items[:10])
+        self.assertEqual(self.progress, [10])
+        self.failIf(self.finished)
+
+        refresh_gui()
+        self.assertEqual(list(self.klist), self.items)
+        self.assertEqual(self.progress, [10, 20, 25])
+        self.failUnless(self.finished)
+
+    def testClear(self):
+        self.klist.add_list(self.items)
+        self.klist.add_list(self.items[:5], incremental=True, chunk_size=10)
+        self.assertEqual(list(self.klist), self.items[:5])
+        self.failUnless(self.finished)
+
+    def testCancel(self):
+        self.klist.add_list(self.items, incremental=True, chunk_size=10)
+        self.failUnless(self.klist.cancel_load())
+        self.failIf(self.klist.cancel_load())
+        refresh_gui()
+        self.assertEqual(len(self.klist), 10)
+        self.failIf(self.finished)
+
+    def testSuperseded(self):
+        self.klist.add_list(self.items, incremental=True, chunk_size=10)
+        self.klist.add_list(self.items[:3])
+        refresh_gui()
+        self.assertEqual(list(self.klist), self.items[:3])
+
+class SortTests(unittest.TestCase):
+    def setUp(self):
+        self.klist = ObjectList([Column('name'), Column('age', data_type=int)],
+                                sortable=True)
+        self.klist.add_list(persons)
+
+    def _names(self):
+        return [person.name for person in self.klist]
+
+    def testSortByAttribute(self):
+        self.klist.sort_by_attribute('age')
+        self.assertEqual([person.age for person in self.klist],
+                         [21, 24, 25, 25, 26, 28])
+        self.klist.sort_by_attribute('age', gtk.SORT_DESCENDING)
+        self.assertEqual([person.age for person in self.klist],
+                         [28, 26, 25, 25, 24, 21])
+
+    def testStable(self):
+        self.klist.sort_by_attribute('age')
+        # Gustavo was before Salgado and is still before it
+        self.assertEqual(self._names(), ['Henrique', 'Johan', 'Gustavo',
+                                         'Salgado', 'Lorenzo', 'Kiko'])
+
+    def testSortByAttributes(self):
+        self.klist.sort_by_attributes(['age', 'name'], gtk.SORT_DESCENDING)
+        self.assertEqual(self._names(), ['Kiko', 'Lorenzo', 'Salgado',
+                                         'Gustavo', 'Johan', 'Henrique'])
+
+    def testHeaderClick(self):
+        column = self.klist.get_column_by_name('name')
+        treeview_column = self.klist.get_treeview_column(column)
+        treeview_column.clicked()
+        self.assertEqual(self._names(), sorted(self._names()))
+        self.failUnless(treeview_column.get_sort_indicator())
+        treeview_column.clicked()
+        self.assertEqual(treeview_column.get_sort_order(),
+                         gtk.SORT_DESCENDING)
+        names = sorted(self._names())
+        names.reverse()
+        self.assertEqual(self._names(), names)
+
+    def testInsertSorted(self):
+        self.klist.sort_by_attribute('name')
+        self.klist.append(Person('Adam', 30))
+        self.klist.insert(0, Person('Zed', 30))
+        self.klist.extend([Person('Carl', 30), Person('Ivan', 30)])
+        self.assertEqual(self._names(), sorted(self._names()))
+        self.assertEqual(self.klist[0].name, 'Adam')
+        self.assertEqual(self.klist[-1].name, 'Zed')
+
+    def testExtendSorted(self):
+        self.klist.sort_by_attribute('age', gtk.SORT_DESCENDING)
+        self.klist.extend([Person('Ana', 21), Person('Bia', 25),
+                           Person('Cid', 30)])
+        self.assertEqual(self._names(), ['Cid', 'Kiko', 'Lorenzo', 'Gustavo',
+                                         'Salgado', 'Bia', 'Johan',
+                                         'Henrique', 'Ana'])
+        self.klist.extend([Person('Dan', 21 + i) for i in range(10)])
+        ages = [person.age for person in self.klist]
+        self.assertEqual(ages, sorted(ages, reverse=True))
+
+    def testUpdate(self):
+        self.klist.sort_by_attribute('age')
+        person = self.klist[0]
+        person.age = 27
+        self.klist.update(person)
+        self.assertEqual(self.klist[-2], person)
+        person.age = 20
+        self.klist.update(person)
+        self.assertEqual(self.klist[0], person)
+
+    def testSortBy(self):
+        self.klist.sort_by([('age', gtk.SORT_ASCENDING),
+                            ('name', gtk.SORT_DESCENDING)])
+        self.assertEqual(self._names(), ['Henrique', 'Johan', 'Salgado',
+                                         'Gustavo', 'Lorenzo', 'Kiko'])
+        self.assertRaises(ValueError, self.klist.sort_by, [])
+
+    def testCachedValues(self):
+        self.klist.sort_by([('age', gtk.SORT_ASCENDING)])
+        person = self.klist[0]
+        person.age = 30
+        # Not updated, the cached value is used
+        self.klist.sort_by([('age', gtk.SORT_DESCENDING)])
+        self.assertEqual(self.klist[-1], person)
+        self.klist.update(person)
+        self.assertEqual(self.klist[0], person)
+
+    def testTree(self):
+        tree = ObjectTree([Column('name')])
+        parent = Person('Parent', 0)
+        tree.append(None, parent)
+        for person in persons:
+            tree.append(parent, person)
+        tree.sort_by_attribute('name')
+        model = tree.get_model()
+        names = [row[0].name for row in model[0].iterchildren()]
+        self.assertEqual(names, sorted(names))
+
+class AggregateTests(unittest.TestCase):
+    def setUp(self):
+        self.klist = ObjectList([Column('name'), Column('age', data_type=int)])
+        self.klist.add_list(persons)
+        self.aggregate = Aggregate(self.klist, 'age',
+                                   group_by=lambda person: person.age > 24)
+
+    def testValues(self):
+        aggregate = self.aggregate
+        self.assertEqual(aggregate.get_sum(), 149)
+        self.assertEqual(aggregate.get_count(), 6)
+        self.assertEqual(aggregate.get_min(), 21)
+        self.assertEqual(aggregate.get_max(), 28)
+        self.assertEqual(aggregate.get_sum(group=True), 104)
+        self.assertEqual(aggregate.get_sum(group=False), 45)
+        self.assertEqual(aggregate.get_average(group=False), 22.5)
+        groups = aggregate.get_groups()
+        groups.sort()
+        self.assertEqual(groups, [False, True])
+
+    def testColumnGetAttribute(self):
+        class DoubleColumn(Column):
+            def get_attribute(instance, attribute, *default):
+                return getattr(instance, attribute) * 2
+            get_attribute = staticmethod(get_attribute)
+        klist = ObjectList([DoubleColumn('age', data_type=int)])
+        klist.add_list(persons)
+        self.assertEqual(Aggregate(klist, 'age').get_sum(), 298)
+
+    def testChanges(self):
+        aggregate = self.aggregate
+        person = Person('Jiao', 30)
+        self.klist.append(person)
+        self.assertEqual(aggregate.get_sum(), 179)
+        self.assertEqual(aggregate.get_max(), 30)
+
+        person.age = 20
+        self.klist.update(person)
+        self.assertEqual(aggregate.get_sum(), 169)
+        self.assertEqual(aggregate.get_max(), 28)
+        self.assertEqual(aggregate.get_min(), 20)
+        self.assertEqual(aggregate.get_count(group=False), 3)
+
+        self.klist.remove(person)
+        self.assertEqual(aggregate.get_min(), 21)
+        self.assertEqual(aggregate.get_count(), 6)
+
+        self.klist.add_list(persons[:2])
+        self.assertEqual(aggregate.get_sum(), 49)
+        self.klist.clear()
+        self.assertEqual(aggregate.get_sum(), 0)
+        self.assertEqual(aggregate.get_min(), None)
+        self.assertEqual(aggregate.get_average(), None)
+
+    def testDuplicates(self):
+        aggregate = self.aggregate
+        person = Person('Jiao', 30)
+        self.klist.append(person)
+        self.klist.append(person)
+        self.assertEqual(aggregate.get_sum(), 209)
+        self.assertEqual(aggregate.get_count(group=True), 6)
+
+        person.age = 20
+        self.klist.update(person)
+        self.assertEqual(aggregate.get_sum(), 189)
+        self.assertEqual(aggregate.get_count(group=False), 4)
+
+        self.klist.remove(person)
+        self.assertEqual(aggregate.get_sum(), 169)
+        self.assertEqual(aggregate.get_count(), 7)
+        self.assertEqual(aggregate.get_min(), 20)
+
+    def testSummaryLabel(self):
+        label = SummaryLabel(self.klist, 'age')
+        self.assertEqual(label.get_value_widget().get_text(), '149')
+        self.klist.append(Person('Jiao', 30))
+        self.assertEqual(label.get_value_widget().get_text(), '179')
+
+        label = SummaryLabel(self.klist, 'age', function='max',
+                             aggregate=self.aggregate, group=False)
+        self.assertEqual(label.get_value_widget().get_text(), '24')
+        self.assertRaises(ValueError, SummaryLabel, self.klist, 'age',
+                          function='median')
+
 class BooleanDataTests(unittest.TestCase):
     def setUp(self):
         self.list = ObjectList([Column('value', data_type=bool, radio=True,
@@ -0,0 +1,130 @@
+import unittest
+
+from kiwi.accessor import compile_getter, kgetattr, ksetattr, \
+     kgetattr_many, kgetattr_rows, clear_attr_cache
+
+
+class Address(object):
+    def __init__(self, city):
+        self.city = city
+
+
+class Client(object):
+    def __init__(self, name, address=None):
+        self.name = name
+        self.address = address
+
+
+class OldClient:
+    def __init__(self, name):
+        self._name = name
+
+    def get_name(self):
+        return self._name
+
+    def set_name(self, name):
+        self._name = name
+
+
+class TestCompileGetter(unittest.TestCase):
+    def testAttribute(self):
+        getter = compile_getter('name')
+        self.assertEqual(getter(Client('John')), 'John')
+        self.assertEqual(getter(Client('Mary')), 'Mary')
+        self.failUnless(compile_getter('name') is getter)
+
+    def testGetMethod(self):
+        self.assertEqual(compile_getter('name')(OldClient('John')), 'John')
+
+    def testPath(self):
+        getter = compile_getter('address.city')
+        client = Client('John', Address('Recife'))
+        self.assertEqual(getter(client), 'Recife')
+        self.assertEqual(getter(client), kgetattr(client, 'address.city'))
+
+    def testDefault(self):
+        getter = compile_getter('address.city')
+        self.assertEqual(getter(Client('John'), None), None)
+        self.assertRaises(AttributeError, getter, Client('John'))
+        self.assertRaises(AttributeError, compile_getter('age'),
+                          Client('John'))
+        self.assertEqual(compile_getter('age')(Client('John'), 10), 10)
+
+
+class TestAttrCache(unittest.TestCase):
+    def testGetSet(self):
+        client = Client('John', Address('Recife'))
+        ksetattr(client, 'address.city', 'Natal')
+        self.assertEqual(kgetattr(client, 'address.city'), 'Natal')
+        self.assertEqual(kgetattr(client, 'age', 10), 10)
+        self.assertRaises(AttributeError, kgetattr, client, 'age')
+
+    def testMethods(self):
+        client = OldClient('John')
+        ksetattr(client, 'name', 'Mary')
+        self.assertEqual(client._name, 'Mary')
+        self.assertEqual(kgetattr(client, 'name'), 'Mary')
+        # The accessor is cached per class and not per instance
+        self.assertEqual(kgetattr(OldClient('Paul'), 'name'), 'Paul')
+
+    def testCustomGetter(self):
+        class Model(object):
+            def __init__(self, name):
+                self.name = name
+            def get_getter(self, attr_name, cache):
+                if self.name == 'John':
+                    return lambda: 'custom'
+                return (self, attr_name)
+        self.assertEqual(kgetattr(Model('John'), 'name'), 'custom')
+        self.assertEqual(kgetattr(Model('Mary'), 'name'), 'Mary')
+        self.assertEqual(kgetattr(Model('John'), 'name'), 'custom')
+
+    def testClearClass(self):
+        class Model(object):
+            pass
+        model = Model()
+        model.name = 'John'
+        self.assertEqual(kgetattr(model, 'name'), 'John')
+        self.assertEqual(compile_getter('name')(model), 'John')
+        Model.get_name = lambda self: self.name.upper()
+        clear_attr_cache(Model)
+        self.assertEqual(kgetattr(model, 'name'), 'JOHN')
+        self.assertEqual(compile_getter('name')(model), 'JOHN')
+
+
+class TestGetAttrMany(unittest.TestCase):
+    def setUp(self):
+        self.clients = [Client('John', Address('Recife')),
+                        OldClient('Mary'),
+                        Client('Paul', Address('Natal'))]
+
+    def testMany(self):
+        self.assertEqual(kgetattr_many(self.clients, 'name'),
+                         ['John', 'Mary', 'Paul'])
+        self.assertEqual(kgetattr_many(iter(self.clients), 'name'),
+                         ['John', 'Mary', 'Paul'])
+        self.assertEqual(kgetattr_many([], 'name'), [])
+
+    def testPath(self):
+        self.assertRaises(AttributeError, kgetattr_many, self.clients,
+                          'address.city')
+        self.assertEqual(kgetattr_many(self.clients, 'address.city', None),
+                         ['Recife', None, 'Natal'])
+
+    def testTypecode(self):
+        clients = [Client(1.5), Client(2)]
+        values = kgetattr_many(clients, 'name', typecode='d')
+        self.assertEqual(values.typecode, 'd')
+        self.assertEqual(sum(values), 3.5)
+
+    def testRows(self):
+        self.assertEqual(kgetattr_rows(self.clients, ['name', 'address.city'],
+                                       None),
+                         [('John', 'Recife'), ('Mary', None),
+                          ('Paul', 'Natal')])
+        self.assertEqual(kgetattr_rows(self.clients, []), [(), (), ()])
+        self.assertEqual(kgetattr_rows([], ['name']), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,7 +7,8 @@ import sys
 from gtk import gdk
 
 from kiwi.datatypes import converter, ValidationError, ValueUnset, \
-     Decimal, BaseConverter
+     Decimal, BaseConverter, get_localeconv, locale_changed
+from kiwi import datatypes
 from kiwi.currency import currency
 from kiwi.environ import environ
 from kiwi.python import enum
@@ -19,7 +20,7 @@ proxywidget # pyflakes
 def set_locale(category, name):
     # set the date format to the spanish one
     try:
-        rv = locale.setlocale(category, name)
+        rv = datatypes.set_locale(category, name)
     except locale.Error:
         print 'skipping %s, locale not available' % name
         return False
@@ -54,6 +55,34 @@ class RegistryTest(unittest.TestCase):
         conv = converter.get_converter(object)
         self.assertTrue(conv in converters)
 
+    def testGetFormatter(self):
+        formatter = converter.get_formatter(int)
+        self.assertEqual(formatter(10), '10')
+        self.assertTrue(converter.get_formatter(int) is formatter)
+        self.assertEqual(converter.get_formatter(int, '%03d')(7), '007')
+        converter.add(FakeConverter)
+        self.assertFalse(converter.get_formatter(int) is formatter)
+        converter.remove(FakeConverter)
+
+class LocaleConvTest(unittest.TestCase):
+    def tearDown(self):
+        set_locale(locale.LC_ALL, 'C')
+
+    def testCache(self):
+        set_locale(locale.LC_ALL, 'C')
+        conv = get_localeconv()
+        self.assertEqual(conv['decimal_point'], '.')
+        self.assertTrue(get_localeconv() is conv)
+        locale_changed()
+        self.assertFalse(get_localeconv() is conv)
+
+    def testSetLocale(self):
+        conv = get_localeconv()
+        if not set_locale(locale.LC_NUMERIC, 'pt_BR'):
+            return
+        self.assertEqual(get_localeconv()['decimal_point'], ',')
+        self.assertFalse(get_localeconv() is conv)
+
 class BoolTest(unittest.TestCase):
     def setUp(self):
         self.conv = converter.get_converter(bool)
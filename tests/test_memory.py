@@ -0,0 +1,121 @@
+import datetime
+import unittest
+
+from kiwi.db.memory import InMemoryQueryExecuter
+from kiwi.db.query import QueryCache, NumberQueryState, \
+     NumberIntervalQueryState, StringQueryState, DateQueryState, \
+     DateIntervalQueryState
+from kiwi.python import Settable
+
+
+class TestInMemoryQueryExecuter(unittest.TestCase):
+    def setUp(self):
+        self.items = [
+            Settable(name='Apple pie', price=10,
+                     date=datetime.datetime(2008, 1, 1, 10, 30)),
+            Settable(name='Banana split', price=5,
+                     date=datetime.datetime(2008, 1, 2)),
+            Settable(name='Cherry pie', price=None,
+                     date=datetime.datetime(2008, 1, 3)),
+            Settable(name=None, price=20, date=None),
+            ]
+        self.executer = InMemoryQueryExecuter(self.items)
+        self.filter = object()
+
+    def _search(self, columns, state):
+        self.executer.set_filter_columns(self.filter, columns)
+        return self.executer.search([state])
+
+    def testNumber(self):
+        self.assertEqual(
+            self._search(['price'], NumberQueryState(self.filter, 5)),
+            [self.items[1]])
+
+    def testNumberInterval(self):
+        self.assertEqual(
+            self._search(['price'],
+                         NumberIntervalQueryState(self.filter, 6, None)),
+            [self.items[0], self.items[3]])
+
+    def testString(self):
+        self.assertEqual(
+            self._search(['name'], StringQueryState(self.filter, 'PIE')),
+            [self.items[0], self.items[2]])
+
+    def testStringShort(self):
+        self.assertEqual(
+            self._search(['name'], StringQueryState(self.filter, 'an')),
+            [self.items[1]])
+
+    def testStringUnicode(self):
+        item = Settable(name=u'Cr\xe8me br\xfbl\xe9e', price=None, date=None)
+        self.executer.set_items(self.items + [item])
+        self.assertEqual(
+            self._search(['name'], StringQueryState(self.filter,
+                                                    u'CR\xc8ME')),
+            [item])
+        self.assertEqual(
+            self.executer.search([StringQueryState(self.filter,
+                                                   'cr\xc3\xa8me')]),
+            [item])
+
+    def testStringNotContains(self):
+        self.assertEqual(
+            self._search(['name'],
+                         StringQueryState(self.filter, 'pie',
+                                          StringQueryState.NOT_CONTAINS)),
+            [self.items[1]])
+
+    def testDate(self):
+        self.assertEqual(
+            self._search(['date'],
+                         DateQueryState(self.filter, datetime.date(2008, 1, 1))),
+            [self.items[0]])
+
+    def testDateInterval(self):
+        self.assertEqual(
+            self._search(['date'],
+                         DateIntervalQueryState(self.filter,
+                                                datetime.date(2008, 1, 2),
+                                                datetime.date(2008, 1, 3))),
+            [self.items[1], self.items[2]])
+
+    def testSeveralColumns(self):
+        self.executer.set_filter_columns(self.filter, ['name'])
+        price_filter = object()
+        self.executer.set_filter_columns(price_filter, ['price'])
+        self.assertEqual(
+            self.executer.search(
+                [StringQueryState(self.filter, 'pie'),
+                 NumberIntervalQueryState(price_filter, 1, 10)]),
+            [self.items[0]])
+
+    def testNoRestriction(self):
+        self.assertEqual(
+            self._search(['name'], StringQueryState(self.filter, '')),
+            self.items)
+
+    def testQueryCallback(self):
+        self.executer.add_query_callback(
+            lambda states: lambda item: item.price == 20)
+        self.assertEqual(
+            self._search(['name'], StringQueryState(self.filter, '')),
+            [self.items[3]])
+
+    def testOrderBy(self):
+        self.executer.set_sort_columns('price', ['price'])
+        self.executer.set_order_by([('price', True)])
+        self.assertEqual(
+            self._search(['name'], StringQueryState(self.filter, '')),
+            [self.items[3], self.items[0], self.items[1], self.items[2]])
+
+    def testSetItems(self):
+        self.executer.set_cache(QueryCache())
+        state = NumberQueryState(self.filter, 5)
+        self.assertEqual(self._search(['price'], state), [self.items[1]])
+        self.executer.set_items(self.items[:1])
+        self.assertEqual(self.executer.search([state]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
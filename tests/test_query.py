@@ -0,0 +1,246 @@
+import time
+import unittest
+
+from kiwi.db.fulltext import PostgresFullText, SQLiteFullText, \
+     TrigramFullText
+from kiwi.db.query import QueryCache, QueryExecuter, QueryPager, \
+     NumberQueryState, StringQueryState, escape_like
+
+
+class _CountingQueryExecuter(QueryExecuter):
+    def __init__(self):
+        QueryExecuter.__init__(self)
+        self.executed = 0
+
+    def execute(self, states):
+        self.executed += 1
+        return [state.value for state in states]
+
+
+class TestQueryState(unittest.TestCase):
+    def testHash(self):
+        search_filter = object()
+        state1 = NumberQueryState(search_filter, 10)
+        state2 = NumberQueryState(search_filter, 10)
+        self.assertEqual(state1, state2)
+        self.assertEqual(hash(state1), hash(state2))
+        self.assertNotEqual(state1, NumberQueryState(search_filter, 11))
+        self.assertNotEqual(state1, NumberQueryState(object(), 10))
+        self.assertNotEqual(StringQueryState(search_filter, 'a'),
+                            StringQueryState(search_filter, 'a',
+                                             StringQueryState.NOT_CONTAINS))
+
+
+class TestQueryCache(unittest.TestCase):
+    def testLRU(self):
+        cache = QueryCache(size=2)
+        cache.set('a', [1])
+        cache.set('b', [2])
+        self.assertEqual(cache.get('a'), [1])
+        cache.set('c', [3])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), [1])
+        self.assertEqual(cache.get('c'), [3])
+
+    def testTTL(self):
+        cache = QueryCache(ttl=0.01)
+        cache.set('a', [1])
+        time.sleep(0.02)
+        self.assertEqual(cache.get('a', []), [])
+        self.assertEqual(len(cache), 0)
+
+    def testInvalidate(self):
+        table1, table2 = object(), object()
+        cache = QueryCache()
+        cache.set('a', [1], table1)
+        cache.set('b', [2], table2)
+        cache.invalidate(table1)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('b'), [2])
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+    def testExecuter(self):
+        executer = _CountingQueryExecuter()
+        search_filter = object()
+        self.assertEqual(
+            list(executer.search([NumberQueryState(search_filter, 1)])), [1])
+        self.assertEqual(
+            list(executer.search([NumberQueryState(search_filter, 1)])), [1])
+        self.assertEqual(executer.executed, 2)
+
+        executer.set_cache(QueryCache())
+        for value in [1, 2, 1, 2]:
+            results = executer.search([NumberQueryState(search_filter, value)])
+            self.assertEqual(results, [value])
+        self.assertEqual(executer.executed, 4)
+
+        executer.set_limit(10)
+        executer.search([NumberQueryState(search_filter, 1)])
+        self.assertEqual(executer.executed, 5)
+
+        executer.get_cache().invalidate(executer.table)
+        executer.search([NumberQueryState(search_filter, 1)])
+        self.assertEqual(executer.executed, 6)
+
+    def testCount(self):
+        executer = _CountingQueryExecuter()
+        executer.set_cache(QueryCache())
+        states = [NumberQueryState(object(), 1)]
+        executer.search(states)
+        self.assertEqual(executer.count(states), 1)
+        self.assertEqual(executer.count(states), 1)
+        self.assertEqual(executer.executed, 2)
+
+    def testUnhashableState(self):
+        executer = _CountingQueryExecuter()
+        executer.set_cache(QueryCache())
+        state = NumberQueryState(object(), [1])
+        self.assertEqual(list(executer.search([state])), [[1]])
+        self.assertEqual(list(executer.search([state])), [[1]])
+        self.assertEqual(executer.executed, 2)
+
+
+class _ColumnQueryExecuter(QueryExecuter):
+    def execute(self, states):
+        return self._build_queries(None, states)
+
+    def _construct_state_query(self, table, state, fields):
+        return [(field, state.value) for column, field in fields]
+
+
+class TestQueryExecuter(unittest.TestCase):
+    def testBuildQueries(self):
+        executer = _ColumnQueryExecuter()
+        filter1, filter2 = object(), object()
+        executer.set_filter_columns(filter1, ['a', 'b'])
+        self.assertEqual(executer.search([NumberQueryState(filter1, 1)]),
+                         [[('a', 1), ('b', 1)]])
+        self.assertRaises(ValueError, executer.search,
+                          [NumberQueryState(filter2, 1)])
+
+        executer.add_query_callback(lambda states: len(states))
+        self.assertEqual(executer.search([NumberQueryState(filter1, 1),
+                                          NumberQueryState(filter2, 2)]),
+                         [[('a', 1), ('b', 1)], 2])
+        self.assertEqual(executer.count([NumberQueryState(filter1, 1)]), 2)
+
+    def testFilterFields(self):
+        executer = _ColumnQueryExecuter()
+        executer._get_field = lambda table, column: (table, column)
+        search_filter = object()
+        executer.table = 'table1'
+        executer.set_filter_columns(search_filter, ['a'])
+        fields = executer._get_filter_fields(search_filter)
+        self.assertEqual(fields, [('a', ('table1', 'a'))])
+        self.failUnless(executer._get_filter_fields(search_filter) is fields)
+        executer.table = 'table2'
+        self.assertEqual(executer._get_filter_fields(search_filter),
+                         [('a', ('table2', 'a'))])
+
+    def testOrderBy(self):
+        executer = _ColumnQueryExecuter()
+        self.failIf(executer.can_sort_by('name'))
+        self.assertRaises(ValueError, executer.set_order_by, [('name', True)])
+        executer.set_sort_columns('name', ['first_name', 'last_name'])
+        executer.set_order_by([('name', True)])
+        self.assertEqual(executer.get_order_by(), [('name', True)])
+        self.assertEqual(executer._get_order_columns(),
+                         [('first_name', True), ('last_name', True)])
+
+
+class TestFullText(unittest.TestCase):
+    def testPostgres(self):
+        self.assertEqual(
+            PostgresFullText().get_clause('client', 'name', 'John  Doe'),
+            ('client.name_fti @@ CAST(? AS tsquery)', ('john & doe',)))
+        self.assertEqual(PostgresFullText().get_clause('client', 'name', ' '),
+                         None)
+
+    def testSQLite(self):
+        self.assertEqual(
+            SQLiteFullText().get_clause('client', 'name', 'John "D'),
+            ('client.id IN (SELECT rowid FROM client_fts '
+             'WHERE client_fts MATCH ?)',
+             ('name : "John" AND name : "\"\"D"',)))
+
+    def testTrigram(self):
+        self.assertEqual(TrigramFullText().get_clause('client', 'name', 'Jo'),
+                         ('client.name ILIKE ? ESCAPE ?', ('%Jo%', '\\')))
+        self.assertEqual(
+            TrigramFullText().get_clause('client', 'name', '50%_'),
+            ('client.name ILIKE ? ESCAPE ?', ('%50\\%\\_%', '\\')))
+
+    def testEscapeLike(self):
+        self.assertEqual(escape_like('a_b'), 'a\\_b')
+        self.assertEqual(escape_like('50%'), '50\\%')
+        self.assertEqual(escape_like('c:\\'), 'c:\\\\')
+        self.assertEqual(escape_like('a%', '!'), 'a!%')
+
+    def testExecuter(self):
+        executer = _ColumnQueryExecuter()
+        self.assertEqual(
+            executer._get_full_text_clause('name', 'client', 'name', 'a'),
+            None)
+        executer.set_full_text_strategy(TrigramFullText())
+        executer.set_full_text_strategy(PostgresFullText(), ['notes'])
+        self.assertEqual(
+            executer._get_full_text_clause('name', 'client', 'name', 'a'),
+            ('client.name ILIKE ? ESCAPE ?', ('%a%', '\\')))
+        self.assertEqual(
+            executer._get_full_text_clause('notes', 'client', 'notes', 'a'),
+            ('client.notes_fti @@ CAST(? AS tsquery)', ('a',)))
+        executer.set_full_text_strategy(None, ['notes'])
+        self.assertEqual(
+            executer._get_full_text_clause('notes', 'client', 'notes', 'a'),
+            None)
+
+    def testSQLAlchemy(self):
+        try:
+            from sqlalchemy import MetaData, Table, Column, Integer, String
+            from kiwi.db.sqlalch import SQLAlchemyQueryExecuter
+        except ImportError:
+            return
+
+        table = Table('client', MetaData(),
+                      Column('id', Integer, primary_key=True),
+                      Column('notes', String))
+        executer = SQLAlchemyQueryExecuter(None)
+        executer.set_full_text_strategy(PostgresFullText(), ['notes'])
+        clause = executer._parse_string_state(
+            StringQueryState(object(), 'john doe'), table.c.notes, 'notes')
+        compiled = clause.compile()
+        self.assertEqual(str(compiled),
+                         'client.notes_fti @@ CAST(:kiwi_text_0 AS tsquery)')
+        self.assertEqual(compiled.params, {'kiwi_text_0': 'john & doe'})
+
+
+class TestQueryPager(unittest.TestCase):
+    def testFetch(self):
+        pager = QueryPager(range(25), 10)
+        self.failUnless(pager.has_more())
+        self.assertEqual(pager.fetch_next_page(), range(10))
+        self.assertEqual(pager.fetch_next_page(), range(10, 20))
+        self.assertEqual(pager.get_offset(), 20)
+        self.assertEqual(pager.count(), 25)
+        self.failUnless(pager.has_more())
+        self.assertEqual(pager.fetch_next_page(), range(20, 25))
+        self.failIf(pager.has_more())
+        self.assertEqual(pager.fetch_next_page(), [])
+
+    def testExecuter(self):
+        executer = _CountingQueryExecuter()
+        executer.set_limit(1)
+        states = [NumberQueryState(object(), value) for value in range(3)]
+        self.assertEqual(list(executer.search(states)), [0])
+        pager = executer.search_pages(states, page_size=2)
+        self.assertEqual(pager.fetch_next_page(), [0, 1])
+        self.assertEqual(pager.fetch_next_page(), [2])
+        self.failIf(pager.has_more())
+
+        self.assertRaises(ValueError, QueryPager, [], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
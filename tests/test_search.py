@@ -1,7 +1,13 @@
 import datetime
+import time
 import unittest
 
-from kiwi.ui.search import LastWeek, LastMonth
+import gtk
+
+from kiwi.db.query import QueryExecuter
+from kiwi.python import Settable
+from kiwi.ui.objectlist import Column
+from kiwi.ui.search import LastWeek, LastMonth, SearchContainer
 
 
 class TestDateOptions(unittest.TestCase):
@@ -26,5 +32,176 @@ class TestDateOptions(unittest.TestCase):
             self.assertEqual(option.get_interval(), interval)
 
 
+class _ListQueryExecuter(QueryExecuter):
+    def __init__(self, results):
+        QueryExecuter.__init__(self)
+        self.results = results
+
+    def execute(self, states):
+        results = self.results[:]
+        for attribute, descending in reversed(self.get_order_by()):
+            results.sort(key=lambda item: getattr(item, attribute),
+                         reverse=descending)
+        return results
+
+
+class TestSearchContainer(unittest.TestCase):
+    def setUp(self):
+        self.items = [Settable(name=str(i)) for i in range(5)]
+        self.container = SearchContainer([Column('name')])
+        self.container.set_query_executer(_ListQueryExecuter(self.items))
+        self.container.connect('search-started', self._on_search_started)
+        self.container.connect('search-finished', self._on_search_finished)
+        self.events = []
+
+    def _on_search_started(self, container):
+        self.events.append('started')
+
+    def _on_search_finished(self, container):
+        self.events.append('finished')
+
+    def _wait(self):
+        timeout = time.time() + 5
+        while self.container.is_searching() and time.time() < timeout:
+            gtk.main_iteration_do(block=False)
+            time.sleep(0.01)
+
+    def testSearch(self):
+        self.container.search()
+        self.assertEqual(list(self.container.results), self.items)
+        self.assertEqual(self.events, ['started', 'finished'])
+
+    def testPagedSearch(self):
+        self.container.set_page_size(2)
+        self.container.search()
+        self.assertEqual(list(self.container.results), self.items[:2])
+        self.assertEqual(self.events, ['started', 'finished'])
+        self.failUnless(self.container.results.fetch_next_page())
+        self.assertEqual(list(self.container.results), self.items[:4])
+        self.failUnless(self.container.results.fetch_next_page())
+        self.failIf(self.container.results.fetch_next_page())
+        self.assertEqual(list(self.container.results), self.items)
+
+        self.container.set_page_size(None)
+        self.container.search()
+        self.assertEqual(self.container.results.get_pager(), None)
+
+    def testResultCount(self):
+        counts = []
+        self.container.connect('result-count',
+                               lambda container, count: counts.append(count))
+        self.container.get_query_executer().set_limit(3)
+        self.container.search()
+        self.assertEqual(len(self.container.results), 3)
+        self.assertEqual(self.container.get_result_count(), 5)
+        self.failUnless(self.container.has_more_results())
+
+        self.container.get_query_executer().set_limit(None)
+        self.container.search()
+        self.assertEqual(self.container.get_result_count(), 5)
+        self.failIf(self.container.has_more_results())
+        self.assertEqual(counts, [5, 5])
+
+    def testLazyResultCount(self):
+        executer = self.container.get_query_executer()
+        executer.set_limit(3)
+        counted = []
+        count = executer.count
+        executer.count = lambda states: counted.append(states) or count(states)
+        self.container.search()
+        self.assertEqual(counted, [])
+        self.assertEqual(self.container.get_result_count(), 5)
+        self.assertEqual(self.container.get_result_count(), 5)
+        self.assertEqual(len(counted), 1)
+
+    def testServerSort(self):
+        executer = self.container.get_query_executer()
+        executer.set_sort_columns('name', ['name'])
+        results = self.container.results
+        results.extend(self.items)
+        treeview_column = results.get_treeview_column(
+            results.get_column_by_name('name'))
+        treeview_column.clicked()
+        self.assertEqual(executer.get_order_by(), [('name', False)])
+        self.assertEqual(list(results), self.items)
+        treeview_column.clicked()
+        self.assertEqual(executer.get_order_by(), [('name', True)])
+        self.assertEqual(treeview_column.get_sort_order(),
+                         gtk.SORT_DESCENDING)
+        items = self.items[:]
+        items.reverse()
+        self.assertEqual(list(results), items)
+        self.assertEqual(self.events, ['started', 'finished'] * 2)
+
+    def testClientSort(self):
+        results = self.container.results
+        results.extend(self.items)
+        results.get_treeview_column(
+            results.get_column_by_name('name')).clicked()
+        self.assertEqual(self.container.get_query_executer().get_order_by(),
+                         [])
+        self.assertEqual(self.events, [])
+
+    def testSkipIdenticalAutoSearch(self):
+        search_filter = self.container.get_primary_filter()
+        search_filter.emit('changed')
+        search_filter.emit('changed')
+        self.assertEqual(self.events, ['started', 'finished'])
+
+        search_filter.entry.set_text('1')
+        search_filter.emit('changed')
+        self.assertEqual(len(self.events), 4)
+
+    def testAutoSearchDelay(self):
+        self.assertRaises(ValueError, self.container.set_auto_search_delay,
+                          -1)
+        self.container.set_auto_search_delay(10)
+        search_filter = self.container.get_primary_filter()
+        for text in ['a', 'ab', 'abc']:
+            search_filter.entry.set_text(text)
+            search_filter.emit('changed')
+        self.assertEqual(self.events, [])
+
+        time.sleep(0.05)
+        while gtk.events_pending():
+            gtk.main_iteration_do(block=False)
+        self.assertEqual(self.events, ['started', 'finished'])
+
+    def testAsyncSearch(self):
+        self.container.set_async_search(True, chunk_size=2)
+        self.container.search()
+        self._wait()
+        self.assertEqual(list(self.container.results), self.items)
+        self.assertEqual(self.events, ['started', 'finished'])
+
+    def testAsyncSearchFailed(self):
+        errors = []
+        self.container.connect('search-failed',
+                               lambda container, exc: errors.append(exc))
+        self.container.results.extend(self.items)
+        executer = self.container.get_query_executer()
+        def execute(states):
+            raise ValueError('broken')
+        executer.execute = execute
+        self.container.set_async_search(True)
+        self.container.search()
+        self._wait()
+        self.assertEqual(list(self.container.results), [])
+        self.assertEqual(len(errors), 1)
+        self.failUnless(isinstance(errors[0], ValueError))
+        self.assertEqual(self.events, ['started'])
+
+    def testCancel(self):
+        self.container.set_async_search(True)
+        self.container.search()
+        self.failUnless(self.container.cancel_search())
+        self.failIf(self.container.cancel_search())
+        time.sleep(0.1)
+        while gtk.events_pending():
+            gtk.main_iteration_do(block=False)
+        self.assertEqual(list(self.container.results), [])
+        self.assertEqual(self.events, ['started'])
+
+
 if __name__ == '__main__':
     unittest.main()